@@ -300,11 +300,58 @@ const getModelMetrics = async (req, res) => {
     }
 };
 
+/**
+ * Get the report of the latest pipeline run (per-stage timing, CPU, memory and row counts)
+ */
+const getRunReport = async (req, res) => {
+    try {
+        // Check if user has required permissions
+        if (req.user && req.user.rol !== 'admin') {
+            return res.status(403).json({ 
+                success: false, 
+                message: 'No tienes permisos para ver el reporte de ejecución' 
+            });
+        }
+        
+        // Reports are written next to the predictions as run_report_YYYYMMDD_HHMMSS.json
+        const resultsDir = path.join(__dirname, '..', '..', 'mlops', 'models', 'results');
+        const files = fs.existsSync(resultsDir)
+            ? fs.readdirSync(resultsDir)
+                .filter(file => file.startsWith('run_report_') && file.endsWith('.json'))
+                .sort((a, b) => a.localeCompare(b))
+                .reverse()
+            : [];
+        
+        if (files.length === 0) {
+            return res.status(404).json({
+                success: false,
+                message: 'No se encontraron reportes de ejecución'
+            });
+        }
+        
+        const report = JSON.parse(fs.readFileSync(path.join(resultsDir, files[0]), 'utf8'));
+        
+        return res.status(200).json({
+            success: true,
+            reportFile: files[0],
+            report
+        });
+    } catch (error) {
+        logger.error(`Error retrieving run report: ${error}`);
+        return res.status(500).json({
+            success: false,
+            message: 'Error al recuperar el reporte de ejecución',
+            error: error.message
+        });
+    }
+};
+
 module.exports = {
     runModelUpdate,
     getModelUpdateLogs,
     getNextScheduledUpdate,
     getModelStatus,
     toggleModelStatus,
-    getModelMetrics
+    getModelMetrics,
+    getRunReport
 };
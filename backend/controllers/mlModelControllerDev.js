@@ -206,11 +206,66 @@ const getModelMetrics = async (req, res) => {
     }
 };
 
+/**
+ * Get a mock run report
+ */
+const getRunReport = async (req, res) => {
+    try {
+        // Check if user has required permissions
+        if (req.user && req.user.rol !== 'admin') {
+            return res.status(403).json({ 
+                success: false, 
+                message: 'No tienes permisos para ver el reporte de ejecución' 
+            });
+        }
+        
+        const stageNames = ['fetch', 'sales', 'memo', 'features', 'model', 'evaluate', 'predictions', 'stock_minimums', 'write_back', 'save'];
+        let start = 0;
+        const stages = stageNames.map(name => {
+            const wallSeconds = parseFloat((0.1 + secureRandom() * 2).toFixed(3));
+            const stage = {
+                name,
+                state: 'completed',
+                start_seconds: parseFloat(start.toFixed(3)),
+                wall_seconds: wallSeconds,
+                cpu_seconds: parseFloat((wallSeconds * 0.9).toFixed(3)),
+                process_cpu_seconds: wallSeconds,
+                peak_rss_mb: 250,
+                peak_rss_delta_mb: parseFloat((secureRandom() * 20).toFixed(1)),
+                input_rows: {},
+                output_rows: {}
+            };
+            start += wallSeconds;
+            return stage;
+        });
+        const started = new Date(Date.now() - start * 1000);
+        
+        return res.status(200).json({
+            success: true,
+            reportFile: `run_report_dev_${started.toISOString().split('T')[0]}.json`,
+            report: {
+                run_id: null,
+                started: started.toISOString(),
+                finished: new Date().toISOString(),
+                success: true,
+                failed_stages: [],
+                wall_seconds: parseFloat(start.toFixed(3)),
+                peak_rss_mb: 250,
+                stages
+            }
+        });
+    } catch (error) {
+        logger.error(`Error retrieving mock run report: ${error}`);
+        return res.status(500).json({ success: false, message: 'Error al recuperar el reporte de ejecución (dev)', error: error.message });
+    }
+};
+
 module.exports = {
     runModelUpdate,
     getModelUpdateLogs,
     getNextScheduledUpdate,
     getModelStatus,
     toggleModelStatus,
-    getModelMetrics
+    getModelMetrics,
+    getRunReport
 };
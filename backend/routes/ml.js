@@ -146,4 +146,24 @@ router.post('/toggle-status', auth(['admin'], true), requireOtpVerification, tog
 // Add route for model metrics
 router.get('/metrics', auth(['admin'], true), requireOtpVerification, mlController.getModelMetrics);
 
+/**
+ * @swagger
+ * /ml/run-report:
+ *   get:
+ *     summary: Get the report of the latest pipeline run
+ *     description: Returns the wall time, CPU time, peak memory growth and input/output row counts of every stage of the most recent stock update run
+ *     security:
+ *       - bearerAuth: []
+ *     responses:
+ *       200:
+ *         description: Run report retrieved successfully
+ *       403:
+ *         description: Not authorized
+ *       404:
+ *         description: No run report found
+ *       500:
+ *         description: Server error
+ */
+router.get('/run-report', auth(['admin'], true), requireOtpVerification, mlController.getRunReport);
+
 module.exports = router;
@@ -137,4 +137,54 @@ describe('mlModelController', () => {
       ])
     }));
   });
+
+  describe('getRunReport', () => {
+    const resultsDir = path.join(__dirname, '..', '..', 'mlops', 'models', 'results');
+    const reportFile = 'run_report_99991231_235959.json';
+
+    beforeAll(() => {
+      fs.mkdirSync(resultsDir, { recursive: true });
+      fs.writeFileSync(path.join(resultsDir, reportFile), JSON.stringify({
+        run_id: '99991231T235959000000',
+        success: true,
+        wall_seconds: 12.5,
+        stages: [
+          { name: 'fetch', state: 'completed', wall_seconds: 4.2, cpu_seconds: 1.1, peak_rss_delta_mb: 120.5, input_rows: {}, output_rows: { df: 1000 } },
+          { name: 'sales', state: 'completed', wall_seconds: 0.3, cpu_seconds: 0.3, peak_rss_delta_mb: 2.0, input_rows: { df: 1000 }, output_rows: { df_sales: 400 } }
+        ]
+      }));
+    });
+
+    afterAll(() => {
+      fs.rmSync(path.join(resultsDir, reportFile), { force: true });
+    });
+
+    it('should return the latest run report for admin user', async () => {
+      const req = { user: { rol: 'admin' } };
+      const res = mockRes();
+
+      await controller.getRunReport(req, res);
+
+      expect(res.status).toHaveBeenCalledWith(200);
+      expect(res.json).toHaveBeenCalledWith(expect.objectContaining({
+        success: true,
+        reportFile,
+        report: expect.objectContaining({
+          success: true,
+          stages: expect.arrayContaining([
+            expect.objectContaining({ name: 'fetch', wall_seconds: expect.any(Number), output_rows: { df: 1000 } })
+          ])
+        })
+      }));
+    });
+
+    it('should return 403 for non-admin user', async () => {
+      const req = { user: { rol: 'cliente' } };
+      const res = mockRes();
+
+      await controller.getRunReport(req, res);
+
+      expect(res.status).toHaveBeenCalledWith(403);
+    });
+  });
 });
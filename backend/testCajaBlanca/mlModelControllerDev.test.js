@@ -115,4 +115,23 @@ describe('mlModelControllerDev', () => {
       }));
     });
   });
+
+  describe('getRunReport', () => {
+    it('should return a mock run report for admin', async () => {
+      await controller.getRunReport(req, res);
+      expect(res.status).toHaveBeenCalledWith(200);
+      expect(res.json).toHaveBeenCalledWith(expect.objectContaining({
+        success: true,
+        report: expect.objectContaining({
+          stages: expect.any(Array),
+        }),
+      }));
+    });
+
+    it('should return 403 for non-admin user', async () => {
+      req.user.rol = 'cliente';
+      await controller.getRunReport(req, res);
+      expect(res.status).toHaveBeenCalledWith(403);
+    });
+  });
 });
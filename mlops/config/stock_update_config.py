@@ -6,17 +6,104 @@ SAFETY_FACTOR = 1.2
 # Minimum value for stock_minimo to prevent setting it too low
 MIN_STOCK_VALUE = 1
 
-# Number of previous months to use for training
+# Stock minimum write-back strategy (always a single transaction):
+#   "merge"       - batch insert into a temporary staging table and apply one MERGE,
+#                   falling back to "executemany" if the MERGE fails
+#   "executemany" - parameterized UPDATE sent in batches with executemany
+WRITE_BACK_MODE = "merge"
+WRITE_BACK_BATCH_SIZE = 5000
+
+# Only stock minimums that changed are written back. Changes of at most this many
+# units are suppressed to avoid small week-to-week oscillations (0 = exact diff).
+WRITE_BACK_TOLERANCE = 0
+
+# Number of previous months to use for training (None uses the full history).
+# The window is applied in the HANA query and when reading the sales cache.
 TRAINING_MONTHS = 6
 
+# Training window strategy:
+#   "window" - hard cutoff at TRAINING_MONTHS before the evaluation month
+#   "decay"  - weight each month by recency, halving every RECENCY_HALF_LIFE_MONTHS,
+#              and drop the months whose weight falls below RECENCY_MIN_WEIGHT
+TRAINING_WINDOW_MODE = "window"
+RECENCY_HALF_LIFE_MONTHS = 6
+RECENCY_MIN_WEIGHT = 0.05
+
+# Training strategy:
+#   "full"       - train a new model from scratch every run
+#   "warm_start" - continue boosting the latest saved model with WARM_START_ROUNDS
+#                  extra trees on the newly arrived periods only. A full rebuild is
+#                  forced after WARM_START_MAX_RUNS consecutive warm starts.
+TRAINING_STRATEGY = "full"
+WARM_START_ROUNDS = 20
+WARM_START_MAX_RUNS = 4
+
 # Model parameters
 MODEL_PARAMS = {
     "n_estimators": 100,
     "max_depth": 3,
     "learning_rate": 0.1,
-    "random_state": 42
+    "random_state": 42,
+    # Histogram-based tree construction; fewer bins train faster, more bins split finer
+    "tree_method": "hist",
+    "max_bin": 256,
+    # Core budget for training, so the job does not starve the co-located Node server
+    "n_jobs": 2
 }
 
+# Early stopping: the last VALIDATION_MONTHS training months are held out to find
+# the number of boosting rounds (up to n_estimators), stopping after
+# EARLY_STOPPING_ROUNDS rounds without improvement. None disables it.
+EARLY_STOPPING_ROUNDS = 10
+VALIDATION_MONTHS = 1
+
+# Partitioned training: also fit one model per partition, in parallel on a process pool.
+#   None       - global model only
+#   "location" - one model per LOCATION_ID
+#   "category" - one model per article CATEGORIA
+# Partitions with fewer than MIN_PARTITION_ROWS training rows are scored by the
+# global model. Each partition fit uses one core, TRAINING_WORKERS fits run at once.
+TRAINING_PARTITION = None
+MIN_PARTITION_ROWS = 200
+TRAINING_WORKERS = 4
+
+# Backtesting (pipelines/backtesting.py): rolling-origin evaluation of the last
+# BACKTEST_FOLDS months. Each fold trains on the training window before its month
+# and is evaluated on that month; BACKTEST_WORKERS folds are fit at once.
+BACKTEST_FOLDS = 6
+BACKTEST_WORKERS = 4
+
+# Hyperparameter search (pipelines/hyperparameter_search.py): successive halving over
+# SEARCH_SPACE with the backtesting folds as the budget. The first rung scores every
+# candidate on the SEARCH_MIN_FOLDS most recent folds; each following rung keeps the
+# best 1/SEARCH_HALVING_FACTOR candidates and scores them on that many times more folds.
+SEARCH_SPACE = {
+    "n_estimators": [100, 200, 400],
+    "max_depth": [3, 5, 7],
+    "learning_rate": [0.03, 0.1, 0.3]
+}
+SEARCH_MIN_FOLDS = 1
+SEARCH_HALVING_FACTOR = 3
+
+# Merge the winning parameters of the last search (config/best_model_params.json)
+# over MODEL_PARAMS when training
+USE_TUNED_PARAMS = True
+
+# Demand history features (pipelines/feature_engine.py): units sold FEATURE_LAGS months
+# earlier, and the mean / standard deviation of the previous FEATURE_ROLLING_WINDOWS
+# months, per (location, article). They are updated incrementally from a persisted
+# state; changing either list rebuilds them. Empty lists disable the features.
+FEATURE_LAGS = [1, 12]
+FEATURE_ROLLING_WINDOWS = [3]
+
+# Number of months forecast after the last period with data (1 = next month only).
+# All months are scored in one batch and saved as a long-format forecast.
+FORECAST_HORIZON = 1
+
+# Forecast month that drives STOCKMINIMO: a month number from 1 to FORECAST_HORIZON,
+# or "max" for the highest predicted demand over the horizon
+STOCK_MIN_HORIZON = 1
+
 # Schedule parameters (day of week: 0=Monday, 6=Sunday)
 SCHEDULE_DAY = 0  # Monday
 SCHEDULE_HOUR = 1  # 1:00 AM
@@ -25,6 +112,75 @@ SCHEDULE_MINUTE = 0
 # Database schema
 DB_SCHEMA = "DBADMIN"
 
+# Data fetch strategy:
+#   "pushdown" - aggregate monthly sales inside HANA and fetch only the grouped rows
+#   "stream"   - read the history rows through a cursor in chunks and fold them into
+#                the monthly aggregate as Arrow record batches (bounded memory)
+#   "collect"  - legacy mode, collect the full tables and aggregate in pandas
+FETCH_MODE = "pushdown"
+
+# Rows per fetchmany call in stream mode; peak memory grows with this value
+STREAM_CHUNK_SIZE = 50000
+
+# Compact DataFrames: fetch only the columns the pipeline uses, downcast numeric
+# columns to the smallest type and store low-cardinality strings as categoricals
+COMPACT_DTYPES = True
+
+# Prepare the monthly sales with the fused columnar path (integer group keys,
+# one NumPy group sum, lookup-table month features, no full-frame copies).
+# False uses the original pandas groupby / string date parsing path.
+FAST_PREPARE = True
+
+# Number of database connections used to fetch independent tables in parallel
+# (1 fetches them one after another on the main connection)
+FETCH_PARALLELISM = 3
+
+# Keep a local Parquet cache of the aggregated monthly sales (pushdown mode).
+# Each run only fetches the periods at or after the cached (ANIO, MES) watermark;
+# use --full-refresh to rebuild it from scratch. The cache is rebuilt on its own
+# when the training window starts before the window it was built for.
+SALES_CACHE_ENABLED = True
+
+# Abort the collect fetch when a join grows the row count past this multiple
+# of its larger input (a join at the right grain grows at most linearly)
+MAX_JOIN_FANOUT = 2.0
+
+# Execution mode:
+#   "in_memory"   - every stage works on the full frame at once
+#   "out_of_core" - the sales are split into groups of locations that are prepared,
+#                   featurized and scored one group at a time, with the intermediate
+#                   frames spilled to Parquet under PATHS["SPILL"]. The global model is
+#                   trained from the spilled features through xgboost's external-memory
+#                   matrix; only the forecasts and error sums of the groups are combined.
+# MEMORY_BUDGET_MB sizes the location groups (out-of-core mode only). The pushdown
+# and stream fetch modes fetch one group at a time; collect mode fetches the full
+# tables first, so the budget only bounds the stages after its fetch.
+EXECUTION_MODE = "in_memory"
+MEMORY_BUDGET_MB = 512
+
+# Stage checkpoints: each finished stage of a run (fetched data, sales, features,
+# model, predictions, stock minimums, write-back) is saved under PATHS["RUNS"]/<run ID>
+# together with the training data fingerprint. A failed run is continued with
+# --resume RUN_ID (or --resume latest), loading the finished stages instead of
+# fetching and training again. A run's checkpoint is deleted when it succeeds;
+# the newest CHECKPOINT_KEEP_RUNS failed runs are kept.
+CHECKPOINT_ENABLED = True
+CHECKPOINT_KEEP_RUNS = 3
+
+# The pipeline runs as a DAG of stages (see pipelines/stage_dag.py). Stages whose
+# inputs are ready run concurrently, up to STAGE_PARALLELISM at a time: the model
+# is evaluated while the forecast is scored, and saved while the stock minimums
+# are written back (1 runs the stages one after another).
+STAGE_PARALLELISM = 2
+
+# Optional stages not to run ("evaluate", "write_back", "save"); --skip-stages
+# overrides it. Skipping "write_back" gives a dry run that leaves HANA untouched.
+SKIP_STAGES = []
+
+# Number of model versions kept in the model registry (older versions and the
+# artifacts only they reference are deleted after each run)
+REGISTRY_KEEP_VERSIONS = 8
+
 # Table names
 TABLES = {
     "INVENTORY": "INVENTARIO2",
@@ -38,5 +194,11 @@ TABLES = {
 PATHS = {
     "MODELS": "../models",
     "RESULTS": "../models/results",
+    "CACHE": "../models/cache",
+    "REGISTRY": "../models/registry",
+    "DICTIONARIES": "../models/dictionaries",
+    "FEATURES": "../models/features",
+    "SPILL": "../models/spill",
+    "RUNS": "../models/runs",
     "LOGS": "../logs"
 }
@@ -0,0 +1,268 @@
+"""
+Rolling-Origin Backtesting for the Demand Model
+
+This script evaluates the weekly model configuration over the last N months
+instead of the single holdout month used by the weekly run:
+1. Loads the sales history once and builds the feature matrix once
+2. For each of the last N months (the fold origin), trains a model on the
+   training window before it and predicts that month
+3. Runs the folds in parallel on a process pool that shares the feature matrix
+4. Reports MAE/RMSE per fold, per location and per article, and the time per fold
+
+Usage:
+    python backtesting.py [--folds N] [--workers N] [--fetch-mode MODE]
+"""
+
+import os
+import sys
+import argparse
+import datetime
+import json
+import time
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+# Import configuration and the weekly pipeline
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import stock_update_config as config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(f'../logs/backtesting_{datetime.datetime.now().strftime("%Y%m%d")}.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger('backtesting')
+
+from weekly_stock_update import (
+    WeeklyStockUpdate, fit_regressor, model_params, recency_weights, period_key, create_directory_if_not_exists
+)
+
+# Feature matrix shared with the fold workers, set once per process by init_fold_worker
+_SHARED = {}
+
+def init_fold_worker(X, y, periods):
+    """Process pool initializer: keep the precomputed feature matrix in the worker"""
+    _SHARED['X'] = X
+    _SHARED['y'] = y
+    _SHARED['periods'] = periods
+
+def run_fold(fold):
+    """
+    Process pool worker: train on the fold's training window and predict its origin month.
+
+    `fold` is a dict with the origin period, the first training period (None for the
+    full history) and optional model parameter overrides.
+    """
+    start = time.perf_counter()
+    X, y, periods = _SHARED['X'], _SHARED['y'], _SHARED['periods']
+    origin = fold['origin']
+    train_rows = periods < origin
+    if fold['train_start'] is not None:
+        train_rows &= periods >= fold['train_start']
+    test_rows = np.flatnonzero(periods == origin)
+
+    sample_weight = None
+    if config.TRAINING_WINDOW_MODE == 'decay':
+        sample_weight = recency_weights(periods[train_rows])
+    params = dict(fold.get('params') or {})
+    params.setdefault('n_jobs', 1)
+    model, info = fit_regressor(X[train_rows], y[train_rows], periods[train_rows], sample_weight, params=params)
+
+    predict_start = time.perf_counter()
+    pred = model.predict(X[test_rows])
+    error = pred - y[test_rows]
+    return {
+        'origin': origin,
+        'params': fold.get('params') or {},
+        'train_rows': int(train_rows.sum()),
+        'test_rows': len(test_rows),
+        'mae': float(np.abs(error).mean()) if len(error) else None,
+        'rmse': float(np.sqrt(np.square(error).mean())) if len(error) else None,
+        'rounds': info['rounds'],
+        'fit_seconds': info['fit_seconds'],
+        'predict_seconds': time.perf_counter() - predict_start,
+        'fold_seconds': time.perf_counter() - start,
+        'test_index': test_rows,
+        'pred': pred
+    }
+
+def error_table(frame, key):
+    """Aggregate absolute and squared errors into MAE/RMSE per value of `key`"""
+    grouped = frame.groupby(key, sort=True).agg(
+        rows=('abs_error', 'size'),
+        mae=('abs_error', 'mean'),
+        mse=('squared_error', 'mean')
+    )
+    grouped['rmse'] = np.sqrt(grouped.pop('mse'))
+    return grouped.reset_index()
+
+class Backtester:
+    """Rolling-origin evaluation of the weekly demand model"""
+
+    def __init__(self, folds=None, workers=None, fetch_mode=None):
+        """Initialize the backtest"""
+        self.folds = folds or config.BACKTEST_FOLDS
+        self.workers = workers or config.BACKTEST_WORKERS
+        # Load enough history to give the oldest fold a full training window
+        self.updater = WeeklyStockUpdate(
+            fetch_mode=fetch_mode,
+            training_strategy='full',
+            extra_history_months=self.folds - 1,
+            incremental_features=False
+        )
+        self.df_model = None
+        self.X = None
+        self.y = None
+        self.periods = None
+
+    def load_features(self):
+        """Fetch the sales history and build the shared feature matrix once"""
+        updater = self.updater
+        if not updater.connect_to_database():
+            logger.error("Database connection failed")
+            return False
+        df = updater.fetch_data()
+        if df is None or len(df) == 0:
+            logger.error("Data fetching failed")
+            return False
+        df_sales = updater.prepare_sales_data(df)
+        if df_sales is None:
+            logger.error("Sales data preparation failed")
+            return False
+        self.df_model = updater.perform_feature_engineering(df_sales)
+        if self.df_model is None:
+            logger.error("Feature engineering failed")
+            return False
+
+        self.X = self.df_model[updater.features].to_numpy(dtype=np.float64)
+        self.y = self.df_model[updater.target].to_numpy(dtype=np.float64)
+        self.periods = period_key(self.df_model['year'], self.df_model['month']).to_numpy()
+        logger.info(f"Feature matrix built: {self.X.shape[0]} rows x {self.X.shape[1]} features")
+        return True
+
+    def fold_origins(self):
+        """The last `folds` periods with data, oldest first"""
+        return [int(period) for period in np.unique(self.periods)[-self.folds:]]
+
+    def make_folds(self, params=None, origins=None):
+        """Fold specifications for the given origins (all folds by default)"""
+        return [
+            {
+                'origin': origin,
+                'train_start': self.updater.training_window_start(origin),
+                'params': params
+            }
+            for origin in (origins if origins is not None else self.fold_origins())
+        ]
+
+    def executor(self):
+        """Process pool whose workers hold the shared feature matrix"""
+        return ProcessPoolExecutor(
+            max_workers=max(1, self.workers),
+            initializer=init_fold_worker,
+            initargs=(self.X, self.y, self.periods)
+        )
+
+    def build_report(self, results, elapsed):
+        """Summarize fold results and break the errors down by location and article"""
+        results = sorted(results, key=lambda result: result['origin'])
+        test_index = np.concatenate([result['test_index'] for result in results])
+        pred = np.concatenate([result['pred'] for result in results])
+        errors = pd.DataFrame({
+            'location_id': self.df_model['location_id'].to_numpy()[test_index],
+            'articulo_id': self.df_model['articulo_id'].to_numpy()[test_index],
+            'abs_error': np.abs(pred - self.y[test_index]),
+            'squared_error': np.square(pred - self.y[test_index])
+        })
+        folds = [
+            {key: value for key, value in result.items() if key not in ('test_index', 'pred', 'params')}
+            for result in results
+        ]
+        summary = {
+            'folds': len(results),
+            'rows': len(errors),
+            'mae': float(errors['abs_error'].mean()) if len(errors) else None,
+            'rmse': float(np.sqrt(errors['squared_error'].mean())) if len(errors) else None,
+            'mean_fold_seconds': float(np.mean([fold['fold_seconds'] for fold in folds])),
+            'elapsed_seconds': elapsed
+        }
+        return {
+            'generated': datetime.datetime.now().isoformat(),
+            'model_params': model_params(),
+            'training_window_mode': config.TRAINING_WINDOW_MODE,
+            'training_months': config.TRAINING_MONTHS,
+            'summary': summary,
+            'folds': folds
+        }, error_table(errors, 'location_id'), error_table(errors, 'articulo_id')
+
+    def save_report(self, report, by_location, by_article):
+        """Write the JSON report and the per-location / per-article CSV files"""
+        create_directory_if_not_exists(config.PATHS['RESULTS'])
+        today_str = datetime.datetime.now().strftime("%Y%m%d")
+        report_path = os.path.join(config.PATHS['RESULTS'], f'backtest_{today_str}.json')
+        with open(report_path, 'w', encoding='utf-8') as rf:
+            json.dump(report, rf, indent=2, default=str)
+        by_location.to_csv(os.path.join(config.PATHS['RESULTS'], f'backtest_locations_{today_str}.csv'), index=False)
+        by_article.to_csv(os.path.join(config.PATHS['RESULTS'], f'backtest_articles_{today_str}.csv'), index=False)
+        logger.info(f"Backtest report saved to: {report_path}")
+        return report_path
+
+    def run(self):
+        """Run the backtest and save its report; returns the report or None on failure"""
+        logger.info("Starting rolling-origin backtest")
+        try:
+            if not self.load_features():
+                return None
+            folds = self.make_folds()
+            if not folds:
+                logger.error("No periods available to backtest")
+                return None
+            logger.info(f"Backtesting {len(folds)} folds: {[fold['origin'] for fold in folds]} on {self.workers} worker(s)")
+
+            start = time.perf_counter()
+            results = []
+            with self.executor() as executor:
+                for result in executor.map(run_fold, folds):
+                    logger.info(
+                        f"Fold {result['origin']}: MAE {result['mae']:.2f}, RMSE {result['rmse']:.2f}, "
+                        f"{result['train_rows']} training rows, {result['fold_seconds']:.2f}s"
+                    )
+                    results.append(result)
+
+            report, by_location, by_article = self.build_report(results, time.perf_counter() - start)
+            logger.info(
+                f"Backtest completed. MAE {report['summary']['mae']:.2f}, RMSE {report['summary']['rmse']:.2f} "
+                f"over {report['summary']['rows']} rows in {report['summary']['elapsed_seconds']:.2f}s"
+            )
+            self.save_report(report, by_location, by_article)
+            return report
+
+        except Exception as e:
+            logger.error(f"Error running backtest: {e}")
+            return None
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the demand model")
+    parser.add_argument('--folds', type=int, default=None,
+                        help=f"Number of monthly folds (default from config: {config.BACKTEST_FOLDS})")
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f"Worker processes (default from config: {config.BACKTEST_WORKERS})")
+    parser.add_argument('--fetch-mode', choices=['pushdown', 'stream', 'collect'], default=None,
+                        help=f"Data fetch strategy (default from config: {config.FETCH_MODE})")
+    return parser.parse_args(argv)
+
+
+# Main execution
+if __name__ == "__main__":
+    args = parse_args()
+    report = Backtester(folds=args.folds, workers=args.workers, fetch_mode=args.fetch_mode).run()
+    sys.exit(0 if report is not None else 1)
@@ -0,0 +1,107 @@
+"""
+Persistent Category Dictionary
+
+Maps integer IDs (locations, articles) to stable model codes:
+- Codes are assigned in order of first appearance and never change, so the same
+  article keeps its code from week to week and old models stay valid
+- New IDs are appended with the next free code
+- Lookup is vectorized through a dense NumPy mapping array indexed by ID
+- IDs without a code map to UNKNOWN_CODE instead of raising
+"""
+
+import os
+import sys
+import logging
+import numpy as np
+
+# Import configuration
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import stock_update_config as config
+
+logger = logging.getLogger('category_dictionary')
+
+# Code returned for IDs that are not in the dictionary
+UNKNOWN_CODE = -1
+
+# Use a dense ID -> code array unless the IDs are this sparse (max ID per stored ID)
+MAX_DENSE_RATIO = 64
+
+class CategoryDictionary:
+    """Append-only ID -> code dictionary stored as an array of IDs in code order"""
+
+    def __init__(self, name, root=None):
+        """Load the dictionary `name` from `root` (PATHS['DICTIONARIES'] by default)"""
+        self.name = name
+        self.path = os.path.join(root or config.PATHS['DICTIONARIES'], f'{name}_ids.npy')
+        self.ids = np.load(self.path) if os.path.exists(self.path) else np.empty(0, dtype=np.int64)
+        self._build_lookup()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _build_lookup(self):
+        """Build the ID -> code mapping array (or a sorted index for sparse IDs)"""
+        self._table = None
+        self._sorted_ids = None
+        self._sorted_codes = None
+        if len(self.ids) == 0:
+            return
+        max_id = int(self.ids.max())
+        if self.ids.min() >= 0 and max_id < MAX_DENSE_RATIO * len(self.ids) + 1024:
+            self._table = np.full(max_id + 1, UNKNOWN_CODE, dtype=np.int64)
+            self._table[self.ids] = np.arange(len(self.ids), dtype=np.int64)
+        else:
+            order = np.argsort(self.ids, kind='stable')
+            self._sorted_ids = self.ids[order]
+            self._sorted_codes = order.astype(np.int64)
+
+    def encode(self, values):
+        """Return the code of each ID, UNKNOWN_CODE for IDs not in the dictionary"""
+        values = np.asarray(values)
+        codes = np.full(len(values), UNKNOWN_CODE, dtype=np.int64)
+        if len(self.ids) == 0 or len(values) == 0:
+            return codes
+        valid = np.isfinite(values) if values.dtype.kind == 'f' else np.ones(len(values), dtype=bool)
+        ids = values[valid].astype(np.int64)
+        if self._table is not None:
+            in_range = (ids >= 0) & (ids < len(self._table))
+            found = np.full(len(ids), UNKNOWN_CODE, dtype=np.int64)
+            found[in_range] = self._table[ids[in_range]]
+        else:
+            position = np.clip(np.searchsorted(self._sorted_ids, ids), 0, len(self._sorted_ids) - 1)
+            found = np.where(self._sorted_ids[position] == ids, self._sorted_codes[position], UNKNOWN_CODE)
+        codes[valid] = found
+        return codes
+
+    def update(self, values):
+        """Append the IDs that have no code yet (in ascending order); returns how many were added"""
+        values = np.asarray(values)
+        if values.dtype.kind == 'f':
+            values = values[np.isfinite(values)]
+        new_ids = np.unique(values.astype(np.int64))
+        new_ids = new_ids[self.encode(new_ids) == UNKNOWN_CODE]
+        if len(new_ids) > 0:
+            self.ids = np.concatenate([self.ids, new_ids])
+            self._build_lookup()
+            logger.info(f"Added {len(new_ids)} new ID(s) to the {self.name} dictionary ({len(self.ids)} total)")
+        return len(new_ids)
+
+    def extends(self, ids):
+        """True if `ids` (a saved snapshot) is a prefix of this dictionary, so its codes are unchanged"""
+        ids = np.asarray(ids)
+        return len(ids) <= len(self.ids) and np.array_equal(self.ids[:len(ids)], ids)
+
+    def restore(self, ids):
+        """Replace the codes with a saved snapshot that extends them (e.g. from a run checkpoint)"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if not (len(self.ids) <= len(ids) and np.array_equal(ids[:len(self.ids)], self.ids)):
+            raise ValueError(f"Snapshot does not extend the {self.name} dictionary")
+        self.ids = ids
+        self._build_lookup()
+
+    def save(self):
+        """Write the dictionary atomically"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npy"
+        np.save(tmp_path, self.ids)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,286 @@
+"""
+Demand History Feature Engine
+
+Adds lagged and rolling-window demand features per (location, article) series:
+- lag_K: units sold K months before the row's month
+- roll_mean_W / roll_std_W: mean and standard deviation of the W months before
+  the row's month (the month itself is excluded, so there is no leakage)
+
+Features are computed on a dense series x period matrix. The engine persists the
+last months of that matrix (the lookback tail) and the features it computed, so a
+run that appends a new month only computes the features of the new periods. The
+update is kept in memory until `save` is called, so a run that fails after the
+features were computed does not leave state that later runs would build on.
+Months without data, and months in the future when forecasting, are NaN.
+"""
+
+import os
+import sys
+import json
+import logging
+import numpy as np
+import pandas as pd
+
+# Import configuration
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import stock_update_config as config
+
+logger = logging.getLogger('feature_engine')
+
+# Bump to invalidate persisted state when the feature computation changes
+FEATURE_ENGINE_VERSION = 1
+
+# Column of the monthly units sold
+TARGET = 'unidades_vendidas'
+
+def series_key(location_ids, article_ids):
+    """Combine location and article IDs into one int64 key per series"""
+    return (np.asarray(location_ids).astype(np.int64) << 32) | np.asarray(article_ids).astype(np.int64)
+
+def period_index(periods):
+    """Months since year 0 of YYYYMM periods, so consecutive months differ by 1"""
+    periods = np.asarray(periods, dtype=np.int64)
+    return (periods // 100) * 12 + periods % 100 - 1
+
+def frame_periods(df):
+    """YYYYMM period of each row of a sales frame"""
+    return df['year'].to_numpy(dtype=np.int64) * 100 + df['month'].to_numpy(dtype=np.int64)
+
+class FeatureEngine:
+    """Incremental lag / rolling-window features over the monthly sales"""
+
+    def __init__(self, lags=None, windows=None, incremental=True, rebuild=False, root=None):
+        """
+        Initialize the engine. `incremental=False` never reads or writes persisted
+        state; `rebuild=True` ignores it once and replaces it.
+        """
+        self.lags = sorted(config.FEATURE_LAGS if lags is None else lags)
+        self.windows = sorted(config.FEATURE_ROLLING_WINDOWS if windows is None else windows)
+        self.incremental = incremental
+        self.rebuild = rebuild
+        root = root or config.PATHS['FEATURES']
+        self.state_path = os.path.join(root, 'feature_state.npz')
+        self.cache_path = os.path.join(root, 'feature_cache.parquet')
+        # Last `lookback` months (up to the last observed period) of the latest update
+        self._keys = None
+        self._context = None
+        self._last_index = None
+        # State and cache of the latest update, persisted by `save`
+        self._pending = None
+
+    @property
+    def feature_names(self):
+        """Names of the generated feature columns"""
+        return (
+            [f'lag_{lag}' for lag in self.lags]
+            + [name for window in self.windows for name in (f'roll_mean_{window}', f'roll_std_{window}')]
+        )
+
+    @property
+    def lookback(self):
+        """Months of history needed before a row to compute all of its features"""
+        return max(self.lags + self.windows + [0])
+
+    @property
+    def signature(self):
+        """Identifies the feature set; persisted state with another signature is rebuilt"""
+        return json.dumps({'version': FEATURE_ENGINE_VERSION, 'lags': self.lags, 'windows': self.windows})
+
+    def load_state(self):
+        """Persisted state of the last update, or None if missing or for another feature set"""
+        if not self.incremental or self.rebuild:
+            return None
+        if not os.path.exists(self.state_path) or not os.path.exists(self.cache_path):
+            return None
+        try:
+            with np.load(self.state_path) as archive:
+                state = {name: archive[name] for name in archive.files}
+            if str(state['signature']) != self.signature:
+                logger.info("Feature set changed since the last run. Rebuilding the features")
+                return None
+            return state
+        except Exception as e:
+            logger.warning(f"Could not read the feature state, rebuilding the features: {e}")
+            return None
+
+    def needs_rebuild(self):
+        """True when the next update has to compute every period (and needs the lookback history)"""
+        return self.load_state() is None
+
+    def _compute(self, matrix, rows, columns):
+        """
+        Features of the (row, column) cells of `matrix`. Every column has at least
+        `lookback` columns of history before it.
+        """
+        values = np.nan_to_num(matrix)
+        present = ~np.isnan(matrix)
+        # Prefix sums with a leading zero column: window sums become one subtraction
+        zeros = np.zeros((matrix.shape[0], 1))
+        sums = np.concatenate([zeros, np.cumsum(values, axis=1)], axis=1)
+        squares = np.concatenate([zeros, np.cumsum(values * values, axis=1)], axis=1)
+        counts = np.concatenate([zeros, np.cumsum(present, axis=1)], axis=1)
+
+        features = {}
+        for lag in self.lags:
+            features[f'lag_{lag}'] = matrix[rows, columns - lag]
+        for window in self.windows:
+            n = counts[rows, columns] - counts[rows, columns - window]
+            total = sums[rows, columns] - sums[rows, columns - window]
+            total_sq = squares[rows, columns] - squares[rows, columns - window]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                mean = np.where(n > 0, total / n, np.nan)
+                var = np.where(n > 1, (total_sq - n * mean * mean) / (n - 1), np.nan)
+            features[f'roll_mean_{window}'] = mean
+            features[f'roll_std_{window}'] = np.sqrt(np.clip(var, 0, None))
+        return features
+
+    def add_features(self, df_model, last_period=None):
+        """
+        Return `df_model` with the feature columns added.
+
+        Periods before the last persisted period are read from the feature cache;
+        the last persisted period (it may have been revised) and newer periods are
+        computed from the persisted lookback tail plus the new data. `last_period`
+        (YYYYMM) extends the series up to that month when the loaded rows stop
+        earlier, e.g. for a group of locations without sales in the latest month.
+        """
+        keys = series_key(df_model['location_id'], df_model['articulo_id'])
+        months = period_index(frame_periods(df_model))
+        last_index = int(months.max())
+        if last_period is not None:
+            last_index = max(last_index, int(period_index([last_period])[0]))
+        state = self.load_state()
+
+        cached = None
+        if state is not None:
+            recompute_from = int(state['last_index'])
+            if not months.min() <= recompute_from <= last_index:
+                logger.info("Feature state does not overlap the loaded periods. Rebuilding the features")
+                state = None
+            else:
+                cached = self._read_cache(keys, months, recompute_from)
+                if cached is None:
+                    state = None
+        if state is None:
+            recompute_from = int(months.min())
+
+        # Dense matrix of the periods to compute, preceded by the lookback tail
+        new_rows = months >= recompute_from
+        all_keys = np.unique(keys) if state is None else np.union1d(state['keys'], keys)
+        n_periods = last_index - recompute_from + 1
+        matrix = np.full((len(all_keys), self.lookback + n_periods), np.nan)
+        if state is not None and self.lookback:
+            matrix[np.searchsorted(all_keys, state['keys']), :self.lookback] = state['tail']
+        row_series = np.searchsorted(all_keys, keys[new_rows])
+        row_columns = self.lookback + months[new_rows] - recompute_from
+        matrix[row_series, row_columns] = df_model[TARGET].to_numpy(dtype=np.float64)[new_rows]
+
+        computed = self._compute(matrix, row_series, row_columns)
+        features = {}
+        for name in self.feature_names:
+            column = np.full(len(df_model), np.nan)
+            column[new_rows] = computed[name]
+            if cached is not None:
+                column[~new_rows] = cached[name]
+            features[name] = column
+        logger.info(
+            f"Demand features computed for {int(new_rows.sum())} rows"
+            + (f", {int((~new_rows).sum())} rows read from the feature cache" if cached is not None else " (full rebuild)")
+        )
+
+        # Keep the last `lookback` months up to the last period for forecasting and the next update
+        self._keys = all_keys
+        self._context = matrix[:, matrix.shape[1] - self.lookback:] if self.lookback else matrix[:, :0]
+        self._last_index = last_index
+        if self.incremental:
+            self._pending = self._state_update(all_keys, matrix, keys, months, features)
+
+        return df_model.assign(**features)
+
+    def _read_cache(self, keys, months, recompute_from):
+        """Cached features of the rows before `recompute_from`, in row order, or None if incomplete"""
+        old_rows = months < recompute_from
+        if not old_rows.any():
+            return {name: np.empty(0) for name in self.feature_names}
+        cache = pd.read_parquet(self.cache_path)
+        lookup = pd.DataFrame({'key': keys[old_rows], 'month': months[old_rows]})
+        merged = lookup.merge(cache, on=['key', 'month'], how='left', indicator=True)
+        if (merged['_merge'] != 'both').any():
+            logger.info("Feature cache does not cover the loaded periods. Rebuilding the features")
+            return None
+        return {name: merged[name].to_numpy(dtype=np.float64) for name in self.feature_names}
+
+    def _state_update(self, all_keys, matrix, keys, months, features):
+        """State and cache of an update as arrays: the tail before the last period and the features of the loaded rows"""
+        # The next update recomputes the last period, so its tail ends just before it
+        end = matrix.shape[1] - 1
+        update = {
+            'keys': all_keys,
+            'tail': matrix[:, end - self.lookback:end],
+            'last_index': np.array(self._last_index),
+            'cache_key': keys,
+            'cache_month': months
+        }
+        for name in self.feature_names:
+            update[f'cache_{name}'] = features[name].astype(np.float32)
+        return update
+
+    def pending_update(self):
+        """Update computed by the last `add_features` and not saved yet (to checkpoint it), or None"""
+        return self._pending
+
+    def restore_pending_update(self, arrays):
+        """Restore an update returned by `pending_update`, so a resumed run can still save it"""
+        self._pending = arrays
+
+    def discard(self):
+        """Drop the unsaved update, keeping the persisted state of the last successful run"""
+        self._pending = None
+
+    def save(self):
+        """Persist the pending update as the state and cache of the next run; returns True if one was saved"""
+        if self._pending is None:
+            return False
+        update = self._pending
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp_state = f"{self.state_path}.tmp.npz"
+        np.savez(tmp_state, keys=update['keys'], tail=update['tail'], last_index=update['last_index'],
+                 signature=self.signature)
+        os.replace(tmp_state, self.state_path)
+
+        cache = pd.DataFrame({'key': update['cache_key'], 'month': update['cache_month']})
+        for name in self.feature_names:
+            cache[name] = update[f'cache_{name}']
+        tmp_cache = f"{self.cache_path}.tmp"
+        cache.to_parquet(tmp_cache, index=False)
+        os.replace(tmp_cache, self.cache_path)
+        self._pending = None
+        return True
+
+    def context(self):
+        """Lookback context of the last update as arrays (to checkpoint it), None before any update"""
+        if self._keys is None:
+            return None
+        return {'keys': self._keys, 'context': self._context, 'last_index': np.array(self._last_index)}
+
+    def restore_context(self, arrays):
+        """Restore a context saved by `context`, so forecasts work without recomputing the features"""
+        self._keys = arrays['keys']
+        self._context = arrays['context']
+        self._last_index = int(arrays['last_index'])
+
+    def forecast_features(self, location_ids, article_ids, horizons):
+        """
+        Features of months 1..`horizons` after the last period for the given pairs,
+        horizon-major (all pairs for month 1, then month 2, ...). Lags that fall in
+        the future are NaN and rolling windows only use the observed months.
+        """
+        keys = series_key(location_ids, article_ids)
+        matrix = np.full((len(keys), self.lookback + horizons), np.nan)
+        if self._keys is not None and len(self._keys):
+            position = np.clip(np.searchsorted(self._keys, keys), 0, len(self._keys) - 1)
+            known = self._keys[position] == keys
+            matrix[known, :self.lookback] = self._context[position[known]]
+        rows = np.tile(np.arange(len(keys)), horizons)
+        columns = np.repeat(self.lookback + np.arange(horizons), len(keys))
+        return self._compute(matrix, rows, columns)
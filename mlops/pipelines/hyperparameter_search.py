@@ -0,0 +1,182 @@
+"""
+Time-Series Hyperparameter Search for the Demand Model
+
+This script tunes n_estimators, max_depth and learning_rate for the weekly model:
+1. Builds the backtesting feature matrix and folds once (see backtesting.py)
+2. Scores every SEARCH_SPACE candidate on the most recent folds, in parallel on
+   a process pool
+3. Keeps the best candidates and scores them on more folds (successive halving)
+   until the remaining candidates have been scored on every fold
+4. Writes the winning parameters to config/best_model_params.json, which the weekly
+   job merges over MODEL_PARAMS, and a timing/accuracy leaderboard next to it
+
+Usage:
+    python hyperparameter_search.py [--folds N] [--workers N] [--fetch-mode MODE]
+"""
+
+import os
+import sys
+import argparse
+import datetime
+import itertools
+import json
+import time
+import logging
+import numpy as np
+
+# Import configuration and the backtesting engine
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from config import stock_update_config as config
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.FileHandler(f'../logs/hyperparameter_search_{datetime.datetime.now().strftime("%Y%m%d")}.log'),
+        logging.StreamHandler()
+    ]
+)
+logger = logging.getLogger('hyperparameter_search')
+
+from backtesting import Backtester, run_fold
+from weekly_stock_update import TUNED_PARAMS_PATH
+
+LEADERBOARD_PATH = os.path.join(os.path.dirname(TUNED_PARAMS_PATH), 'hyperparameter_leaderboard.json')
+
+def search_candidates(space):
+    """Every combination of the values in the search space, as parameter dicts"""
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+class HyperparameterSearch:
+    """Successive halving search over the backtesting folds"""
+
+    def __init__(self, folds=None, workers=None, fetch_mode=None):
+        """Initialize the search"""
+        self.backtester = Backtester(folds=folds, workers=workers, fetch_mode=fetch_mode)
+        self.candidates = [
+            {'params': params, 'folds': {}, 'rung': 0}
+            for params in search_candidates(config.SEARCH_SPACE)
+        ]
+
+    def score(self, candidate):
+        """Mean fold MAE of a candidate over the folds it was evaluated on"""
+        return float(np.mean([fold['mae'] for fold in candidate['folds'].values()]))
+
+    def evaluate(self, executor, candidates, origins, rung):
+        """Score each candidate on the origins it has not been evaluated on yet"""
+        jobs, owners = [], []
+        for candidate in candidates:
+            candidate['rung'] = rung
+            pending = [origin for origin in origins if origin not in candidate['folds']]
+            jobs.extend(self.backtester.make_folds(params=candidate['params'], origins=pending))
+            owners.extend([candidate] * len(pending))
+        for candidate, result in zip(owners, executor.map(run_fold, jobs)):
+            candidate['folds'][result['origin']] = {
+                key: result[key] for key in ('mae', 'rmse', 'fit_seconds', 'fold_seconds', 'rounds')
+            }
+        return len(jobs)
+
+    def leaderboard(self):
+        """Candidates ordered by the number of folds they survived, then by MAE"""
+        rows = []
+        for candidate in self.candidates:
+            folds = candidate['folds'].values()
+            rows.append({
+                'params': candidate['params'],
+                'rung': candidate['rung'],
+                'folds': len(candidate['folds']),
+                'mae': self.score(candidate),
+                'rmse': float(np.mean([fold['rmse'] for fold in folds])),
+                'mean_fit_seconds': float(np.mean([fold['fit_seconds'] for fold in folds])),
+                'mean_rounds': float(np.mean([fold['rounds'] for fold in folds]))
+            })
+        return sorted(rows, key=lambda row: (-row['folds'], row['mae']))
+
+    def save_results(self, leaderboard, elapsed):
+        """Write the winning parameters and the leaderboard to the config directory"""
+        best = leaderboard[0]
+        generated = datetime.datetime.now().isoformat()
+        with open(TUNED_PARAMS_PATH, 'w', encoding='utf-8') as bf:
+            json.dump({
+                'params': best['params'],
+                'mae': best['mae'],
+                'rmse': best['rmse'],
+                'folds': best['folds'],
+                'generated': generated
+            }, bf, indent=2)
+        with open(LEADERBOARD_PATH, 'w', encoding='utf-8') as lf:
+            json.dump({
+                'generated': generated,
+                'search_space': config.SEARCH_SPACE,
+                'halving_factor': config.SEARCH_HALVING_FACTOR,
+                'elapsed_seconds': elapsed,
+                'candidates': leaderboard
+            }, lf, indent=2)
+        logger.info(f"Best parameters saved to: {TUNED_PARAMS_PATH}")
+        logger.info(f"Leaderboard saved to: {LEADERBOARD_PATH}")
+
+    def run(self):
+        """Run the search; returns the winning parameters or None on failure"""
+        logger.info(f"Starting hyperparameter search over {len(self.candidates)} candidates")
+        try:
+            if not self.backtester.load_features():
+                return None
+            origins = self.backtester.fold_origins()
+            if not origins:
+                logger.error("No periods available to evaluate")
+                return None
+
+            start = time.perf_counter()
+            survivors = self.candidates
+            budget = min(config.SEARCH_MIN_FOLDS, len(origins))
+            rung = 0
+            with self.backtester.executor() as executor:
+                while True:
+                    rung_start = time.perf_counter()
+                    fits = self.evaluate(executor, survivors, origins[-budget:], rung)
+                    survivors = sorted(survivors, key=self.score)
+                    logger.info(
+                        f"Rung {rung}: {len(survivors)} candidate(s) on {budget} fold(s), {fits} fits in "
+                        f"{time.perf_counter() - rung_start:.2f}s. Best MAE {self.score(survivors[0]):.3f} "
+                        f"with {survivors[0]['params']}"
+                    )
+                    if budget >= len(origins):
+                        break
+                    survivors = survivors[:max(1, len(survivors) // config.SEARCH_HALVING_FACTOR)]
+                    budget = min(budget * config.SEARCH_HALVING_FACTOR, len(origins))
+                    rung += 1
+
+            leaderboard = self.leaderboard()
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Search completed in {elapsed:.2f}s. Best parameters {leaderboard[0]['params']} "
+                f"with MAE {leaderboard[0]['mae']:.3f} over {leaderboard[0]['folds']} folds"
+            )
+            self.save_results(leaderboard, elapsed)
+            return leaderboard[0]['params']
+
+        except Exception as e:
+            logger.error(f"Error running hyperparameter search: {e}")
+            return None
+
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Successive halving search of the model parameters")
+    parser.add_argument('--folds', type=int, default=None,
+                        help=f"Number of monthly folds (default from config: {config.BACKTEST_FOLDS})")
+    parser.add_argument('--workers', type=int, default=None,
+                        help=f"Worker processes (default from config: {config.BACKTEST_WORKERS})")
+    parser.add_argument('--fetch-mode', choices=['pushdown', 'stream', 'collect'], default=None,
+                        help=f"Data fetch strategy (default from config: {config.FETCH_MODE})")
+    return parser.parse_args(argv)
+
+
+# Main execution
+if __name__ == "__main__":
+    args = parse_args()
+    best = HyperparameterSearch(folds=args.folds, workers=args.workers, fetch_mode=args.fetch_mode).run()
+    sys.exit(0 if best is not None else 1)
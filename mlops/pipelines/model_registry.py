@@ -0,0 +1,162 @@
+"""
+Model Registry
+
+Stores the trained models of the weekly pipeline:
+- Boosters are saved in xgboost's native UBJSON format and encoders as NumPy
+  arrays, so loading them does not unpickle whole sklearn objects
+- Artifacts are content-addressed (named by their SHA-256), so a model that did
+  not change is stored only once
+- Each registered version has a small JSON manifest with the data fingerprint,
+  metrics, timing and training state
+- A LATEST pointer file gives the newest version without listing the registry
+- Only the newest REGISTRY_KEEP_VERSIONS versions and their artifacts are kept
+"""
+
+import os
+import sys
+import io
+import json
+import hashlib
+import datetime
+import logging
+import numpy as np
+from xgboost import XGBRegressor
+
+# Import configuration
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import stock_update_config as config
+
+logger = logging.getLogger('model_registry')
+
+def write_atomic(path, data):
+    """Write bytes to a file through a temporary file so readers never see a partial write"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def arrays_digest(arrays):
+    """SHA-256 of a dict of arrays, independent of how the archive is written"""
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update(f"{name}:{array.dtype.str}:{array.shape}".encode('utf-8'))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+class ModelRegistry:
+    """Versioned, content-addressed storage for the demand models"""
+
+    def __init__(self, root=None):
+        """Initialize the registry under `root` (PATHS['REGISTRY'] by default)"""
+        self.root = root or config.PATHS['REGISTRY']
+        self.blobs_dir = os.path.join(self.root, 'blobs')
+        self.manifests_dir = os.path.join(self.root, 'manifests')
+        self.latest_path = os.path.join(self.root, 'LATEST')
+
+    def _ensure_dirs(self):
+        """Create the registry directories"""
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def put_blob(self, data, suffix, digest=None):
+        """Store bytes under their content hash and return the blob name"""
+        name = f"{digest or hashlib.sha256(data).hexdigest()}.{suffix}"
+        path = os.path.join(self.blobs_dir, name)
+        if not os.path.exists(path):
+            write_atomic(path, data)
+        return name
+
+    def put_booster(self, model):
+        """Store a model's booster in UBJSON format"""
+        return self.put_blob(bytes(model.get_booster().save_raw(raw_format='ubj')), 'ubj')
+
+    def put_arrays(self, arrays):
+        """Store a dict of arrays as an .npz archive"""
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return self.put_blob(buffer.getvalue(), 'npz', digest=arrays_digest(arrays))
+
+    def register(self, model, encoders, partition_models=None, **metadata):
+        """
+        Store a trained model, its encoder classes and optional partition models as
+        a new version, point LATEST at it and apply the retention policy.
+
+        `encoders` maps an encoder name to its classes array. Extra keyword arguments
+        (fingerprint, metrics, timing, training state) are recorded in the manifest.
+        """
+        self._ensure_dirs()
+        now = datetime.datetime.now()
+        manifest = {
+            'version': now.strftime('%Y%m%dT%H%M%S%f'),
+            'created': now.isoformat(),
+            'artifacts': {
+                'model': self.put_booster(model),
+                'encoders': self.put_arrays(encoders),
+                'partitions': {
+                    str(key): self.put_booster(partition_model)
+                    for key, partition_model in (partition_models or {}).items()
+                }
+            }
+        }
+        manifest.update(metadata)
+
+        manifest_path = os.path.join(self.manifests_dir, f"{manifest['version']}.json")
+        write_atomic(manifest_path, json.dumps(manifest, indent=2, default=str).encode('utf-8'))
+        write_atomic(self.latest_path, manifest['version'].encode('utf-8'))
+        logger.info(f"Registered model version {manifest['version']} ({manifest['artifacts']['model']})")
+
+        self.apply_retention()
+        return manifest
+
+    def latest(self):
+        """Manifest of the newest version, or None when nothing is registered"""
+        if not os.path.exists(self.latest_path):
+            return None
+        with open(self.latest_path, 'r', encoding='utf-8') as lf:
+            version = lf.read().strip()
+        return self.manifest(version)
+
+    def manifest(self, version):
+        """Manifest of a given version"""
+        with open(os.path.join(self.manifests_dir, f"{version}.json"), 'r', encoding='utf-8') as mf:
+            return json.load(mf)
+
+    def _load_booster(self, name):
+        """Load a stored booster into an XGBRegressor"""
+        model = XGBRegressor()
+        with open(os.path.join(self.blobs_dir, name), 'rb') as f:
+            model.load_model(bytearray(f.read()))
+        return model
+
+    def load_model(self, manifest):
+        """Load the global model of a version"""
+        return self._load_booster(manifest['artifacts']['model'])
+
+    def load_encoders(self, manifest):
+        """Load the encoder classes of a version as a dict of arrays"""
+        with np.load(os.path.join(self.blobs_dir, manifest['artifacts']['encoders'])) as archive:
+            return {name: archive[name] for name in archive.files}
+
+    def load_partition_models(self, manifest):
+        """Load the partition models of a version, keyed by partition"""
+        return {
+            key: self._load_booster(name)
+            for key, name in manifest['artifacts'].get('partitions', {}).items()
+        }
+
+    def apply_retention(self):
+        """Keep the newest REGISTRY_KEEP_VERSIONS manifests and delete unreferenced blobs"""
+        versions = sorted(name[:-len('.json')] for name in os.listdir(self.manifests_dir) if name.endswith('.json'))
+        for version in versions[:-config.REGISTRY_KEEP_VERSIONS]:
+            os.remove(os.path.join(self.manifests_dir, f"{version}.json"))
+            logger.info(f"Removed model version {version} (retention)")
+
+        referenced = set()
+        for version in versions[-config.REGISTRY_KEEP_VERSIONS:]:
+            artifacts = self.manifest(version)['artifacts']
+            referenced.update([artifacts['model'], artifacts['encoders']])
+            referenced.update(artifacts.get('partitions', {}).values())
+        for name in os.listdir(self.blobs_dir):
+            if name not in referenced and not name.endswith('.tmp'):
+                os.remove(os.path.join(self.blobs_dir, name))
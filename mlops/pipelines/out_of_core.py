@@ -0,0 +1,165 @@
+"""
+Out-of-Core Execution Helpers
+
+Support for running the weekly pipeline one group of locations at a time:
+- plan_location_groups / pack_location_counts pack locations into groups whose
+  rows fit MEMORY_BUDGET_MB, from the sales rows or from per-location row counts
+- SpillStore writes the intermediate frames of each group (sales, features,
+  forecast inputs) to Parquet files under a per-run spill directory
+- SpilledBatches streams the spilled feature files into xgboost's external-memory
+  matrix, so the global model is trained without holding the feature matrix in RAM
+"""
+
+import os
+import sys
+import shutil
+import datetime
+import logging
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+# Import configuration
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import stock_update_config as config
+
+logger = logging.getLogger('out_of_core')
+
+# ID and period columns spilled next to the features of each row
+ID_COLUMNS = 4
+
+# Working copies of a group held at once: the feature frame and the float64
+# training / scoring matrices built from it
+GROUP_FRAME_COPIES = 3
+
+def group_row_budget(n_features, budget_mb=None):
+    """Rows of a location group that fit the memory budget with `n_features` features"""
+    budget_mb = budget_mb or config.MEMORY_BUDGET_MB
+    bytes_per_row = (n_features + ID_COLUMNS + 1) * 8 * GROUP_FRAME_COPIES
+    return max(1, int(budget_mb * 1024 * 1024 // bytes_per_row))
+
+def plan_location_groups(location_ids, max_rows, extra_locations=None):
+    """
+    Pack locations, in ID order, into groups of at most `max_rows` sales rows.
+
+    `location_ids` has one entry per sales row; see pack_location_counts.
+    """
+    counts = pd.Series(np.asarray(location_ids)).value_counts(sort=False)
+    return pack_location_counts(counts, max_rows, extra_locations)
+
+def pack_location_counts(counts, max_rows, extra_locations=None):
+    """
+    Pack locations, in ID order, into groups of at most `max_rows` sales rows.
+
+    `counts` is a Series of sales rows indexed by location ID; `extra_locations`
+    (e.g. inventory locations without sales) are added with no rows. A location
+    larger than the budget gets a group of its own. Each group is a contiguous
+    range of the sorted location IDs. Returns a list of location ID arrays.
+    """
+    if extra_locations is not None:
+        missing = pd.Index(pd.unique(np.asarray(extra_locations))).difference(counts.index)
+        counts = pd.concat([counts, pd.Series(0, index=missing)])
+    counts = counts.sort_index()
+
+    groups, current, rows = [], [], 0
+    for location, n in counts.items():
+        if current and rows + n > max_rows:
+            groups.append(np.array(current))
+            current, rows = [], 0
+        if n > max_rows:
+            logger.warning(f"Location {location} has {n} rows, above the group budget of {max_rows} rows")
+        current.append(location)
+        rows += n
+    if current:
+        groups.append(np.array(current))
+    return groups
+
+class SpillStore:
+    """Per-run directory of spilled Parquet partitions"""
+
+    def __init__(self, root=None, run_id=None):
+        """Create the spill directory of a run under `root` (PATHS['SPILL'] by default)"""
+        run_id = run_id or datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        self.root = os.path.join(root or config.PATHS['SPILL'], run_id)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, stage, group):
+        """File of a stage's output for one group"""
+        return os.path.join(self.root, f'{stage}_{group:04d}.parquet')
+
+    def write(self, stage, group, df):
+        """Spill a group's frame; returns its path"""
+        path = self.path(stage, group)
+        df.to_parquet(path, index=False)
+        return path
+
+    def read(self, stage, group, columns=None):
+        """Read a spilled group frame back"""
+        return pd.read_parquet(self.path(stage, group), columns=columns)
+
+    def exists(self, stage, group):
+        """True if the group has a spilled frame for the stage"""
+        return os.path.exists(self.path(stage, group))
+
+    def cache_prefix(self, name):
+        """Prefix of xgboost's external-memory cache pages for one matrix"""
+        directory = os.path.join(self.root, 'xgb_cache')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, name)
+
+    def size_mb(self):
+        """Disk space used by the spill directory"""
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            total += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+        return total / (1024 * 1024)
+
+    def cleanup(self):
+        """Delete the spill directory"""
+        shutil.rmtree(self.root, ignore_errors=True)
+
+class SpilledBatches(xgb.DataIter):
+    """
+    Feed the rows of spilled feature files to an xgboost external-memory matrix,
+    one file (location group) per batch
+    """
+
+    def __init__(self, paths, features, target, cache_prefix, first_period=None, end_period=None, weights=None):
+        """
+        Iterate the rows with `first_period` <= period < `end_period` (None for no
+        bound). `weights`, if given, maps an array of YYYYMM periods to sample weights.
+        """
+        self.paths = list(paths)
+        self.features = list(features)
+        self.target = target
+        self.first_period = first_period
+        self.end_period = end_period
+        self.weights = weights
+        self._position = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        """Pass the next non-empty batch to xgboost; False when every file was read"""
+        while self._position < len(self.paths):
+            path = self.paths[self._position]
+            self._position += 1
+            df = pd.read_parquet(path, columns=list(dict.fromkeys(self.features + [self.target, 'year', 'month'])))
+            periods = df['year'].to_numpy(dtype=np.int64) * 100 + df['month'].to_numpy(dtype=np.int64)
+            rows = np.ones(len(df), dtype=bool)
+            if self.first_period is not None:
+                rows &= periods >= self.first_period
+            if self.end_period is not None:
+                rows &= periods < self.end_period
+            if not rows.any():
+                continue
+            input_data(
+                data=df[self.features].to_numpy(dtype=np.float64)[rows],
+                label=df[self.target].to_numpy(dtype=np.float64)[rows],
+                weight=None if self.weights is None else self.weights(periods[rows])
+            )
+            return True
+        return False
+
+    def reset(self):
+        """Restart from the first file"""
+        self._position = 0
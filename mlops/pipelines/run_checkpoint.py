@@ -0,0 +1,194 @@
+"""
+Pipeline Run Checkpoints
+
+Saves the output of each finished stage of a pipeline run so that a failed run
+can be resumed without repeating the stages that already finished:
+- Each run has a directory PATHS['RUNS']/<run ID> with a manifest.json listing
+  the completed stages, their outputs and the run's data fingerprint
+- DataFrames and Series are stored as Parquet, models in xgboost's UBJSON format,
+  arrays as .npy / .npz files and plain values (numbers, strings, dicts) in the manifest
+- Stages are marked completed only after all of their outputs are written, and
+  stages finishing concurrently update the manifest one at a time
+"""
+
+import os
+import sys
+import json
+import shutil
+import threading
+import datetime
+import logging
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor
+
+# Import configuration
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import stock_update_config as config
+
+logger = logging.getLogger('run_checkpoint')
+
+def write_json_atomic(path, obj):
+    """Write a JSON file through a temporary file so readers never see a partial write"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(obj, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+class RunCheckpoint:
+    """Stage outputs of one pipeline run, stored under its run directory"""
+
+    def __init__(self, run_id=None, root=None, resume=False):
+        """
+        Open the run `run_id`. With `resume=True` the run must exist and "latest"
+        selects the newest run; otherwise a new run (default ID: a timestamp) is created.
+        """
+        self.root = root or config.PATHS['RUNS']
+        if resume and run_id == 'latest':
+            runs = self.list_runs(self.root)
+            if not runs:
+                raise FileNotFoundError(f"No run to resume in {self.root}")
+            run_id = runs[-1]
+        self.run_id = run_id or datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+        self.directory = os.path.join(self.root, self.run_id)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self._lock = threading.Lock()
+
+        if resume:
+            if not os.path.exists(self.manifest_path):
+                raise FileNotFoundError(f"Run {self.run_id} has no checkpoint in {self.root}")
+            with open(self.manifest_path, 'r', encoding='utf-8') as mf:
+                self.manifest = json.load(mf)
+            logger.info(f"Resuming run {self.run_id}. Completed stages: {list(self.manifest['stages'])}")
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            self.manifest = {
+                'run_id': self.run_id,
+                'created': datetime.datetime.now().isoformat(),
+                'fingerprint': None,
+                'stages': {}
+            }
+            write_json_atomic(self.manifest_path, self.manifest)
+
+    @staticmethod
+    def list_runs(root=None):
+        """IDs of the runs with a checkpoint, oldest first"""
+        root = root or config.PATHS['RUNS']
+        if not os.path.isdir(root):
+            return []
+        return sorted(
+            name for name in os.listdir(root)
+            if os.path.exists(os.path.join(root, name, 'manifest.json'))
+        )
+
+    def completed(self, stage):
+        """True if the stage finished in this run"""
+        return stage in self.manifest['stages']
+
+    def path(self, name):
+        """Path of a file or directory inside the run directory"""
+        return os.path.join(self.directory, name)
+
+    def bind_fingerprint(self, fingerprint, stages):
+        """
+        Record the run's data fingerprint. When a resumed run was checkpointed with
+        another fingerprint, the given downstream `stages` are discarded and rerun.
+        """
+        with self._lock:
+            previous = self.manifest.get('fingerprint')
+            if previous is not None and previous != fingerprint:
+                stale = [stage for stage in stages if self.completed(stage)]
+                if stale:
+                    logger.warning(f"Training data or settings changed since run {self.run_id} was checkpointed. Rerunning {stale}")
+                for stage in stale:
+                    del self.manifest['stages'][stage]
+            self.manifest['fingerprint'] = fingerprint
+            write_json_atomic(self.manifest_path, self.manifest)
+
+    def _save_value(self, stage, name, value):
+        """Write one output and return its manifest entry"""
+        base = self.path(f'{stage}.{name}')
+        if isinstance(value, pd.DataFrame):
+            value.to_parquet(f'{base}.parquet', index=False)
+            return {'type': 'frame', 'file': f'{stage}.{name}.parquet'}
+        if isinstance(value, pd.Series):
+            value.to_frame(name='value').to_parquet(f'{base}.parquet')
+            return {'type': 'series', 'file': f'{stage}.{name}.parquet'}
+        if isinstance(value, XGBRegressor):
+            value.save_model(f'{base}.ubj')
+            return {'type': 'model', 'file': f'{stage}.{name}.ubj'}
+        if isinstance(value, np.ndarray):
+            np.save(f'{base}.npy', value)
+            return {'type': 'array', 'file': f'{stage}.{name}.npy'}
+        if isinstance(value, dict) and value and all(isinstance(v, XGBRegressor) for v in value.values()):
+            files = {}
+            for i, (key, model) in enumerate(value.items()):
+                model.save_model(f'{base}.{i}.ubj')
+                files[str(key)] = f'{stage}.{name}.{i}.ubj'
+            return {'type': 'models', 'files': files}
+        if isinstance(value, dict) and value and all(isinstance(v, np.ndarray) for v in value.values()):
+            np.savez(f'{base}.npz', **value)
+            return {'type': 'arrays', 'file': f'{stage}.{name}.npz'}
+        if isinstance(value, list) and value and all(isinstance(v, np.ndarray) for v in value):
+            np.savez(f'{base}.npz', *value)
+            return {'type': 'array_list', 'file': f'{stage}.{name}.npz', 'count': len(value)}
+        return {'type': 'value', 'value': value}
+
+    def _load_value(self, entry):
+        """Read one output back"""
+        kind = entry['type']
+        if kind == 'frame':
+            return pd.read_parquet(self.path(entry['file']))
+        if kind == 'series':
+            return pd.read_parquet(self.path(entry['file']))['value']
+        if kind == 'model':
+            model = XGBRegressor()
+            model.load_model(self.path(entry['file']))
+            return model
+        if kind == 'array':
+            return np.load(self.path(entry['file']), allow_pickle=False)
+        if kind == 'models':
+            models = {}
+            for key, name in entry['files'].items():
+                models[key] = XGBRegressor()
+                models[key].load_model(self.path(name))
+            return models
+        if kind == 'arrays':
+            with np.load(self.path(entry['file']), allow_pickle=False) as archive:
+                return {name: archive[name] for name in archive.files}
+        if kind == 'array_list':
+            with np.load(self.path(entry['file']), allow_pickle=False) as archive:
+                return [archive[f'arr_{i}'] for i in range(entry['count'])]
+        return entry['value']
+
+    def save(self, stage, **outputs):
+        """Write the outputs of a finished stage and mark it completed"""
+        entries = {name: self._save_value(stage, name, value) for name, value in outputs.items()}
+        with self._lock:
+            self.manifest['stages'][stage] = {
+                'completed': datetime.datetime.now().isoformat(),
+                'outputs': entries
+            }
+            write_json_atomic(self.manifest_path, self.manifest)
+        logger.info(f"Checkpointed stage '{stage}' of run {self.run_id}")
+
+    def load(self, stage, names=None):
+        """Outputs of a completed stage (only `names` if given) as a dict"""
+        entries = self.manifest['stages'][stage]['outputs']
+        return {
+            name: self._load_value(entry) for name, entry in entries.items()
+            if names is None or name in names
+        }
+
+    def remove(self):
+        """Delete the run directory (after the run succeeded)"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    @classmethod
+    def apply_retention(cls, root=None):
+        """Keep the checkpoints of the newest CHECKPOINT_KEEP_RUNS runs"""
+        root = root or config.PATHS['RUNS']
+        runs = cls.list_runs(root)
+        for run_id in runs[:-config.CHECKPOINT_KEEP_RUNS] if config.CHECKPOINT_KEEP_RUNS else runs:
+            shutil.rmtree(os.path.join(root, run_id), ignore_errors=True)
+            logger.info(f"Removed checkpoint of run {run_id} (retention)")
@@ -0,0 +1,271 @@
+"""
+Pipeline Stage DAG
+
+Runs the stages of a pipeline as a dependency graph instead of a fixed chain:
+- Each Stage declares the values it reads (inputs) and produces (outputs), plus
+  the stages it must follow without exchanging values (after)
+- Stages whose dependencies have finished run concurrently on a thread pool
+- A stage returns a dict with its outputs, or None when it failed. A failure
+  blocks the stages that depend on it; independent stages still run
+- Optional stages can be skipped per run, and any stage can be skipped by a
+  `when` condition; a skipped stage publishes None for each of its outputs
+- Restore / record hooks let a run load finished stages from a checkpoint and
+  checkpoint the stages it runs
+- Every stage is instrumented: wall time, CPU time, peak RSS growth and the row
+  counts of its inputs and outputs are returned in DAGResult.metrics
+"""
+
+import os
+import sys
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; peak memory is then reported as None
+    resource = None
+
+# Import configuration
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import stock_update_config as config
+
+logger = logging.getLogger('stage_dag')
+
+# Stage states that let the dependent stages run
+FINISHED = ('completed', 'restored', 'skipped')
+
+def peak_rss_mb():
+    """Peak resident set size of the process so far in MB, or None where it cannot be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def value_rows(values):
+    """Row counts of the frames, series and arrays among `values` (name -> rows)"""
+    rows = {}
+    for name, value in values.items():
+        shape = getattr(value, 'shape', None)
+        if shape:
+            rows[name] = int(shape[0])
+        elif isinstance(value, list) and value and all(getattr(v, 'shape', None) for v in value):
+            rows[name] = sum(int(v.shape[0]) for v in value)
+    return rows
+
+class Stage:
+    """One step of a pipeline and the values it exchanges with the other steps"""
+
+    def __init__(self, name, run, inputs=(), outputs=(), after=(), when=None,
+                 optional=False, checkpoint=True):
+        """
+        `run` is called with the `inputs` as keyword arguments and returns a dict
+        with every name in `outputs`, or None on failure. `when`, if given, receives
+        the values produced so far once the dependencies finished and returns False
+        to skip the stage. `optional` stages may be skipped per run; `checkpoint`
+        stages go through the DAG's restore / record hooks.
+        """
+        self.name = name
+        self.run = run
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.after = tuple(after)
+        self.when = when
+        self.optional = optional
+        self.checkpoint = checkpoint
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={list(self.inputs)}, outputs={list(self.outputs)})"
+
+class DAGResult:
+    """Values, per-stage state and per-stage metrics of a DAG run"""
+
+    def __init__(self, values, states, metrics, seconds):
+        self.values = values
+        # Stage name -> "completed", "restored", "skipped", "failed" or "blocked"
+        self.states = states
+        # Stage name -> metrics of the stages that ran or were restored (see StageDAG._execute)
+        self.metrics = metrics
+        self.seconds = seconds
+
+    @property
+    def failed(self):
+        """Stages that failed or were blocked by a failed dependency"""
+        return [name for name, state in self.states.items() if state in ('failed', 'blocked')]
+
+    @property
+    def success(self):
+        """True if no stage failed"""
+        return not self.failed
+
+class StageDAG:
+    """A set of stages executed in dependency order"""
+
+    def __init__(self, stages=()):
+        self.stages = {}
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage):
+        """Add a stage; its name and outputs must be unique"""
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage '{stage.name}'")
+        for output in stage.outputs:
+            producer = self.producer(output)
+            if producer is not None:
+                raise ValueError(f"Output '{output}' of stage '{stage.name}' is already produced by '{producer}'")
+        self.stages[stage.name] = stage
+        return stage
+
+    def producer(self, value):
+        """Name of the stage that produces `value`, or None"""
+        for stage in self.stages.values():
+            if value in stage.outputs:
+                return stage.name
+        return None
+
+    def dependencies(self, stage):
+        """Names of the stages `stage` waits for"""
+        names = [self.producer(value) for value in stage.inputs] + list(stage.after)
+        return list(dict.fromkeys(name for name in names if name is not None))
+
+    def validate(self, provided=()):
+        """
+        Check that every input is produced by a stage or `provided`, that every
+        `after` names a stage and that the graph has no cycle. Returns the stage
+        names in a dependency order.
+        """
+        for stage in self.stages.values():
+            for value in stage.inputs:
+                if value not in provided and self.producer(value) is None:
+                    raise ValueError(f"Input '{value}' of stage '{stage.name}' is neither produced nor provided")
+            for name in stage.after:
+                if name not in self.stages:
+                    raise ValueError(f"Stage '{stage.name}' runs after unknown stage '{name}'")
+        for value in provided:
+            if self.producer(value) is not None:
+                raise ValueError(f"Provided value '{value}' is also produced by stage '{self.producer(value)}'")
+
+        order, done = [], set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [name for name in remaining if set(self.dependencies(self.stages[name])) <= done]
+            if not ready:
+                raise ValueError(f"Stages {remaining} form a dependency cycle")
+            order.extend(ready)
+            done.update(ready)
+            remaining = [name for name in remaining if name not in done]
+        return order
+
+    def _execute(self, stage, inputs, restore, record, run_start):
+        """
+        Restore or run one stage in a worker thread; returns (state, outputs, metrics).
+
+        The metrics are the stage's start offset in the run and wall time, the CPU
+        time of its thread and of the whole process (which includes xgboost's native
+        threads, and any stage running at the same time), the growth of the process's
+        peak RSS while it ran, and the row counts of its inputs and outputs.
+        """
+        start = time.perf_counter()
+        thread_cpu = time.thread_time()
+        process_cpu = time.process_time()
+        peak_before = peak_rss_mb()
+        state, outputs = 'failed', {}
+        try:
+            restored = None
+            if stage.checkpoint and restore is not None:
+                restored = restore(stage.name)
+            if restored is not None:
+                state, outputs = 'restored', {name: restored.get(name) for name in stage.outputs}
+            else:
+                result = stage.run(**inputs)
+                missing = [] if result is None else [name for name in stage.outputs if name not in result]
+                if result is None:
+                    logger.error(f"Stage '{stage.name}' failed after {time.perf_counter() - start:.2f}s")
+                elif missing:
+                    logger.error(f"Stage '{stage.name}' did not produce {missing}")
+                else:
+                    outputs = {name: result[name] for name in stage.outputs}
+                    if stage.checkpoint and record is not None:
+                        record(stage.name, outputs)
+                    state = 'completed'
+
+        except Exception as e:
+            logger.error(f"Error in stage '{stage.name}': {e}")
+            state, outputs = 'failed', {}
+
+        peak_after = peak_rss_mb()
+        metrics = {
+            'start_seconds': start - run_start,
+            'wall_seconds': time.perf_counter() - start,
+            'cpu_seconds': time.thread_time() - thread_cpu,
+            'process_cpu_seconds': time.process_time() - process_cpu,
+            'peak_rss_mb': peak_after,
+            'peak_rss_delta_mb': None if peak_after is None else peak_after - peak_before,
+            'input_rows': value_rows(inputs),
+            'output_rows': value_rows(outputs)
+        }
+        if state != 'failed':
+            memory = '' if peak_after is None else f", peak RSS +{metrics['peak_rss_delta_mb']:.1f} MB"
+            logger.info(
+                f"Stage '{stage.name}' {state} in {metrics['wall_seconds']:.2f}s "
+                f"(CPU {metrics['cpu_seconds']:.2f}s{memory})"
+            )
+        return state, outputs, metrics
+
+    def run(self, values=None, skip=(), restore=None, record=None, max_workers=None):
+        """
+        Run every stage once its dependencies finished, up to `max_workers` at a time
+        (STAGE_PARALLELISM by default).
+
+        `values` provides inputs no stage produces. `skip` names optional stages not
+        to run. `restore(name)` returns the outputs of a checkpointed stage, or None
+        to run it; `record(name, outputs)` is called after a stage ran. Returns a
+        DAGResult with the metrics of every stage; it is not successful if any
+        stage failed or was blocked.
+        """
+        values = dict(values or {})
+        order = self.validate(values)
+        for name in skip:
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}'")
+            if not self.stages[name].optional:
+                raise ValueError(f"Stage '{name}' cannot be skipped")
+
+        states = {}
+        metrics = {}
+        running = {}
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers or config.STAGE_PARALLELISM)) as executor:
+            while len(states) < len(order):
+                for name in order:
+                    if name in states or name in running.values():
+                        continue
+                    stage = self.stages[name]
+                    dependencies = self.dependencies(stage)
+                    if any(states.get(dep) in ('failed', 'blocked') for dep in dependencies):
+                        blocked_by = [dep for dep in dependencies if states.get(dep) in ('failed', 'blocked')]
+                        logger.warning(f"Stage '{name}' not run: it depends on {blocked_by}")
+                        states[name] = 'blocked'
+                        continue
+                    if not all(states.get(dep) in FINISHED for dep in dependencies):
+                        continue
+                    if name in skip or (stage.when is not None and not stage.when(values)):
+                        logger.info(f"Stage '{name}' skipped")
+                        values.update({output: None for output in stage.outputs})
+                        states[name] = 'skipped'
+                        continue
+                    inputs = {value: values[value] for value in stage.inputs}
+                    running[executor.submit(self._execute, stage, inputs, restore, record, start)] = name
+
+                if not running:
+                    # Blocking and skipping may have made further stages ready
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    states[name], outputs, metrics[name] = future.result()
+                    values.update(outputs)
+
+        return DAGResult(values, states, metrics, time.perf_counter() - start)
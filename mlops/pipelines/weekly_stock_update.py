@@ -13,22 +13,35 @@ This script is designed to be run weekly via a scheduler.
 
 import os
 import sys
-import pickle
+import argparse
 import datetime
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import xgboost as xgb
 from xgboost import XGBRegressor
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import hana_ml
 import hana_ml.dataframe as dataframe
 from dotenv import load_dotenv
 import logging
 import json  # Add near imports
+import time
+import hashlib
+import functools
+import queue
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-# Import configuration
+# Import configuration and the model registry
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from config import stock_update_config as config
+from model_registry import ModelRegistry
+from category_dictionary import CategoryDictionary, UNKNOWN_CODE
+from feature_engine import FeatureEngine
+from out_of_core import SpillStore, SpilledBatches, group_row_budget, plan_location_groups, pack_location_counts
+from run_checkpoint import RunCheckpoint, write_json_atomic
+from stage_dag import Stage, StageDAG, peak_rss_mb
 
 # Configure logging
 logging.basicConfig(
@@ -41,12 +54,274 @@ logging.basicConfig(
 )
 logger = logging.getLogger('weekly_stock_update')
 
+# Columns fetched per table when COMPACT_DTYPES is enabled
+COMPACT_PROJECTION = {
+    'INVENTORY': ['INVENTARIO_ID', 'ARTICULO_ID', 'LOCATION_ID', 'STOCKACTUAL', 'STOCKMINIMO'],
+    'HISTORY': ['INVENTARIO_ID', 'ANIO', 'MES', 'EXPORTACION'],
+    'ARTICLE': ['ARTICULO_ID', 'CATEGORIA', 'TEMPORADA'],
+    'ORDERS_PRODUCTS': ['ORDEN_ID', 'INVENTARIO_ID', 'CANTIDAD'],
+    'ORDERS': ['ORDEN_ID', 'FECHACREACION', 'TIPOORDEN']
+}
+
+# Low-cardinality string columns stored as categoricals in compact mode
+CATEGORICAL_COLUMNS = ['CATEGORIA', 'TEMPORADA', 'TIPOORDEN']
+
+# Pipeline attributes set by the model stages
+MODEL_STATE = ['model', 'partition_models', 'train_timing', 'last_trained_period', 'warm_starts_since_rebuild']
+
+# Pipeline attributes saved with each checkpointed stage and restored when it is resumed
+CHECKPOINT_STATE = {
+    'fetch': ['df_inventory', 'article_categories', 'data_last_period', 'feature_lookback_months'],
+    'model': MODEL_STATE,
+    'evaluate': ['train_metrics'],
+    'out_of_core_model': MODEL_STATE + ['train_metrics'],
+    'write_back': ['write_back_summary']
+}
+
+# Stages that depend on the training fingerprint; a resumed run reruns them if it changed
+FINGERPRINTED_STAGES = [
+    'features', 'model', 'evaluate', 'predictions', 'out_of_core_model',
+    'stock_minimums', 'write_back', 'save'
+]
+
+# Columns of the long-format forecast (besides the predicted units)
+FORECAST_COLUMNS = [
+    'location_id', 'articulo_id', 'horizon', 'date', 'year', 'month',
+    'month_sin', 'month_cos', 'loc_enc', 'prod_enc'
+]
+
 def create_directory_if_not_exists(directory):
     """Create directory if it doesn't exist"""
     if not os.path.exists(directory):
         os.makedirs(directory)
         logger.info(f"Created directory: {directory}")
 
+def period_key(year, month):
+    """Encode a year and month (scalars or Series) as a sortable YYYYMM integer"""
+    if isinstance(year, pd.Series):
+        # Widen first: compact frames hold years as int16, which would overflow
+        return year.astype(np.int64) * 100 + month.astype(np.int64)
+    return int(year) * 100 + int(month)
+
+# sin / cos of each calendar month (index 1..12), looked up instead of recomputed per row
+MONTH_SIN = np.concatenate([[np.nan], np.sin(2 * np.pi * np.arange(12) / 12)])
+MONTH_COS = np.concatenate([[np.nan], np.cos(2 * np.pi * np.arange(12) / 12)])
+
+def compact_frame(df):
+    """
+    Downcast integer columns to the smallest integer type, floats to float32 and
+    low-cardinality string columns to categoricals
+    """
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if col in CATEGORICAL_COLUMNS:
+            df[col] = df[col].astype('category')
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif pd.api.types.is_float_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='float')
+    return df
+
+def log_frame_memory(stage, df):
+    """Log the in-memory size of the DataFrame produced by a pipeline stage"""
+    if df is not None:
+        size_mb = df.memory_usage(deep=True).sum() / (1024 * 1024)
+        logger.info(f"Memory after {stage}: {size_mb:.2f} MB ({len(df)} rows x {len(df.columns)} columns)")
+
+def fold_sales_batches(parts, keys):
+    """Combine Arrow record batches or tables into one EXPORTACION sum per key"""
+    tables = [pa.Table.from_batches([part]) if isinstance(part, pa.RecordBatch) else part for part in parts]
+    table = pa.concat_tables(tables) if len(tables) > 1 else tables[0]
+    folded = table.group_by(keys).aggregate([('EXPORTACION', 'sum')])
+    return folded.rename_columns(
+        [name if name != 'EXPORTACION_sum' else 'EXPORTACION' for name in folded.column_names]
+    ).select(keys + ['EXPORTACION'])
+
+# Winning parameters of the last hyperparameter search, loaded once by model_params
+TUNED_PARAMS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'best_model_params.json')
+_tuned_params = None
+
+def model_params():
+    """MODEL_PARAMS with the tuned parameters of the last search merged over them"""
+    global _tuned_params
+    if _tuned_params is None:
+        _tuned_params = {}
+        if config.USE_TUNED_PARAMS and os.path.exists(TUNED_PARAMS_PATH):
+            try:
+                with open(TUNED_PARAMS_PATH, 'r', encoding='utf-8') as tf:
+                    _tuned_params = json.load(tf)['params']
+                logger.info(f"Using tuned model parameters: {_tuned_params}")
+            except Exception as e:
+                logger.warning(f"Could not read tuned model parameters, using MODEL_PARAMS: {e}")
+    params = dict(config.MODEL_PARAMS)
+    params.update(_tuned_params)
+    return params
+
+def build_regressor(**overrides):
+    """Create an XGBRegressor from the model parameters, with optional overrides"""
+    params = model_params()
+    params.update(overrides)
+    return XGBRegressor(**params)
+
+def fit_regressor(X_train, y_train, train_periods, sample_weight=None, params=None):
+    """
+    Fit a regressor with the configured training profile.
+    
+    When EARLY_STOPPING_ROUNDS is set, the last VALIDATION_MONTHS training periods
+    are held out as a time-based validation slice to find the number of boosting
+    rounds, and the model is then refit on all training rows with that many rounds.
+    Returns the model and a dict with the fit time and rounds used.
+    """
+    params = dict(params or {})
+    start = time.perf_counter()
+    train_periods = np.asarray(train_periods)
+    n_estimators = params.pop('n_estimators', model_params().get('n_estimators', 100))
+    
+    if config.EARLY_STOPPING_ROUNDS:
+        cutoff = shift_period(int(train_periods.max()), -(config.VALIDATION_MONTHS - 1))
+        valid = train_periods >= cutoff
+        if valid.any() and (~valid).sum() > 10:
+            probe = build_regressor(
+                n_estimators=n_estimators,
+                early_stopping_rounds=config.EARLY_STOPPING_ROUNDS,
+                **params
+            )
+            probe.fit(
+                X_train[~valid], y_train[~valid],
+                sample_weight=None if sample_weight is None else sample_weight[~valid],
+                eval_set=[(X_train[valid], y_train[valid])],
+                verbose=False
+            )
+            n_estimators = probe.best_iteration + 1
+    
+    model = build_regressor(n_estimators=n_estimators, **params)
+    model.fit(X_train, y_train, sample_weight=sample_weight)
+    info = {
+        'fit_seconds': time.perf_counter() - start,
+        'rounds': model.get_booster().num_boosted_rounds()
+    }
+    return model, info
+
+def booster_params(params):
+    """Translate XGBRegressor parameters into native xgboost.train parameters"""
+    renames = {'random_state': 'seed', 'n_jobs': 'nthread'}
+    native = {'objective': 'reg:squarederror'}
+    for name, value in params.items():
+        if value is not None and name != 'n_estimators':
+            native[renames.get(name, name)] = value
+    return native
+
+def fit_regressor_external(batches, period_rows, params=None, xgb_model=None, first_period=None):
+    """
+    Out-of-core counterpart of fit_regressor with the same training profile.
+    
+    `batches(first, end, name)` returns an xgboost DataIter over the spilled training
+    rows with first <= period < end (None for no bound), and `period_rows` maps each
+    training period to its row count. The rows are streamed into external-memory
+    matrices instead of one in-memory array. With `xgb_model` (a booster), boosting
+    continues from it for n_estimators rounds on the periods from `first_period`
+    on, without early stopping.
+    Returns the model and a dict with the fit time and rounds used.
+    """
+    params = dict(params or {})
+    start = time.perf_counter()
+    merged = model_params()
+    merged.update(params)
+    n_estimators = merged.get('n_estimators', 100)
+    native = booster_params(merged)
+    max_bin = merged.get('max_bin')
+    
+    if config.EARLY_STOPPING_ROUNDS and xgb_model is None:
+        cutoff = shift_period(max(period_rows), -(config.VALIDATION_MONTHS - 1))
+        valid_rows = sum(rows for period, rows in period_rows.items() if period >= cutoff)
+        fit_rows = sum(period_rows.values()) - valid_rows
+        if valid_rows and fit_rows > 10:
+            probe_train = xgb.ExtMemQuantileDMatrix(batches(None, cutoff, 'probe'), max_bin=max_bin)
+            probe_valid = xgb.ExtMemQuantileDMatrix(batches(cutoff, None, 'validation'), max_bin=max_bin, ref=probe_train)
+            probe = xgb.train(
+                native, probe_train, n_estimators,
+                evals=[(probe_valid, 'validation')],
+                early_stopping_rounds=config.EARLY_STOPPING_ROUNDS,
+                verbose_eval=False
+            )
+            n_estimators = probe.best_iteration + 1
+            del probe_train, probe_valid
+    
+    train = xgb.ExtMemQuantileDMatrix(batches(first_period, None, 'train'), max_bin=max_bin)
+    booster = xgb.train(native, train, n_estimators, xgb_model=xgb_model)
+    # Wrap the booster like the in-memory path so registry and scoring code are shared
+    model = XGBRegressor()
+    model.load_model(bytearray(booster.save_raw(raw_format='ubj')))
+    info = {
+        'fit_seconds': time.perf_counter() - start,
+        'rounds': booster.num_boosted_rounds()
+    }
+    return model, info
+
+def recency_weights(train_periods, last_train=None):
+    """
+    Sample weight of each training row, halving every RECENCY_HALF_LIFE_MONTHS of
+    age relative to `last_train` (the newest of `train_periods` by default)
+    """
+    train_periods = np.asarray(train_periods, dtype=np.int64)
+    if last_train is None:
+        last_train = train_periods.max()
+    age = (last_train // 100 - train_periods // 100) * 12 + (last_train % 100 - train_periods % 100)
+    return np.power(0.5, age / config.RECENCY_HALF_LIFE_MONTHS)
+
+def row_hashes(df, columns):
+    """Hash of each row of the given columns, independent of compact or wide dtypes"""
+    return pd.util.hash_pandas_object(df[columns].astype(np.float64), index=False).to_numpy()
+
+def hashes_fingerprint(hashes):
+    """Order-independent hash of a set of row hashes (e.g. collected from several partitions)"""
+    return hashlib.sha256(np.sort(hashes).tobytes()).hexdigest()
+
+def frame_fingerprint(df, columns):
+    """
+    Content hash of the given columns, independent of row order and of the
+    compact or wide dtypes the frame happens to use
+    """
+    return hashes_fingerprint(row_hashes(df, columns))
+
+def fit_partition_model(job):
+    """Process pool worker: fit the model of one training partition on a single core"""
+    key, X, y, periods, sample_weight = job
+    model, info = fit_regressor(X, y, periods, sample_weight, params={'n_jobs': 1})
+    return key, model, info
+
+def shift_period(period, months):
+    """Move a YYYYMM period by a number of months"""
+    index = (period // 100) * 12 + (period % 100 - 1) + months
+    return (index // 12) * 100 + index % 12 + 1
+
+def reduce_to_grain(df, keys, aggregations, label):
+    """Collapse a table to one row per join key so it can be merged without fan-out"""
+    columns = [col for col in aggregations if col in df.columns]
+    reduced = df.groupby(keys, as_index=False, sort=False).agg({col: aggregations[col] for col in columns})
+    if len(reduced) < len(df):
+        logger.info(f"Reduced {label} from {len(df)} to {len(reduced)} rows at grain {keys}")
+    return reduced
+
+def guarded_merge(left, right, on, label, how='left', suffixes=('_x', '_y')):
+    """
+    Merge two DataFrames and abort if the join multiplies rows past MAX_JOIN_FANOUT.
+    
+    A join between inputs reduced to their key grain grows at most linearly, so the
+    result is compared against the larger of the two inputs.
+    """
+    merged = left.merge(right, on=on, how=how, suffixes=suffixes)
+    baseline = max(len(left), len(right), 1)
+    fanout = len(merged) / baseline
+    logger.info(f"Join {label}: {len(left)} x {len(right)} -> {len(merged)} rows (fan-out {fanout:.2f})")
+    if fanout > config.MAX_JOIN_FANOUT:
+        logger.error(
+            f"Join {label} multiplied rows by {fanout:.2f}, above the configured limit of "
+            f"{config.MAX_JOIN_FANOUT}. Check the join keys for duplicates."
+        )
+        raise ValueError(f"Join fan-out limit exceeded in {label}")
+    return merged
+
 # Ensure necessary directories exist
 create_directory_if_not_exists('../logs')
 create_directory_if_not_exists('../models')
@@ -55,16 +330,79 @@ create_directory_if_not_exists('../models/results')
 class WeeklyStockUpdate:
     """Class to handle weekly stock minimum updates based on ML predictions"""
     
-    def __init__(self):
+    def __init__(self, fetch_mode=None, full_refresh=False, training_strategy=None,
+                 training_partition=None, retrain_partitions=None, extra_history_months=0,
+                 force=False, forecast_horizon=None, incremental_features=True, execution_mode=None,
+                 resume_run=None, skip_stages=None):
         """Initialize the weekly stock update process"""
         self.conn = None
+        self._connection_args = None
+        # Stage checkpoints of this run, and the run ID to resume ("latest" for the newest)
+        self.checkpoint = None
+        self.resume_run = resume_run
+        # Optional stages not run this time (e.g. write_back for a dry run)
+        self.skip_stages = list(config.SKIP_STAGES if skip_stages is None else skip_stages)
         self.model = None
-        self.le_loc = None
-        self.le_prod = None
+        # Persistent ID -> code dictionaries, shared by every run and model version
+        self.loc_dict = CategoryDictionary('location')
+        self.prod_dict = CategoryDictionary('article')
         self.features = ['loc_enc', 'prod_enc', 'year', 'month', 'month_sin', 'month_cos']
         self.target = 'unidades_vendidas'
         self.safety_factor = config.SAFETY_FACTOR  # Load from config
-        
+        self.fetch_mode = fetch_mode or config.FETCH_MODE
+        # Fused columnar sales preparation (see prepare_sales_data_fast)
+        self.fast_prepare = config.FAST_PREPARE
+        # Rebuild the local sales cache from scratch instead of fetching from the watermark
+        self.full_refresh = full_refresh
+        # Current inventory snapshot (one row per article/location), filled by fetch_data
+        self.df_inventory = None
+        # Changed / unchanged / suppressed counts of the last write-back
+        self.write_back_summary = None
+        # "full" retrains from scratch, "warm_start" continues last week's model
+        self.training_strategy = training_strategy or config.TRAINING_STRATEGY
+        self.warm_start_model = None
+        self.warm_start_state = None
+        self.last_trained_period = None
+        self.warm_starts_since_rebuild = 0
+        # Optional per-location or per-category models next to the global one
+        self.training_partition = training_partition or config.TRAINING_PARTITION
+        # Partition keys to refit; the other partitions keep their saved model
+        self.retrain_partitions = set(retrain_partitions) if retrain_partitions else None
+        self.partition_models = {}
+        # ARTICULO_ID -> CATEGORIA, needed to partition by category
+        self.article_categories = None
+        # Months loaded before the training window (backtests evaluate older months)
+        self.extra_history_months = extra_history_months
+        # Retrain even when the training data fingerprint matches the saved model
+        self.force = force
+        self.fingerprint = None
+        # Versioned model storage, and the metrics and timing recorded with each version
+        self.registry = ModelRegistry()
+        self.train_metrics = {}
+        self.train_timing = {}
+        # Months forecast per pair, and the long-format forecast of the last prediction
+        self.forecast_horizon = forecast_horizon or config.FORECAST_HORIZON
+        self.df_forecast = None
+        # "in_memory" or "out_of_core" (one group of locations at a time, see run_pipeline_out_of_core)
+        self.execution_mode = execution_mode or config.EXECUTION_MODE
+        # Last sales period of the whole run. Set in out-of-core mode, where each location
+        # group only sees its own rows; otherwise every stage takes it from its input.
+        self.data_last_period = None
+        # Lag / rolling demand features. A full feature rebuild loads `lookback`
+        # extra months of history, which are dropped again after feature engineering.
+        # The incremental state covers every series at once, so out-of-core runs
+        # recompute the features of each location group from its lookback history.
+        self.feature_engine = None
+        self.feature_lookback_months = 0
+        if config.FEATURE_LAGS or config.FEATURE_ROLLING_WINDOWS:
+            self.feature_engine = FeatureEngine(
+                incremental=incremental_features and self.execution_mode != 'out_of_core',
+                rebuild=full_refresh
+            )
+            self.features = self.features + self.feature_engine.feature_names
+            if self.feature_engine.needs_rebuild():
+                self.feature_lookback_months = self.feature_engine.lookback
+
     def connect_to_database(self):
         """Connect to the HANA database"""
         try:            
@@ -80,12 +418,13 @@ class WeeklyStockUpdate:
                 port = 443
             
             logger.info("Connecting to database")
-            self.conn = dataframe.ConnectionContext(
-                address=host,
-                port=int(port),
-                user=os.getenv('DB_USERNAME'),
-                password=os.getenv('DB_PASSWORD')
-            )
+            self._connection_args = {
+                'address': host,
+                'port': int(port),
+                'user': os.getenv('DB_USERNAME'),
+                'password': os.getenv('DB_PASSWORD')
+            }
+            self.conn = dataframe.ConnectionContext(**self._connection_args)
             
             if self.conn.connection.isconnected():
                 logger.info(f"Successfully connected to database. Schema: {self.conn.get_current_schema()}")
@@ -98,31 +437,389 @@ class WeeklyStockUpdate:
             logger.error(f"Error connecting to database: {e}")
             return False
     
+    def collect_concurrently(self, jobs):
+        """
+        Run independent fetch jobs in parallel over a small pool of connections.
+        
+        `jobs` maps a name to a callable that receives a ConnectionContext and
+        returns a pandas DataFrame. Each job borrows one connection for its whole
+        duration, since a connection must not be shared between threads.
+        """
+        workers = max(1, min(config.FETCH_PARALLELISM, len(jobs)))
+        pool = queue.Queue()
+        pool.put(self.conn)
+        extra_connections = []
+        for _ in range(workers - 1):
+            try:
+                extra = dataframe.ConnectionContext(**self._connection_args)
+            except Exception as e:
+                logger.warning(f"Could not open an extra fetch connection, continuing with fewer: {e}")
+                break
+            extra_connections.append(extra)
+            pool.put(extra)
+        
+        def run_job(name, job):
+            conn = pool.get()
+            try:
+                start = time.perf_counter()
+                result = job(conn)
+                logger.info(f"Fetched {name}: {len(result)} rows in {time.perf_counter() - start:.2f}s")
+                return result
+            finally:
+                pool.put(conn)
+        
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {name: executor.submit(run_job, name, job) for name, job in jobs.items()}
+                results = {name: future.result() for name, future in futures.items()}
+        finally:
+            for extra in extra_connections:
+                extra.close()
+        logger.info(
+            f"Fetched {len(jobs)} tables in {time.perf_counter() - start:.2f}s "
+            f"using {1 + len(extra_connections)} connection(s)"
+        )
+        return results
+    
+    def _collect_table(self, conn, key):
+        """Collect a configured table, projected to the pipeline's columns in compact mode"""
+        table_df = conn.table(config.TABLES[key], schema=config.DB_SCHEMA)
+        if config.COMPACT_DTYPES:
+            table_df = table_df.select(*COMPACT_PROJECTION[key])
+        return table_df.collect()
+    
+    def _table_name(self, key):
+        """Return the fully qualified, quoted name of a configured table"""
+        return f'"{config.DB_SCHEMA}"."{config.TABLES[key]}"'
+    
     def fetch_data(self):
-        """Fetch required data from the database"""
+        """Fetch required data from the database using the configured fetch mode"""
+        if self.fetch_mode == 'collect':
+            df = self.fetch_data_collect()
+        elif self.fetch_mode in ('pushdown', 'stream'):
+            df = self.fetch_data_pushdown()
+        else:
+            logger.error(f"Unknown fetch mode: {self.fetch_mode}")
+            return None
+        
+        if df is not None and config.COMPACT_DTYPES:
+            df = compact_frame(df)
+            self.df_inventory = compact_frame(self.df_inventory)
+        return df
+    
+    def _sales_query(self, since=None, until=None, aggregate=True, locations=None):
+        """
+        Build the monthly sales query. `since` and `until` (YYYYMM) restrict the
+        periods to [since, until) and `locations` (first, last) the location IDs
+        to that range, so the filters are applied in HANA. With `aggregate=False`
+        the history rows are returned without grouping.
+        """
+        conditions = []
+        if since is not None:
+            conditions.append(f"H.ANIO * 100 + H.MES >= {int(since)}")
+        if until is not None:
+            conditions.append(f"H.ANIO * 100 + H.MES < {int(until)}")
+        if locations is not None:
+            conditions.append(f"I.LOCATION_ID BETWEEN {int(locations[0])} AND {int(locations[1])}")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        if not aggregate:
+            return f"""
+            SELECT I.ARTICULO_ID, I.LOCATION_ID, H.ANIO, H.MES, H.EXPORTACION
+            FROM {self._table_name('INVENTORY')} I
+            INNER JOIN {self._table_name('HISTORY')} H
+                ON H.INVENTARIO_ID = I.INVENTARIO_ID
+            {where}
+            """
+        return f"""
+            SELECT I.ARTICULO_ID, I.LOCATION_ID, H.ANIO, H.MES,
+                   SUM(H.EXPORTACION) AS EXPORTACION
+            FROM {self._table_name('INVENTORY')} I
+            INNER JOIN {self._table_name('HISTORY')} H
+                ON H.INVENTARIO_ID = I.INVENTARIO_ID
+            {where}
+            GROUP BY I.ARTICULO_ID, I.LOCATION_ID, H.ANIO, H.MES
+            """
+    
+    def stream_sales_aggregate(self, conn, since=None, locations=None):
+        """
+        Read the history rows through a cursor in chunks of STREAM_CHUNK_SIZE and
+        fold each chunk, as an Arrow record batch, into the monthly aggregate.
+        Memory is bounded by the chunk size and the number of groups instead of
+        the size of the history table. `since` and `locations` filter the rows
+        as in _sales_query.
+        """
+        keys = ['ARTICULO_ID', 'LOCATION_ID', 'ANIO', 'MES']
+        schema = pa.schema([(name, pa.int64()) for name in keys + ['EXPORTACION']])
+        chunk_size = config.STREAM_CHUNK_SIZE
+        
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(self._sales_query(since=since, aggregate=False, locations=locations))
+            partials = []
+            folded_rows = 0
+            pending_rows = 0
+            total_rows = 0
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                total_rows += len(rows)
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(column, type=pa.int64()) for column in zip(*rows)],
+                    schema=schema
+                )
+                partials.append(fold_sales_batches([batch], keys))
+                pending_rows += partials[-1].num_rows
+                # Fold the new partial aggregates into the running aggregate once they
+                # add up to a chunk, or to the aggregate's own size when it is larger,
+                # so the aggregate is not re-grouped after every chunk
+                if pending_rows >= max(chunk_size, folded_rows):
+                    partials = [fold_sales_batches(partials, keys)]
+                    folded_rows = partials[0].num_rows
+                    pending_rows = 0
+        finally:
+            cursor.close()
+        
+        if not partials:
+            return pd.DataFrame(columns=keys + ['EXPORTACION'])
+        df_sales = fold_sales_batches(partials, keys).to_pandas()
+        logger.info(f"Streamed {total_rows} history rows into {len(df_sales)} monthly aggregates")
+        return df_sales
+    
+    def _inventory_query(self):
+        """Query of the inventory snapshot the stock minimums are written back to"""
+        return f"""
+            SELECT INVENTARIO_ID, ARTICULO_ID, LOCATION_ID, STOCKACTUAL, STOCKMINIMO
+            FROM {self._table_name('INVENTORY')}
+            """
+    
+    def fetch_last_period(self):
+        """Return the last (YYYYMM) period with history in the database"""
+        query = f"""
+            SELECT MAX(ANIO * 100 + MES) AS PERIODO
+            FROM {self._table_name('HISTORY')}
+            """
+        result = self.conn.sql(query).collect()
+        last = result.iloc[0, 0]
+        return None if pd.isna(last) else int(last)
+    
+    def training_window_start(self, last_period):
+        """
+        First (YYYYMM) period needed to train and evaluate on the data ending at
+        `last_period`, or None when the full history should be used
+        """
+        if last_period is None:
+            return None
+        if config.TRAINING_WINDOW_MODE == 'decay':
+            # Oldest month whose recency weight is still above the minimum weight
+            months_back = int(np.floor(
+                config.RECENCY_HALF_LIFE_MONTHS * np.log2(1 / config.RECENCY_MIN_WEIGHT)
+            ))
+        elif config.TRAINING_MONTHS:
+            months_back = config.TRAINING_MONTHS
+        else:
+            return None
+        # The last period is the evaluation month, training uses the months before it
+        return shift_period(last_period, -months_back)
+    
+    def history_start(self, last_period, include_lookback=True):
+        """
+        First (YYYYMM) period to load: the training window plus any extra history,
+        and the feature lookback when the demand features are rebuilt
+        """
+        window_start = self.training_window_start(last_period)
+        if window_start is None:
+            return None
+        months_back = self.extra_history_months
+        if include_lookback:
+            months_back += self.feature_lookback_months
+        return shift_period(window_start, -months_back)
+    
+    def fetch_data_pushdown(self):
+        """
+        Fetch the monthly sales aggregate and the inventory snapshot, letting HANA
+        do the join and the group-by so only the aggregated rows are transferred
+        """
         try:
-            logger.info("Fetching data from database")
-            
-            # Get the real table names with correct case sensitivity
-            table_inventory = 'INVENTARIO2'
-            table_history = 'HISTORIALPRODUCTOS2'
-            table_article = 'ARTICULO2'
-            table_orders_products = 'ORDENESPRODUCTOS2'
-            table_orders = 'ORDENES2'
-            
-            # Load tables as HANA ML DataFrames
-            inventario_df = self.conn.table(table_inventory, schema='DBADMIN')
-            historial_df = self.conn.table(table_history, schema='DBADMIN')
-            articulo_df = self.conn.table(table_article, schema='DBADMIN')
-            ordenes_productos_df = self.conn.table(table_orders_products, schema='DBADMIN')
-            ordenes_df = self.conn.table(table_orders, schema='DBADMIN')
-            
-            # Convert to pandas DataFrames
-            inventario_pd = inventario_df.collect()
-            historial_pd = historial_df.collect()
-            articulo_pd = articulo_df.collect()
-            ordenes_productos_pd = ordenes_productos_df.collect()
-            ordenes_pd = ordenes_df.collect()
+            logger.info(f"Fetching aggregated sales data from database ({self.fetch_mode} mode)")
+            
+            window_start = self.history_start(self.fetch_last_period())
+            if window_start is not None:
+                logger.info(f"Training window starts at period {window_start}")
+            
+            # Only fetch the periods at or after the cache watermark
+            cache = None
+            if config.SALES_CACHE_ENABLED and not self.full_refresh:
+                cache = self.load_sales_cache_state()
+                # The cache covers the periods from the start it was built for (None: the full
+                # history); a window reaching further back needs the older periods fetched
+                if cache is not None and cache['start'] is not None and (
+                        window_start is None or window_start < cache['start']):
+                    logger.info("Training window starts before the cached window. Rebuilding the sales cache")
+                    cache = None
+            elif self.full_refresh:
+                logger.info("Full refresh requested. Rebuilding the sales cache from scratch")
+            
+            since = cache['watermark'] if cache is not None else window_start
+            
+            inventory_query = self._inventory_query()
+            article_query = f"""
+            SELECT ARTICULO_ID, CATEGORIA
+            FROM {self._table_name('ARTICLE')}
+            """
+            
+            if self.fetch_mode == 'stream':
+                fetch_sales = lambda conn: self.stream_sales_aggregate(conn, since=since)
+            else:
+                sales_query = self._sales_query(since=since)
+                fetch_sales = lambda conn: conn.sql(sales_query).collect()
+            jobs = {
+                'monthly sales': fetch_sales,
+                'inventory': lambda conn: conn.sql(inventory_query).collect()
+            }
+            if self.training_partition == 'category':
+                jobs['articles'] = lambda conn: conn.sql(article_query).collect()
+            fetched = self.collect_concurrently(jobs)
+            df_fetched = fetched['monthly sales']
+            df_inventory = fetched['inventory']
+            
+            self.df_inventory = df_inventory.drop_duplicates(subset=['ARTICULO_ID', 'LOCATION_ID'])
+            if 'articles' in fetched:
+                self.article_categories = self._article_category_map(fetched['articles'])
+            
+            logger.info(f"Data fetched successfully. Inventory rows: {len(df_inventory)}")
+            logger.info(f"Aggregated sales rows fetched: {len(df_fetched)}")
+            
+            if config.SALES_CACHE_ENABLED:
+                self.save_sales_cache(df_fetched, reset=cache is None, start=window_start)
+            
+            if cache is not None:
+                # Fetched periods replace their cached version, older periods inside
+                # the training window are read back from the cache
+                df_cached = self.load_sales_cache(since=window_start, until=cache['watermark'])
+                df_sales = pd.concat([df_cached, df_fetched], ignore_index=True)
+            else:
+                df_sales = df_fetched
+            
+            logger.info(f"Aggregated sales rows: {len(df_sales)}")
+            return df_sales
+        
+        except Exception as e:
+            logger.error(f"Error fetching data: {e}")
+            return None
+    
+    def _sales_cache_files(self):
+        """Map each cached period (YYYYMM) to its Parquet file"""
+        files = {}
+        if os.path.isdir(config.PATHS['CACHE']):
+            for name in os.listdir(config.PATHS['CACHE']):
+                if name.startswith('monthly_sales_') and name.endswith('.parquet'):
+                    files[int(name[len('monthly_sales_'):-len('.parquet')])] = os.path.join(config.PATHS['CACHE'], name)
+        return files
+    
+    def load_sales_cache_state(self):
+        """
+        Return the cache watermark, the first cached period and the start period
+        the cache was built for (YYYYMM; None for the full history), or None when
+        there is no usable cache
+        """
+        watermark_path = os.path.join(config.PATHS['CACHE'], 'sales_watermark.json')
+        try:
+            files = self._sales_cache_files()
+            if not files or not os.path.exists(watermark_path):
+                logger.info("No sales cache found. Fetching every period in the training window")
+                return None
+            
+            with open(watermark_path, 'r', encoding='utf-8') as wf:
+                mark = json.load(wf)
+            if 'start' not in mark:
+                logger.info("Sales cache does not record its window start. Rebuilding the sales cache")
+                return None
+            watermark = period_key(mark['ANIO'], mark['MES'])
+            
+            logger.info(f"Sales cache holds {len(files)} periods. Watermark: {mark['ANIO']}-{mark['MES']:02d}")
+            return {'watermark': watermark, 'first': min(files), 'start': mark['start']}
+        
+        except Exception as e:
+            logger.warning(f"Could not read sales cache, fetching every period in the training window: {e}")
+            return None
+    
+    def load_sales_cache(self, since=None, until=None):
+        """Read the cached monthly sales for the periods in [since, until) only"""
+        files = self._sales_cache_files()
+        selected = [
+            files[period] for period in sorted(files)
+            if (since is None or period >= since) and (until is None or period < until)
+        ]
+        if not selected:
+            return pd.DataFrame(columns=['ARTICULO_ID', 'LOCATION_ID', 'ANIO', 'MES', 'EXPORTACION'])
+        df_cached = pd.concat([pd.read_parquet(path) for path in selected], ignore_index=True)
+        logger.info(f"Loaded {len(df_cached)} cached sales rows from {len(selected)} periods")
+        return df_cached
+    
+    def save_sales_cache(self, df_fetched, reset=False, start=None):
+        """
+        Write each fetched period to its own Parquet file and move the watermark to
+        the last period. With `reset` the previously cached periods are discarded
+        and the cache is marked as built from `start` (YYYYMM; None for the full
+        history); otherwise the start recorded by the last reset is kept.
+        """
+        try:
+            create_directory_if_not_exists(config.PATHS['CACHE'])
+            watermark_path = os.path.join(config.PATHS['CACHE'], 'sales_watermark.json')
+            
+            if not reset:
+                with open(watermark_path, 'r', encoding='utf-8') as wf:
+                    start = json.load(wf)['start']
+            if reset:
+                for path in self._sales_cache_files().values():
+                    os.remove(path)
+            if len(df_fetched) == 0:
+                return
+            
+            periods = period_key(df_fetched['ANIO'], df_fetched['MES'])
+            for period, df_period in df_fetched.groupby(periods):
+                path = os.path.join(config.PATHS['CACHE'], f'monthly_sales_{period}.parquet')
+                # Write to a temporary file first so an interrupted run never leaves a torn period
+                df_period.to_parquet(path + '.tmp', index=False)
+                os.replace(path + '.tmp', path)
+            
+            last = int(periods.max())
+            mark = {
+                'ANIO': last // 100,
+                'MES': last % 100,
+                'start': None if start is None else int(start),
+                'updated': datetime.datetime.now().isoformat()
+            }
+            with open(watermark_path + '.tmp', 'w', encoding='utf-8') as wf:
+                json.dump(mark, wf, indent=2)
+            os.replace(watermark_path + '.tmp', watermark_path)
+            
+            logger.info(f"Sales cache saved. Watermark: {mark['ANIO']}-{mark['MES']:02d}")
+        
+        except Exception as e:
+            logger.warning(f"Could not save sales cache: {e}")
+    
+    def fetch_data_collect(self):
+        """Fetch the full tables from the database and merge them in pandas"""
+        try:
+            logger.info("Fetching data from database (collect mode)")
+            
+            # Collect the tables as pandas DataFrames, in parallel when configured
+            tables = {
+                key: config.TABLES[key]
+                for key in ['INVENTORY', 'HISTORY', 'ARTICLE', 'ORDERS_PRODUCTS', 'ORDERS']
+            }
+            fetched = self.collect_concurrently({
+                table: (lambda conn, key=key: self._collect_table(conn, key))
+                for key, table in tables.items()
+            })
+            inventario_pd = fetched[tables['INVENTORY']]
+            historial_pd = fetched[tables['HISTORY']]
+            articulo_pd = fetched[tables['ARTICLE']]
+            ordenes_productos_pd = fetched[tables['ORDERS_PRODUCTS']]
+            ordenes_pd = fetched[tables['ORDERS']]
             
             logger.info(f"Data fetched successfully. Inventory rows: {len(inventario_pd)}")
             
@@ -131,28 +828,70 @@ class WeeklyStockUpdate:
             articulo_id_col = [col for col in articulo_pd.columns if col.upper() == 'ARTICULO_ID'][0]
             orden_id_col = [col for col in ordenes_pd.columns if col.upper() == 'ORDEN_ID'][0]
             
-            # Merge DataFrames (use left joins to retain inventory even if no matching records)
-            df = inventario_pd.merge(historial_pd, on=inventario_id_col, how='left') \
-                          .merge(articulo_pd, on=articulo_id_col, how='left') \
-                          .merge(ordenes_productos_pd, on=inventario_id_col, how='left') \
-                          .merge(ordenes_pd, on=orden_id_col, how='left')
+            # Reduce each child table to the grain of its join key before merging, so that
+            # history months are not repeated for every order line of the same inventory
+            historial_pd = reduce_to_grain(
+                historial_pd,
+                [inventario_id_col, 'ANIO', 'MES'],
+                {'IMPORTACION': 'sum', 'EXPORTACION': 'sum', 'STOCKSTART': 'first', 'STOCKEND': 'last'},
+                'history'
+            )
+            articulo_pd = reduce_to_grain(
+                articulo_pd,
+                [articulo_id_col],
+                {'CATEGORIA': 'first', 'PRECIOPROVEEDOR': 'first', 'PRECIOVENTA': 'first', 'TEMPORADA': 'first'},
+                'article'
+            )
+            # Order lines join their order header first (many-to-one), then collapse to
+            # one row per inventory: total quantity, mean price and the latest order
+            ordenes_pd = reduce_to_grain(
+                ordenes_pd,
+                [orden_id_col],
+                {'FECHACREACION': 'first', 'FECHAENTREGA': 'first', 'TIPOORDEN': 'first'},
+                'orders'
+            )
+            lineas_pd = guarded_merge(ordenes_productos_pd, ordenes_pd, orden_id_col, 'order lines -> orders')
+            lineas_pd = lineas_pd.sort_values('FECHACREACION', kind='stable')
+            ordenes_inventario_pd = reduce_to_grain(
+                lineas_pd,
+                [inventario_id_col],
+                {
+                    'CANTIDAD': 'sum',
+                    'PRECIOUNITARIO': 'mean',
+                    'FECHACREACION': 'last',
+                    'FECHAENTREGA': 'last',
+                    'TIPOORDEN': 'last'
+                },
+                'order lines'
+            )
             
-            # Clean up column names and select relevant ones
-            df_clean = df[[
+            # Merge DataFrames (use left joins to retain inventory even if no matching records).
+            # Inventory columns keep their names; the history movement columns get a _HIST suffix.
+            historial_pd = historial_pd.rename(columns={
+                'IMPORTACION': 'IMPORTACION_HIST',
+                'EXPORTACION': 'EXPORTACION_HIST'
+            })
+            df = guarded_merge(inventario_pd, historial_pd, inventario_id_col, 'inventory -> history')
+            df = guarded_merge(df, articulo_pd, articulo_id_col, 'inventory -> article')
+            df = guarded_merge(df, ordenes_inventario_pd, inventario_id_col, 'inventory -> orders')
+            
+            # Clean up column names and select relevant ones (only a subset of them
+            # is fetched when COMPACT_DTYPES projects the tables)
+            df_clean = df[[col for col in [
                 'INVENTARIO_ID',
                 'ARTICULO_ID', 
-                'LOCATION_ID_x',  # Using _x version from inventario table
+                'LOCATION_ID',
                 'STOCKACTUAL',
                 'STOCKMINIMO',
                 'STOCKRECOMENDADO',
                 'MARGENGANANCIA',
-                'TIEMPOREPOSICION_x',
+                'TIEMPOREPOSICION',
                 'STOCKSEGURIDAD',
                 'DEMANDAPROMEDIO',
                 'ANIO',
                 'MES', 
-                'IMPORTACION_y',  # Using _y version from historial table
-                'EXPORTACION_y',
+                'IMPORTACION_HIST',  # Using the historial version of the movement columns
+                'EXPORTACION_HIST',
                 'STOCKSTART',
                 'STOCKEND',
                 'CATEGORIA',
@@ -164,16 +903,20 @@ class WeeklyStockUpdate:
                 'FECHACREACION',
                 'FECHAENTREGA',
                 'TIPOORDEN'
-            ]].copy()
+            ] if col in df.columns]].copy()
             
             # Rename columns to remove suffixes and have consistent naming
             df_clean = df_clean.rename(columns={
-                'LOCATION_ID_x': 'LOCATION_ID',
-                'IMPORTACION_y': 'IMPORTACION',
-                'EXPORTACION_y': 'EXPORTACION',
-                'TIEMPOREPOSICION_x': 'TIEMPOREPOSICION'
+                'IMPORTACION_HIST': 'IMPORTACION',
+                'EXPORTACION_HIST': 'EXPORTACION'
             })
             
+            self.df_inventory = df_clean[
+                ['INVENTARIO_ID', 'ARTICULO_ID', 'LOCATION_ID', 'STOCKACTUAL', 'STOCKMINIMO']
+            ].drop_duplicates(subset=['ARTICULO_ID', 'LOCATION_ID'])
+            if 'CATEGORIA' in df_clean.columns:
+                self.article_categories = self._article_category_map(df_clean)
+            
             logger.info(f"Data processed successfully. Final rows: {len(df_clean)}")
             return df_clean
         
@@ -181,8 +924,15 @@ class WeeklyStockUpdate:
             logger.error(f"Error fetching data: {e}")
             return None
     
+    def _article_category_map(self, df):
+        """Build the ARTICULO_ID -> CATEGORIA lookup used to partition by category"""
+        articles = df[['ARTICULO_ID', 'CATEGORIA']].drop_duplicates(subset=['ARTICULO_ID'])
+        return pd.Series(articles['CATEGORIA'].astype(object).to_numpy(), index=articles['ARTICULO_ID'].to_numpy())
+    
     def prepare_sales_data(self, df):
         """Prepare sales data for modeling"""
+        if self.fast_prepare:
+            return self.prepare_sales_data_fast(df)
         try:
             logger.info("Preparing sales data for modeling")
             
@@ -208,6 +958,13 @@ class WeeklyStockUpdate:
                 df_ventas_agrupado['month'].astype(str).str.zfill(2) + '-01'
             )
             
+            # Keep only the training window (already applied by the query in pushdown mode)
+            periods = period_key(df_ventas_agrupado['year'], df_ventas_agrupado['month'])
+            if len(periods) > 0:
+                window_start = self.history_start(self.data_last_period or int(periods.max()))
+                if window_start is not None:
+                    df_ventas_agrupado = df_ventas_agrupado[periods >= window_start].reset_index(drop=True)
+            
             logger.info(f"Sales data prepared. Records: {len(df_ventas_agrupado)}")
             return df_ventas_agrupado
         
@@ -215,23 +972,117 @@ class WeeklyStockUpdate:
             logger.error(f"Error preparing sales data: {e}")
             return None
     
-    def perform_feature_engineering(self, df_sales):
-        """Perform feature engineering for the model"""
+    def prepare_sales_data_fast(self, df):
+        """
+        Fused columnar version of prepare_sales_data: trims the training window,
+        sums the units per (article, location, month) and builds the date and
+        cyclic month columns in one pass over NumPy arrays, without copying the
+        input frame or formatting and parsing date strings
+        """
+        try:
+            logger.info("Preparing sales data for modeling (fast path)")
+            
+            year = df['ANIO'].to_numpy()
+            month = df['MES'].to_numpy()
+            units = df['EXPORTACION'].to_numpy()
+            
+            # Sorted integer codes per key; rows with a missing key are dropped like groupby does.
+            # Collect mode's left join also yields inventory rows without sales, whose year,
+            # month and units are NaN; drop them before the month keys are cast to integers.
+            art_codes, art_values = pd.factorize(df['ARTICULO_ID'].to_numpy(), sort=True)
+            loc_codes, loc_values = pd.factorize(df['LOCATION_ID'].to_numpy(), sort=True)
+            valid = (art_codes >= 0) & (loc_codes >= 0)
+            for column in (year, month, units):
+                if column.dtype.kind == 'f':
+                    valid &= np.isfinite(column)
+            months = np.where(valid, year, 0).astype(np.int64) * 12 + np.where(valid, month, 1).astype(np.int64) - 1
+            
+            # Keep only the training window (already applied by the query in pushdown mode)
+            if valid.any():
+                last_period = self.data_last_period
+                if last_period is None:
+                    last = int(months[valid].max())
+                    last_period = (last // 12) * 100 + last % 12 + 1
+                window_start = self.history_start(last_period)
+                if window_start is not None:
+                    valid &= months >= (window_start // 100) * 12 + window_start % 100 - 1
+            if not valid.all():
+                art_codes, loc_codes, months, units = art_codes[valid], loc_codes[valid], months[valid], units[valid]
+            
+            # One int64 group key ordered like (article, location, year, month)
+            first_month = int(months.min()) if len(months) > 0 else 0
+            span = int(months.max()) - first_month + 1 if len(months) > 0 else 1
+            group_key = (art_codes.astype(np.int64) * len(loc_values) + loc_codes) * span + (months - first_month)
+            group_codes, groups = pd.factorize(group_key, sort=True)
+            weights = units.astype(np.float64)
+            totals = np.bincount(group_codes, weights=weights, minlength=len(groups))
+            # Same result dtype as a pandas group sum
+            if units.dtype.kind in 'iub':
+                totals = totals.astype(np.int64)
+            elif units.dtype.kind == 'f':
+                totals = totals.astype(units.dtype, copy=False)
+            
+            group_months = groups % span + first_month
+            group_series = groups // span
+            group_year = group_months // 12
+            group_month = group_months % 12 + 1
+            df_ventas_agrupado = pd.DataFrame({
+                'articulo_id': art_values[group_series // len(loc_values)],
+                'location_id': loc_values[group_series % len(loc_values)],
+                # Integer keys keep their dtype; float keys (NaN rows dropped above) become int64
+                'year': group_year.astype(year.dtype if year.dtype.kind in 'iu' else np.int64, copy=False),
+                'month': group_month.astype(month.dtype if month.dtype.kind in 'iu' else np.int64, copy=False),
+                'unidades_vendidas': totals,
+                'date': (group_months - 1970 * 12).astype('datetime64[M]').astype('datetime64[ns]'),
+                'month_sin': MONTH_SIN[group_month],
+                'month_cos': MONTH_COS[group_month]
+            })
+            
+            logger.info(f"Sales data prepared. Records: {len(df_ventas_agrupado)}")
+            return df_ventas_agrupado
+        
+        except Exception as e:
+            logger.error(f"Error preparing sales data: {e}")
+            return None
+    
+    def perform_feature_engineering(self, df_sales, load_warm_start=True):
+        """
+        Perform feature engineering for the model. `load_warm_start=False` skips
+        loading the warm-start model (out-of-core runs load it once for all groups).
+        """
         try:
             logger.info("Performing feature engineering")
             
-            # Create copy for modeling
-            df_model = df_sales.copy()
+            if self.fast_prepare:
+                # The fast path already built the cyclic month columns on a frame it owns
+                df_model = df_sales
+            else:
+                # Create copy for modeling
+                df_model = df_sales.copy()
+                
+                # Cyclic transformations for month (capture seasonality)
+                df_model['month_sin'] = np.sin(2 * np.pi * (df_model['month'] - 1) / 12)
+                df_model['month_cos'] = np.cos(2 * np.pi * (df_model['month'] - 1) / 12)
             
-            # Cyclic transformations for month (capture seasonality)
-            df_model['month_sin'] = np.sin(2 * np.pi * (df_model['month'] - 1) / 12)
-            df_model['month_cos'] = np.cos(2 * np.pi * (df_model['month'] - 1) / 12)
+            # Encode locations and articles with the persistent dictionaries. Codes never
+            # change, so new IDs only append codes and previous models stay valid.
+            self.loc_dict.update(df_model['location_id'].unique())
+            self.prod_dict.update(df_model['articulo_id'].unique())
+            df_model['loc_enc'] = self.loc_dict.encode(df_model['location_id'].to_numpy())
+            df_model['prod_enc'] = self.prod_dict.encode(df_model['articulo_id'].to_numpy())
             
-            # Apply encoding to categorical variables
-            self.le_loc = LabelEncoder()
-            self.le_prod = LabelEncoder()
-            df_model['loc_enc'] = self.le_loc.fit_transform(df_model['location_id'])
-            df_model['prod_enc'] = self.le_prod.fit_transform(df_model['articulo_id'])
+            # Lag / rolling demand features, computed incrementally when possible
+            if self.feature_engine is not None:
+                df_model = self.feature_engine.add_features(df_model, last_period=self.data_last_period)
+                if self.feature_lookback_months:
+                    # The lookback months were only loaded to compute the features
+                    periods = period_key(df_model['year'], df_model['month'])
+                    first = self.history_start(self.data_last_period or int(periods.max()), include_lookback=False)
+                    if first is not None:
+                        df_model = df_model[periods >= first].reset_index(drop=True)
+            
+            if self.training_strategy == 'warm_start' and load_warm_start:
+                self.prepare_warm_start()
             
             logger.info(f"Feature engineering completed. Features: {self.features}")
             return df_model
@@ -240,8 +1091,116 @@ class WeeklyStockUpdate:
             logger.error(f"Error in feature engineering: {e}")
             return None
     
+    def sales_row_hashes(self, df_sales):
+        """Row hashes of the aggregated sales that enter the training fingerprint"""
+        # Lookback months loaded for a feature rebuild are not part of the training set
+        periods = period_key(df_sales['year'], df_sales['month'])
+        if self.feature_lookback_months and len(periods) > 0:
+            first = self.history_start(self.data_last_period or int(periods.max()), include_lookback=False)
+            if first is not None:
+                df_sales = df_sales[periods >= first]
+        return row_hashes(df_sales, ['articulo_id', 'location_id', 'year', 'month', 'unidades_vendidas'])
+    
+    def training_fingerprint(self, df_sales=None, sales_hashes=None):
+        """
+        Hash everything that determines the trained model and its predictions: the
+        aggregated sales, the inventory pairs to score, the model parameters and
+        the training settings. Out-of-core runs pass the `sales_hashes` collected
+        from every location group instead of the sales frame.
+        """
+        if sales_hashes is None:
+            sales_hashes = self.sales_row_hashes(df_sales)
+        settings = {
+            'features': self.features,
+            'model_params': model_params(),
+            'training_strategy': self.training_strategy,
+            'training_partition': self.training_partition,
+            'training_months': config.TRAINING_MONTHS,
+            'training_window_mode': config.TRAINING_WINDOW_MODE,
+            'recency': [config.RECENCY_HALF_LIFE_MONTHS, config.RECENCY_MIN_WEIGHT],
+            'early_stopping': [config.EARLY_STOPPING_ROUNDS, config.VALIDATION_MONTHS],
+            'min_partition_rows': config.MIN_PARTITION_ROWS,
+            'forecast_horizon': self.forecast_horizon,
+            'execution_mode': self.execution_mode
+        }
+        parts = [
+            hashes_fingerprint(sales_hashes),
+            json.dumps(settings, sort_keys=True, default=str)
+        ]
+        if self.df_inventory is not None:
+            parts.append(frame_fingerprint(self.df_inventory, ['LOCATION_ID', 'ARTICULO_ID']))
+        return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+    
+    def load_memoized_predictions(self, fingerprint):
+        """
+        Return the saved multi-horizon forecast when the last saved model was
+        trained on data with the same fingerprint, otherwise None
+        """
+        try:
+            state = self.registry.latest()
+            if state is None:
+                return None
+            if state.get('fingerprint') != fingerprint or not os.path.exists(state.get('forecast_path') or ''):
+                return None
+            
+            self.df_forecast = pd.read_csv(state['forecast_path'], parse_dates=['date'])
+            self.model = self.registry.load_model(state)
+            self.last_trained_period = state['last_trained_period']
+            self.warm_starts_since_rebuild = state['warm_starts_since_rebuild']
+            logger.info(
+                f"Training data unchanged since model version {state['version']}. "
+                f"Reusing the saved model and predictions"
+            )
+            # Stock minimums are recalculated from the current inventory
+            return self.df_forecast
+        except Exception as e:
+            logger.warning(f"Could not reuse the saved predictions, retraining: {e}")
+            return None
+    
+    def prepare_warm_start(self):
+        """
+        Load the latest saved model for warm-start training.
+        
+        Falls back to a full rebuild when there is no saved state, when the model
+        has been warm-started WARM_START_MAX_RUNS times in a row, or when the
+        dictionaries no longer extend the codes the model was trained with.
+        """
+        self.warm_start_model = None
+        self.warm_start_state = None
+        try:
+            state = self.registry.latest()
+            if state is None:
+                logger.info("No registered model. Training from scratch")
+                return
+            
+            if state['warm_starts_since_rebuild'] >= config.WARM_START_MAX_RUNS:
+                logger.info(
+                    f"Model was warm-started {state['warm_starts_since_rebuild']} times in a row. "
+                    f"Rebuilding from scratch"
+                )
+                return
+            
+            if state.get('features') != self.features:
+                logger.info("Feature set changed since the last model. Rebuilding from scratch")
+                return
+            
+            encoders = self.registry.load_encoders(state)
+            if not (self.loc_dict.extends(encoders['location']) and self.prod_dict.extends(encoders['product'])):
+                logger.info("Dictionary codes changed since the last model. Rebuilding from scratch")
+                return
+            
+            self.warm_start_model = self.registry.load_model(state)
+            self.warm_start_state = state
+            logger.info(
+                f"Warm start from model version {state['version']} "
+                f"(trained up to period {state['last_trained_period']})"
+            )
+        
+        except Exception as e:
+            logger.warning(f"Could not load the previous model, training from scratch: {e}")
+    
     def train_model(self, df_model):
-        """Train the prediction model"""
+        """Train the prediction model on every period but the last one (see evaluate_model)"""
         try:
             logger.info("Training prediction model")
             
@@ -251,7 +1210,7 @@ class WeeklyStockUpdate:
             
             # Separate training data (all except the last month)
             train_data = df_model[df_model['date'] < ultimo_periodo]
-            test_data = df_model[df_model['date'] == ultimo_periodo].copy()
+            test_data = df_model[df_model['date'] == ultimo_periodo]
             
             logger.info(f"Training data: {len(train_data)} records")
             logger.info(f"Test data: {len(test_data)} records")
@@ -262,51 +1221,57 @@ class WeeklyStockUpdate:
                 X_train = train_data[self.features]
                 y_train = train_data[self.target]
                 
-                # Train XGBoost model
-                self.model = XGBRegressor(
-                    n_estimators=100,
-                    max_depth=3,
-                    learning_rate=0.1,
-                    random_state=42
-                )
-                self.model.fit(X_train, y_train)
-                logger.info("XGBoost model trained successfully")
+                train_periods = period_key(train_data['year'], train_data['month'])
+                
+                # Recency weighting: a month's weight halves every RECENCY_HALF_LIFE_MONTHS
+                sample_weight = None
+                if config.TRAINING_WINDOW_MODE == 'decay':
+                    sample_weight = recency_weights(train_periods)
+                    logger.info(f"Recency weights applied. Oldest month weight: {sample_weight.min():.3f}")
+                
+                self.last_trained_period = int(train_periods.max())
+                
+                if self.warm_start_model is not None:
+                    # Continue boosting the previous model on the newly arrived periods only
+                    new_rows = (train_periods > self.warm_start_state['last_trained_period']).to_numpy()
+                    self.warm_starts_since_rebuild = self.warm_start_state['warm_starts_since_rebuild']
+                    if not new_rows.any():
+                        self.model = self.warm_start_model
+                        self.train_timing = {'fit_seconds': 0.0, 'rounds': self.model.get_booster().num_boosted_rounds()}
+                        logger.info("No new periods since the previous model. Reusing it unchanged")
+                    else:
+                        self.warm_starts_since_rebuild += 1
+                        start = time.perf_counter()
+                        self.model = build_regressor(n_estimators=config.WARM_START_ROUNDS)
+                        self.model.fit(
+                            X_train[new_rows],
+                            y_train[new_rows],
+                            sample_weight=None if sample_weight is None else sample_weight[new_rows],
+                            xgb_model=self.warm_start_model.get_booster()
+                        )
+                        self.train_timing = {
+                            'fit_seconds': time.perf_counter() - start,
+                            'rounds': self.model.get_booster().num_boosted_rounds()
+                        }
+                        logger.info(
+                            f"XGBoost model warm-started with {config.WARM_START_ROUNDS} extra rounds "
+                            f"on {int(new_rows.sum())} new records in {self.train_timing['fit_seconds']:.2f}s"
+                        )
+                else:
+                    # Train XGBoost model
+                    self.model, fit_info = fit_regressor(X_train, y_train, train_periods, sample_weight)
+                    self.train_timing = dict(fit_info)
+                    self.warm_starts_since_rebuild = 0
+                    logger.info(
+                        f"XGBoost model trained successfully in {fit_info['fit_seconds']:.2f}s "
+                        f"using {fit_info['rounds']} boosting rounds"
+                    )
+                
+                if self.training_partition:
+                    partition_start = time.perf_counter()
+                    self.train_partition_models(train_data, X_train, y_train, train_periods, sample_weight)
+                    self.train_timing['partition_seconds'] = time.perf_counter() - partition_start
                 
-                # Evaluate on test data if available
-                if len(test_data) > 0:
-                    X_test = test_data[self.features]
-                    y_test = test_data[self.target]
-                    y_pred = self.model.predict(X_test)
-                    
-                    # Convert predictions to integers
-                    test_data['unidades_pred'] = y_pred.round().astype(int)
-                    
-                    # Show accuracy metrics
-                    mae = mean_absolute_error(y_test, y_pred)
-                    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-                    
-                    logger.info(f"Evaluation results:")
-                    logger.info(f"Mean Absolute Error (MAE): {mae:.2f}")
-                    logger.info(f"Root Mean Squared Error (RMSE): {rmse:.2f}")
-                    # Save metrics to JSON
-                    try:
-                        metrics_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'model_metrics.json')
-                        if os.path.exists(metrics_path):
-                            with open(metrics_path, 'r', encoding='utf-8') as mf:
-                                mobj = json.load(mf)
-                        else:
-                            mobj = {'training': [], 'test': []}
-                        record = {'date': ultimo_periodo.strftime('%Y-%m-%d'), 'mae': mae}
-                        mobj['test'].append(record)
-                        # Optionally record training MAE
-                        train_pred = self.model.predict(X_train)
-                        mae_train = mean_absolute_error(y_train, train_pred)
-                        mobj['training'].append({'date': ultimo_periodo.strftime('%Y-%m-%d'), 'mae': mae_train})
-                        with open(metrics_path, 'w', encoding='utf-8') as mf:
-                            json.dump(mobj, mf, indent=2)
-                        logger.info('Metrics saved to model_metrics.json')
-                    except Exception as em:
-                        logger.error(f"Error writing metrics JSON: {em}")
                 return True
             else:
                 logger.warning("Not enough data for training")
@@ -316,51 +1281,226 @@ class WeeklyStockUpdate:
             logger.error(f"Error training model: {e}")
             return False
     
+    def evaluate_model(self, df_model):
+        """Evaluate the trained model on the last period and record the test and training MAE"""
+        try:
+            ultimo_periodo = df_model['date'].max()
+            train_data = df_model[df_model['date'] < ultimo_periodo]
+            test_data = df_model[df_model['date'] == ultimo_periodo]
+            if len(test_data) == 0:
+                logger.info("No test data to evaluate the model on")
+                return True
+            
+            X_test = test_data[self.features]
+            y_test = test_data[self.target]
+            y_pred = self.predict_rows(X_test, test_data['location_id'], test_data['articulo_id'])
+            
+            # Show accuracy metrics
+            mae = mean_absolute_error(y_test, y_pred)
+            rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+            
+            logger.info(f"Evaluation results:")
+            logger.info(f"Mean Absolute Error (MAE): {mae:.2f}")
+            logger.info(f"Root Mean Squared Error (RMSE): {rmse:.2f}")
+            self.train_metrics = {'test_mae': float(mae), 'test_rmse': float(rmse), 'test_rows': len(test_data)}
+            # Optionally record training MAE
+            train_pred = self.predict_rows(train_data[self.features], train_data['location_id'], train_data['articulo_id'])
+            self.train_metrics['train_mae'] = float(mean_absolute_error(train_data[self.target], train_pred))
+            self.save_metrics_history(ultimo_periodo, mae, self.train_metrics['train_mae'])
+            return True
+        
+        except Exception as e:
+            logger.error(f"Error evaluating model: {e}")
+            return False
+    
+    def save_metrics_history(self, ultimo_periodo, mae, mae_train):
+        """Append the test and training MAE of this run to config/model_metrics.json"""
+        try:
+            metrics_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', 'model_metrics.json')
+            if os.path.exists(metrics_path):
+                with open(metrics_path, 'r', encoding='utf-8') as mf:
+                    mobj = json.load(mf)
+            else:
+                mobj = {'training': [], 'test': []}
+            mobj['test'].append({'date': ultimo_periodo.strftime('%Y-%m-%d'), 'mae': mae})
+            mobj['training'].append({'date': ultimo_periodo.strftime('%Y-%m-%d'), 'mae': mae_train})
+            with open(metrics_path, 'w', encoding='utf-8') as mf:
+                json.dump(mobj, mf, indent=2)
+            logger.info('Metrics saved to model_metrics.json')
+        except Exception as em:
+            logger.error(f"Error writing metrics JSON: {em}")
+    
+    def partition_keys(self, location_ids, article_ids):
+        """Return the partition key of each row as a string, or None if it has none"""
+        if self.training_partition == 'location':
+            keys = pd.Series(np.asarray(location_ids))
+        elif self.training_partition == 'category' and self.article_categories is not None:
+            keys = pd.Series(np.asarray(article_ids)).map(self.article_categories)
+        else:
+            return np.full(len(location_ids), None, dtype=object)
+        missing = keys.isna().to_numpy()
+        keys = keys.astype(str).to_numpy(dtype=object)
+        keys[missing] = None
+        return keys
+    
+    def load_partition_models(self):
+        """Load the partition models saved by the previous run, if it used the same partitioning"""
+        try:
+            state = self.registry.latest()
+            if state is None or state.get('partition') != self.training_partition:
+                logger.info("No saved partition models for this partitioning")
+                return {}
+            return self.registry.load_partition_models(state)
+        except Exception as e:
+            logger.warning(f"Could not load the saved partition models: {e}")
+            return {}
+    
+    def train_partition_models(self, train_data, X_train, y_train, train_periods, sample_weight=None):
+        """
+        Fit one model per partition (location or category) on a process pool.
+        
+        Partitions with fewer than MIN_PARTITION_ROWS training rows get no model
+        and are scored by the global model. When specific partitions are requested
+        for retraining, the other partitions keep the model saved by the last run.
+        """
+        start = time.perf_counter()
+        keys = pd.Series(self.partition_keys(train_data['location_id'], train_data['articulo_id']))
+        groups = keys.groupby(keys, sort=False).indices
+        eligible = {key: rows for key, rows in groups.items() if len(rows) >= config.MIN_PARTITION_ROWS}
+        logger.info(
+            f"Training partitions by {self.training_partition}: {len(eligible)} of {len(groups)} "
+            f"have at least {config.MIN_PARTITION_ROWS} rows, the rest use the global model"
+        )
+        
+        self.partition_models = {}
+        if self.retrain_partitions:
+            previous = self.load_partition_models()
+            if previous:
+                self.partition_models = {key: model for key, model in previous.items() if key in groups}
+                eligible = {key: rows for key, rows in eligible.items() if key in self.retrain_partitions}
+                logger.info(
+                    f"Retraining {len(eligible)} partition(s), keeping the saved model of the others"
+                )
+        
+        X = X_train.to_numpy(dtype=np.float64)
+        y = y_train.to_numpy()
+        periods = np.asarray(train_periods)
+        weights = None if sample_weight is None else np.asarray(sample_weight)
+        jobs = [
+            (key, X[rows], y[rows], periods[rows], None if weights is None else weights[rows])
+            for key, rows in eligible.items()
+        ]
+        if not jobs:
+            return
+        
+        workers = max(1, min(config.TRAINING_WORKERS, len(jobs)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for key, model, info in executor.map(fit_partition_model, jobs):
+                self.partition_models[key] = model
+        logger.info(
+            f"Trained {len(jobs)} partition model(s) in {time.perf_counter() - start:.2f}s "
+            f"using {workers} worker process(es)"
+        )
+    
+    def predict_rows(self, X, location_ids, article_ids):
+        """Predict each row with its partition model, falling back to the global model"""
+        X = np.asarray(X, dtype=np.float64)
+        pred = np.empty(len(X), dtype=np.float64)
+        use_global = np.ones(len(X), dtype=bool)
+        if self.partition_models:
+            keys = pd.Series(self.partition_keys(location_ids, article_ids))
+            for key, rows in keys.groupby(keys, sort=False).indices.items():
+                model = self.partition_models.get(key)
+                if model is not None:
+                    pred[rows] = model.predict(X[rows])
+                    use_global[rows] = False
+        if use_global.any():
+            pred[use_global] = self.model.predict(X[use_global])
+        return pred
+    
+    def forecast_pairs(self, df_model):
+        """(LOCATION_ID, ARTICULO_ID) pairs to score: the inventory pairs, or the pairs in the data"""
+        if self.df_inventory is not None:
+            pairs = self.df_inventory[['LOCATION_ID', 'ARTICULO_ID']]
+        else:
+            pairs = df_model[['location_id', 'articulo_id']].rename(
+                columns={'location_id': 'LOCATION_ID', 'articulo_id': 'ARTICULO_ID'}
+            )
+        return pairs.drop_duplicates()
+    
+    def forecast_inputs(self, pairs, ultimo_periodo):
+        """
+        Feature rows of every pair for the `forecast_horizon` months after
+        `ultimo_periodo`, horizon-major (all pairs for month 1, then month 2, ...).
+        Pairs with an ID that never had sales are skipped.
+        """
+        # Prepare the forecast periods (months 1..H after the last period)
+        horizons = np.arange(1, self.forecast_horizon + 1)
+        dates = pd.DatetimeIndex([ultimo_periodo + pd.DateOffset(months=int(h)) for h in horizons])
+        
+        # Encode each dimension once; pairs with an ID that never had sales are skipped
+        loc_enc = self.loc_dict.encode(pairs['LOCATION_ID'].to_numpy())
+        prod_enc = self.prod_dict.encode(pairs['ARTICULO_ID'].to_numpy())
+        known = (loc_enc != UNKNOWN_CODE) & (prod_enc != UNKNOWN_CODE)
+        if not known.all():
+            logger.info(f"Skipping {int((~known).sum())} pairs without sales history")
+        
+        # Build every column directly in NumPy: pairs repeat within each horizon block
+        n_pairs = int(known.sum())
+        month_angle = 2 * np.pi * (dates.month.to_numpy() - 1) / 12
+        columns = {
+            'location_id': np.tile(pairs['LOCATION_ID'].to_numpy()[known], len(horizons)),
+            'articulo_id': np.tile(pairs['ARTICULO_ID'].to_numpy()[known], len(horizons)),
+            'horizon': np.repeat(horizons, n_pairs),
+            'date': np.repeat(dates.to_numpy(), n_pairs),
+            'year': np.repeat(dates.year.to_numpy(), n_pairs),
+            'month': np.repeat(dates.month.to_numpy(), n_pairs),
+            'month_sin': np.repeat(np.sin(month_angle), n_pairs),
+            'month_cos': np.repeat(np.cos(month_angle), n_pairs),
+            'loc_enc': np.tile(loc_enc[known], len(horizons)),
+            'prod_enc': np.tile(prod_enc[known], len(horizons))
+        }
+        if self.feature_engine is not None:
+            columns.update(self.feature_engine.forecast_features(
+                pairs['LOCATION_ID'].to_numpy()[known],
+                pairs['ARTICULO_ID'].to_numpy()[known],
+                len(horizons)
+            ))
+        return pd.DataFrame(columns)
+    
+    def score_forecast(self, df_inputs):
+        """Predict the forecast rows built by forecast_inputs; predictions are non-negative integers"""
+        X_next = df_inputs[self.features].to_numpy(dtype=np.float64)
+        pred = self.predict_rows(X_next, df_inputs['location_id'].to_numpy(), df_inputs['articulo_id'].to_numpy())
+        df_next = df_inputs[FORECAST_COLUMNS].copy()
+        df_next['unidades_pred'] = np.clip(pred.round(), 0, None).astype(int)
+        return df_next
+    
     def predict_next_period(self, df_model):
-        """Predict sales for the next period"""
+        """
+        Predict sales for the next `forecast_horizon` periods in one batch.
+        
+        Returns a long-format frame with one row per (location, article, horizon),
+        where horizon 1 is the month after the last period in the data.
+        """
         try:
             logger.info("Preparing next period prediction")
             
             # Get the last period in the data
             ultimo_periodo = df_model['date'].max()
             
-            # Prepare next period for prediction
-            next_month_date = ultimo_periodo + pd.DateOffset(months=1)
-            next_year = next_month_date.year
-            next_month = next_month_date.month
-            
-            # Get unique list of articles and locations
-            unique_articles = df_model['articulo_id'].unique()
-            unique_locations = df_model['location_id'].unique()
-            
-            logger.info(f"Preparing predictions for next period: {next_month_date.strftime('%Y-%m-%d')}")
-            logger.info(f"Total articles: {len(unique_articles)}")
-            logger.info(f"Total locations: {len(unique_locations)}")
-            
-            # Create data for future prediction
-            pred_list = []
-            for loc in unique_locations:
-                for prod in unique_articles:
-                    pred_list.append({
-                        'location_id': loc,
-                        'articulo_id': prod,
-                        'date': next_month_date,
-                        'year': next_year,
-                        'month': next_month,
-                        'month_sin': np.sin(2 * np.pi * (next_month - 1) / 12),
-                        'month_cos': np.cos(2 * np.pi * (next_month - 1) / 12),
-                        'loc_enc': self.le_loc.transform([loc])[0],
-                        'prod_enc': self.le_prod.transform([prod])[0]
-                    })
-            
-            # Create DataFrame for prediction
-            df_next = pd.DataFrame(pred_list)
-            X_next = df_next[self.features]
-            
-            # Make predictions for the next period
-            df_next['unidades_pred'] = self.model.predict(X_next).round().astype(int)
-            # Ensure predictions are positive
-            df_next['unidades_pred'] = df_next['unidades_pred'].clip(lower=0)
+            # Score only the (location, article) pairs that have an inventory row
+            pairs = self.forecast_pairs(df_model)
+            last_forecast = ultimo_periodo + pd.DateOffset(months=self.forecast_horizon)
+            logger.info(
+                f"Preparing predictions for {self.forecast_horizon} period(s): "
+                f"{(ultimo_periodo + pd.DateOffset(months=1)).strftime('%Y-%m-%d')} to {last_forecast.strftime('%Y-%m-%d')}"
+            )
+            logger.info(f"Inventory pairs to score: {len(pairs)}")
+            
+            # Score all horizons in one pass
+            df_next = self.score_forecast(self.forecast_inputs(pairs, ultimo_periodo))
+            self.df_forecast = df_next
             
             logger.info(f"Predictions completed. Total predictions: {len(df_next)}")
             return df_next
@@ -368,13 +1508,36 @@ class WeeklyStockUpdate:
         except Exception as e:
             logger.error(f"Error predicting next period: {e}")
             return None
+    
+    def select_stock_min_horizon(self, df_next):
+        """
+        Keep one forecast row per pair: the STOCK_MIN_HORIZON month, or the month
+        with the highest predicted demand when it is "max"
+        """
+        if config.STOCK_MIN_HORIZON == 'max':
+            peak = df_next.groupby(['location_id', 'articulo_id'], sort=False)['unidades_pred'].idxmax()
+            logger.info(f"Stock minimums use the peak predicted demand over {self.forecast_horizon} month(s)")
+            return df_next.loc[peak.to_numpy()].reset_index(drop=True)
+        horizon = int(config.STOCK_MIN_HORIZON)
+        if horizon > df_next['horizon'].max():
+            logger.warning(
+                f"STOCK_MIN_HORIZON {horizon} is beyond the forecast horizon. Using month {df_next['horizon'].max()}"
+            )
+            horizon = df_next['horizon'].max()
+        logger.info(f"Stock minimums use the forecast for month {horizon}")
+        return df_next[df_next['horizon'] == horizon].reset_index(drop=True)
+    
     def calculate_new_stock_minimums(self, df_next, df):
         """Calculate new stock minimums based on predictions"""
         try:
             logger.info("Calculating new stock minimums")
             
-            # Extract relevant columns from inventory
-            df_inventory = df[['ARTICULO_ID', 'LOCATION_ID', 'STOCKACTUAL', 'STOCKMINIMO']].copy()
+            # One forecast row per pair drives the stock minimum
+            df_next = self.select_stock_min_horizon(df_next)
+            
+            # Extract relevant columns from inventory (snapshot taken by fetch_data if available)
+            source = self.df_inventory if self.df_inventory is not None else df
+            df_inventory = source[['INVENTARIO_ID', 'ARTICULO_ID', 'LOCATION_ID', 'STOCKACTUAL', 'STOCKMINIMO']].copy()
             
             # Rename columns for consistency
             df_inventory = df_inventory.rename(columns={
@@ -403,31 +1566,47 @@ class WeeklyStockUpdate:
             return None
     
     def update_database(self, df_update):
-        """Update the stock_minimo values in the database"""
+        """Update the stock_minimo values in the database; returns the rows written, or None on failure"""
         try:
             logger.info("Updating stock_minimo values in database")
             
-            # Prepare update data
-            updates = []
-            for _, row in df_update.iterrows():
-                inventario_id = row['INVENTARIO_ID'] if 'INVENTARIO_ID' in row else None
-                if inventario_id is None:
-                    # If we don't have the Inventario_ID, we need to find it from the database
-                    # This would be unusual since we should have merged with the inventory table
-                    continue
-                
-                stock_min_nuevo = max(1, row['stock_min_nuevo'])  # Ensure minimum value of 1
-                
-                updates.append({
-                    'INVENTARIO_ID': inventario_id,
-                    'STOCKMINIMO': stock_min_nuevo
-                })
+            # Prepare update data. Rows without an INVENTARIO_ID have no inventory
+            # record to update and are skipped.
+            if 'INVENTARIO_ID' not in df_update.columns:
+                logger.warning("No updates to perform")
+                return 0
+            df_valid = df_update[df_update['INVENTARIO_ID'].notna()]
+            stock_min_nuevo = np.maximum(config.MIN_STOCK_VALUE, df_valid['stock_min_nuevo']).astype(int)
             
-            # Create a dataframe to handle the updates in batch
-            updates_df = pd.DataFrame(updates)
+            # Only send the rows whose minimum actually changed. Changes within the
+            # tolerance band are suppressed to avoid week-to-week oscillation.
+            if 'stock_min_actual' in df_valid.columns:
+                delta = (stock_min_nuevo - df_valid['stock_min_actual']).abs()
+            else:
+                delta = pd.Series(np.nan, index=df_valid.index)
+            unchanged = delta == 0
+            suppressed = (delta > 0) & (delta <= config.WRITE_BACK_TOLERANCE)
+            changed = ~(unchanged | suppressed)
+            
+            self.write_back_summary = {
+                'changed': int(changed.sum()),
+                'unchanged': int(unchanged.sum()),
+                'suppressed': int(suppressed.sum())
+            }
+            logger.info(
+                f"Write-back summary: {self.write_back_summary['changed']} changed, "
+                f"{self.write_back_summary['unchanged']} unchanged, "
+                f"{self.write_back_summary['suppressed']} suppressed "
+                f"(tolerance {config.WRITE_BACK_TOLERANCE})"
+            )
+            
+            updates_df = pd.DataFrame({
+                'INVENTARIO_ID': df_valid.loc[changed, 'INVENTARIO_ID'].astype(int),
+                'STOCKMINIMO': stock_min_nuevo[changed]
+            })
             
             if len(updates_df) == 0:
-                logger.warning("No updates to perform")
+                logger.info("No stock minimum changed. Nothing to write back")
                 return 0
             
             # Log the first few updates for debugging
@@ -435,47 +1614,124 @@ class WeeklyStockUpdate:
             for _, row in updates_df.head(5).iterrows():
                 logger.info(f"  Inventory ID: {row['INVENTARIO_ID']}, New Stock Min: {row['STOCKMINIMO']}")
             
-            # Perform the database update
-            for _, row in updates_df.iterrows():
-                update_query = f"""
-                UPDATE DBADMIN.INVENTARIO2 
-                SET STOCKMINIMO = {row['STOCKMINIMO']} 
-                WHERE INVENTARIO_ID = {row['INVENTARIO_ID']}
-                """
-                self.conn.sql(update_query)
+            # Perform the database update in a single transaction
+            if config.WRITE_BACK_MODE == 'merge':
+                try:
+                    self._write_back_merge(updates_df)
+                except Exception as e:
+                    logger.warning(f"Staging table MERGE failed ({e}). Falling back to executemany")
+                    self._write_back_executemany(updates_df)
+            else:
+                self._write_back_executemany(updates_df)
             
             logger.info(f"Updated {len(updates_df)} records in database")
             return len(updates_df)
         
         except Exception as e:
             logger.error(f"Error updating database: {e}")
-            return 0
+            return None
+    
+    def _write_back_merge(self, updates_df):
+        """
+        Load the new minimums into a temporary staging table with batched inserts
+        and apply them to the inventory table with a single MERGE
+        """
+        connection = self.conn.connection
+        cursor = connection.cursor()
+        autocommit = connection.getautocommit()
+        staging = '#STOCKMINIMO_STAGING'
+        rows = list(zip(updates_df['INVENTARIO_ID'].tolist(), updates_df['STOCKMINIMO'].tolist()))
+        try:
+            cursor.execute(
+                f"CREATE LOCAL TEMPORARY COLUMN TABLE {staging} "
+                "(INVENTARIO_ID INTEGER PRIMARY KEY, STOCKMINIMO INTEGER)"
+            )
+            connection.setautocommit(False)
+            try:
+                for i in range(0, len(rows), config.WRITE_BACK_BATCH_SIZE):
+                    cursor.executemany(
+                        f"INSERT INTO {staging} (INVENTARIO_ID, STOCKMINIMO) VALUES (?, ?)",
+                        rows[i:i + config.WRITE_BACK_BATCH_SIZE]
+                    )
+                cursor.execute(f"""
+                    MERGE INTO {self._table_name('INVENTORY')} T
+                    USING {staging} S
+                        ON T.INVENTARIO_ID = S.INVENTARIO_ID
+                    WHEN MATCHED THEN UPDATE SET T.STOCKMINIMO = S.STOCKMINIMO
+                    """)
+                connection.commit()
+                logger.info(f"Applied {len(rows)} stock minimums through staging table MERGE")
+            except Exception:
+                connection.rollback()
+                raise
+        finally:
+            connection.setautocommit(autocommit)
+            try:
+                cursor.execute(f"DROP TABLE {staging}")
+            except Exception:
+                pass
+            cursor.close()
+    
+    def _write_back_executemany(self, updates_df):
+        """Apply the new minimums with a parameterized UPDATE sent in batches"""
+        connection = self.conn.connection
+        cursor = connection.cursor()
+        autocommit = connection.getautocommit()
+        rows = list(zip(updates_df['STOCKMINIMO'].tolist(), updates_df['INVENTARIO_ID'].tolist()))
+        try:
+            connection.setautocommit(False)
+            for i in range(0, len(rows), config.WRITE_BACK_BATCH_SIZE):
+                cursor.executemany(
+                    f"UPDATE {self._table_name('INVENTORY')} SET STOCKMINIMO = ? WHERE INVENTARIO_ID = ?",
+                    rows[i:i + config.WRITE_BACK_BATCH_SIZE]
+                )
+            connection.commit()
+            logger.info(f"Applied {len(rows)} stock minimums through executemany")
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.setautocommit(autocommit)
+            cursor.close()
+    
     def save_model_and_results(self, df_update):
         """Save the model and results for future use"""
         try:
             today_str = datetime.datetime.now().strftime("%Y%m%d")
             
-            # Save the trained model
-            model_path = os.path.join('../models', f'inventory_prediction_model_{today_str}.pkl')
-            with open(model_path, 'wb') as f:
-                pickle.dump(self.model, f)
-            
-            # Save encoders for future use
-            encoders_path = os.path.join('../models', f'inventory_encoders_{today_str}.pkl')
-            encoders = {
-                'location_encoder': self.le_loc,
-                'product_encoder': self.le_prod
-            }
-            with open(encoders_path, 'wb') as f:
-                pickle.dump(encoders, f)
+            # Persist the codes the model was trained with
+            self.loc_dict.save()
+            self.prod_dict.save()
             
             # Save predictions
             predictions_path = os.path.join('../models/results', f'predictions_{today_str}.csv')
             df_update.to_csv(predictions_path, index=False)
             
-            logger.info(f"Model saved to: {model_path}")
-            logger.info(f"Encoders saved to: {encoders_path}")
+            # Save the forecast for every horizon
+            forecast_path = os.path.join('../models/results', f'forecast_{today_str}.csv')
+            self.df_forecast.to_csv(forecast_path, index=False)
+            
+            # Register the model, its encoders and what the next run needs to warm-start from it
+            manifest = self.registry.register(
+                self.model,
+                {'location': self.loc_dict.ids, 'product': self.prod_dict.ids},
+                self.partition_models,
+                fingerprint=self.fingerprint,
+                features=self.features,
+                model_params=model_params(),
+                metrics=self.train_metrics,
+                timing=self.train_timing,
+                partition=self.training_partition,
+                predictions_path=predictions_path,
+                forecast_path=forecast_path,
+                forecast_horizon=self.forecast_horizon,
+                last_trained_period=self.last_trained_period,
+                warm_starts_since_rebuild=self.warm_starts_since_rebuild
+            )
+            
+            logger.info(f"Model registered as version {manifest['version']}")
             logger.info(f"Predictions saved to: {predictions_path}")
+            logger.info(f"Forecast saved to: {forecast_path}")
             
             return True
         
@@ -483,64 +1739,731 @@ class WeeklyStockUpdate:
             logger.error(f"Error saving model and results: {e}")
             return False
     
-    def run_pipeline(self):
-        """Run the entire pipeline"""
-        logger.info("Starting weekly stock update pipeline")
+    def fetch_location_groups(self, store):
+        """
+        Fetch the monthly sales one location group at a time and spill each group
+        (out-of-core pushdown and stream modes). The groups are planned from the
+        per-location row counts of the aggregated query, so no sales frame larger
+        than a group is held in memory. Returns the location IDs of each group,
+        or None on failure.
+        """
+        try:
+            logger.info(f"Fetching aggregated sales data by location group ({self.fetch_mode} mode)")
+            if config.SALES_CACHE_ENABLED:
+                logger.info("The sales cache holds every location per period and is not used out-of-core")
+            
+            last_period = self.fetch_last_period()
+            if last_period is None:
+                logger.error("The sales history is empty")
+                return None
+            window_start = self.history_start(last_period)
+            if window_start is not None:
+                logger.info(f"Training window starts at period {window_start}")
+            
+            count_query = f"""
+            SELECT LOCATION_ID, COUNT(*) AS ROW_COUNT
+            FROM ({self._sales_query(since=window_start)}) S
+            GROUP BY LOCATION_ID
+            """
+            inventory_query = self._inventory_query()
+            fetched = self.collect_concurrently({
+                'sales rows per location': lambda conn: conn.sql(count_query).collect(),
+                'inventory': lambda conn: conn.sql(inventory_query).collect()
+            })
+            df_inventory = fetched['inventory'].drop_duplicates(subset=['ARTICULO_ID', 'LOCATION_ID'])
+            self.df_inventory = compact_frame(df_inventory) if config.COMPACT_DTYPES else df_inventory
+            row_counts = fetched['sales rows per location']
+            counts = pd.Series(
+                row_counts['ROW_COUNT'].to_numpy(dtype=np.int64),
+                index=row_counts['LOCATION_ID'].to_numpy()
+            )
+            
+            max_rows = group_row_budget(len(self.features))
+            groups = pack_location_counts(counts, max_rows, self.df_inventory['LOCATION_ID'].to_numpy())
+            total_rows = 0
+            for group, locations in enumerate(groups):
+                if counts.reindex(locations, fill_value=0).sum() == 0:
+                    continue
+                # Groups are contiguous ranges of the sorted location IDs and every
+                # location with sales is in one, so the ID range selects the group exactly
+                bounds = (locations.min(), locations.max())
+                if self.fetch_mode == 'stream':
+                    df = self.stream_sales_aggregate(self.conn, since=window_start, locations=bounds)
+                else:
+                    df = self.conn.sql(self._sales_query(since=window_start, locations=bounds)).collect()
+                if config.COMPACT_DTYPES:
+                    df = compact_frame(df)
+                store.write('fetched', group, df)
+                total_rows += len(df)
+            
+            # Every group uses the last period of the whole run, not its own
+            self.data_last_period = last_period
+            logger.info(
+                f"Fetched and spilled {total_rows} aggregated sales rows as {len(groups)} location group(s) "
+                f"of up to {max_rows} rows ({config.MEMORY_BUDGET_MB} MB budget, {store.size_mb():.2f} MB on disk)"
+            )
+            return groups
         
-        # Connect to database
-        if not self.connect_to_database():
-            logger.error("Database connection failed. Exiting pipeline.")
-            return False
+        except Exception as e:
+            logger.error(f"Error fetching data: {e}")
+            return None
+    
+    def spill_location_groups(self, df, store):
+        """
+        Split the fetched sales into groups of whole locations sized by MEMORY_BUDGET_MB
+        and spill each group to Parquet. Returns the location IDs of each group;
+        inventory locations without sales get a group slot but no spilled rows.
+        """
+        max_rows = group_row_budget(len(self.features))
+        inventory_locations = None if self.df_inventory is None else self.df_inventory['LOCATION_ID'].to_numpy()
+        groups = plan_location_groups(df['LOCATION_ID'].to_numpy(), max_rows, inventory_locations)
+        group_of = pd.Series(
+            np.repeat(np.arange(len(groups)), [len(locations) for locations in groups]),
+            index=np.concatenate(groups)
+        )
+        row_groups = df['LOCATION_ID'].map(group_of)
+        for group, rows in row_groups.groupby(row_groups, sort=True).indices.items():
+            store.write('fetched', int(group), df.iloc[rows])
+        logger.info(
+            f"Spilled {len(df)} fetched rows as {len(groups)} location group(s) of up to "
+            f"{max_rows} rows ({config.MEMORY_BUDGET_MB} MB budget, {store.size_mb():.2f} MB on disk)"
+        )
+        return groups
+    
+    def train_out_of_core(self, store, paths, period_rows):
+        """
+        Train the global model from the spilled feature files (out-of-core train_model).
+        `period_rows` maps each training period to its row count.
+        """
+        weights = None
+        if config.TRAINING_WINDOW_MODE == 'decay':
+            weights = functools.partial(recency_weights, last_train=self.last_trained_period)
+        
+        def batches(first, end, name):
+            end = self.data_last_period if end is None else min(end, self.data_last_period)
+            return SpilledBatches(paths, self.features, self.target, store.cache_prefix(name), first, end, weights)
+        
+        if self.warm_start_model is not None:
+            # Continue boosting the previous model on the newly arrived periods only
+            previous = self.warm_start_state['last_trained_period']
+            new_rows = {period: rows for period, rows in period_rows.items() if period > previous}
+            self.warm_starts_since_rebuild = self.warm_start_state['warm_starts_since_rebuild']
+            if not new_rows:
+                self.model = self.warm_start_model
+                self.train_timing = {'fit_seconds': 0.0, 'rounds': self.model.get_booster().num_boosted_rounds()}
+                logger.info("No new periods since the previous model. Reusing it unchanged")
+                return
+            self.warm_starts_since_rebuild += 1
+            self.model, fit_info = fit_regressor_external(
+                batches, new_rows,
+                params={'n_estimators': config.WARM_START_ROUNDS},
+                xgb_model=self.warm_start_model.get_booster(),
+                first_period=shift_period(previous, 1)
+            )
+            self.train_timing = dict(fit_info)
+            logger.info(
+                f"XGBoost model warm-started with {config.WARM_START_ROUNDS} extra rounds on "
+                f"{sum(new_rows.values())} new records from disk in {fit_info['fit_seconds']:.2f}s"
+            )
+        else:
+            self.model, fit_info = fit_regressor_external(batches, period_rows)
+            self.train_timing = dict(fit_info)
+            self.warm_starts_since_rebuild = 0
+            logger.info(
+                f"XGBoost model trained from {len(paths)} spilled group(s) in {fit_info['fit_seconds']:.2f}s "
+                f"using {fit_info['rounds']} boosting rounds"
+            )
+    
+    def model_and_score_out_of_core(self, store, groups):
+        """
+        Featurize, train, evaluate and score the spilled location groups.
+        
+        Each group is featurized on its own and its features and forecast inputs are
+        spilled; the global model is trained from the spilled features, then each group
+        is read back once more to fit its location models (if partitioned), add its
+        errors to the evaluation sums and score its forecast. Returns the combined
+        forecast, or None on failure.
+        """
+        try:
+            last = self.data_last_period
+            ultimo_periodo = pd.Timestamp(year=last // 100, month=last % 100, day=1)
+            pairs = self.forecast_pairs(None)
+            pair_locations = pairs['LOCATION_ID'].to_numpy()
+            spill_columns = list(dict.fromkeys(
+                ['location_id', 'articulo_id', 'year', 'month', self.target] + self.features
+            ))
+            
+            # Features and forecast inputs, one group at a time
+            period_rows = {}
+            feature_groups = []
+            for group, locations in enumerate(groups):
+                if store.exists('sales', group):
+                    df_model = self.perform_feature_engineering(store.read('sales', group), load_warm_start=False)
+                    if df_model is None:
+                        return None
+                    periods, counts = np.unique(period_key(df_model['year'], df_model['month']), return_counts=True)
+                    for period, rows in zip(periods.tolist(), counts.tolist()):
+                        period_rows[period] = period_rows.get(period, 0) + rows
+                    store.write('features', group, df_model[spill_columns])
+                    feature_groups.append(group)
+                # Forecast inputs while the feature engine still holds this group's series
+                group_pairs = pairs[np.isin(pair_locations, locations)]
+                store.write('forecast', group, self.forecast_inputs(group_pairs, ultimo_periodo))
+            
+            train_periods = {period: rows for period, rows in period_rows.items() if period < last}
+            logger.info(
+                f"Training data: {sum(train_periods.values())} records, "
+                f"test data: {period_rows.get(last, 0)} records in {len(feature_groups)} group(s)"
+            )
+            if sum(train_periods.values()) <= 10:
+                logger.warning("Not enough data for training")
+                return None
+            self.last_trained_period = max(train_periods)
+            
+            if self.training_strategy == 'warm_start':
+                self.prepare_warm_start()
+            self.train_out_of_core(store, [store.path('features', group) for group in feature_groups], train_periods)
+            
+            # Evaluate and score group by group; only the forecasts and error sums are kept
+            partition_models = {}
+            partition_seconds = 0.0
+            errors = {'test_abs': 0.0, 'test_sq': 0.0, 'test_rows': 0, 'train_abs': 0.0, 'train_rows': 0}
+            forecasts = []
+            for group in range(len(groups)):
+                if group in feature_groups:
+                    df_model = store.read('features', group)
+                    periods = period_key(df_model['year'], df_model['month']).to_numpy()
+                    train = periods < last
+                    if self.training_partition and train.any():
+                        partition_start = time.perf_counter()
+                        train_data = df_model[train]
+                        sample_weight = None
+                        if config.TRAINING_WINDOW_MODE == 'decay':
+                            sample_weight = recency_weights(periods[train], self.last_trained_period)
+                        self.train_partition_models(
+                            train_data, train_data[self.features], train_data[self.target], periods[train], sample_weight
+                        )
+                        partition_models.update(self.partition_models)
+                        partition_seconds += time.perf_counter() - partition_start
+                    pred = self.predict_rows(
+                        df_model[self.features], df_model['location_id'].to_numpy(), df_model['articulo_id'].to_numpy()
+                    )
+                    error = pred - df_model[self.target].to_numpy(dtype=np.float64)
+                    test = periods == last
+                    errors['test_abs'] += float(np.abs(error[test]).sum())
+                    errors['test_sq'] += float(np.square(error[test]).sum())
+                    errors['test_rows'] += int(test.sum())
+                    errors['train_abs'] += float(np.abs(error[train]).sum())
+                    errors['train_rows'] += int(train.sum())
+                forecasts.append(self.score_forecast(store.read('forecast', group)))
+            self.partition_models = partition_models
+            if self.training_partition:
+                self.train_timing['partition_seconds'] = partition_seconds
+            
+            if errors['test_rows'] > 0:
+                mae = errors['test_abs'] / errors['test_rows']
+                rmse = np.sqrt(errors['test_sq'] / errors['test_rows'])
+                logger.info(f"Evaluation results:")
+                logger.info(f"Mean Absolute Error (MAE): {mae:.2f}")
+                logger.info(f"Root Mean Squared Error (RMSE): {rmse:.2f}")
+                self.train_metrics = {
+                    'test_mae': float(mae),
+                    'test_rmse': float(rmse),
+                    'test_rows': errors['test_rows'],
+                    'train_mae': errors['train_abs'] / max(errors['train_rows'], 1)
+                }
+                self.save_metrics_history(ultimo_periodo, mae, self.train_metrics['train_mae'])
+            
+            df_next = pd.concat(forecasts, ignore_index=True)
+            self.df_forecast = df_next
+            logger.info(f"Predictions completed. Total predictions: {len(df_next)}")
+            return df_next
         
-        # Fetch data
+        except Exception as e:
+            logger.error(f"Error in out-of-core training and scoring: {e}")
+            return None
+    
+    def open_checkpoint(self):
+        """
+        Create the checkpoint of this run, or reopen the run given with --resume.
+        Returns None when checkpointing is disabled or the run cannot be resumed.
+        """
+        if self.resume_run is None and not config.CHECKPOINT_ENABLED:
+            return None
+        try:
+            checkpoint = RunCheckpoint(self.resume_run, resume=self.resume_run is not None)
+            logger.info(f"Run ID: {checkpoint.run_id} (continue a failed run with --resume {checkpoint.run_id})")
+            return checkpoint
+        except Exception as e:
+            if self.resume_run is not None:
+                logger.error(f"Could not resume run {self.resume_run}: {e}")
+            else:
+                logger.warning(f"Could not create the run checkpoint, continuing without it: {e}")
+            return None
+    
+    def close_checkpoint(self, success):
+        """Delete the checkpoint of a successful run; keep a failed one for --resume"""
+        if self.checkpoint is None:
+            return
+        if success:
+            self.checkpoint.remove()
+        else:
+            logger.info(f"Checkpoint kept. Resume with --resume {self.checkpoint.run_id}")
+        RunCheckpoint.apply_retention()
+    
+    def checkpoint_stage(self, stage, **outputs):
+        """Checkpoint a finished stage with its outputs and the pipeline state it set"""
+        if self.checkpoint is None:
+            return
+        state = {name: getattr(self, name) for name in CHECKPOINT_STATE.get(stage, [])}
+        try:
+            self.checkpoint.save(stage, **state, **outputs)
+        except Exception as e:
+            logger.warning(f"Could not checkpoint stage '{stage}': {e}")
+    
+    def restore_stage(self, stage):
+        """
+        DAG restore hook: restore the pipeline state a completed stage of the resumed
+        run recorded and return its outputs, or None when the stage has not completed
+        """
+        if self.checkpoint is None or not self.checkpoint.completed(stage):
+            return None
+        outputs = self.checkpoint.load(stage)
+        for name in CHECKPOINT_STATE.get(stage, []):
+            setattr(self, name, outputs.pop(name))
+        if 'location_ids' in outputs:
+            self.restore_feature_state(outputs)
+        if 'df_next' in outputs:
+            self.df_forecast = outputs['df_next']
+        logger.info(f"Stage '{stage}' restored from run {self.checkpoint.run_id}")
+        return outputs
+    
+    def record_stage(self, stage, outputs):
+        """DAG record hook: checkpoint a finished stage"""
+        self.checkpoint_stage(stage, **outputs)
+    
+    def feature_state(self):
+        """Dictionary codes, feature context and unsaved feature update to checkpoint with the features"""
+        context = update = None
+        if self.feature_engine is not None:
+            context = self.feature_engine.context()
+            update = self.feature_engine.pending_update()
+        return {
+            'location_ids': self.loc_dict.ids,
+            'article_ids': self.prod_dict.ids,
+            'feature_context': context,
+            'feature_update': update
+        }
+    
+    def restore_feature_state(self, outputs):
+        """Restore the dictionary codes, feature context and feature update of a checkpointed features stage"""
+        self.loc_dict.restore(outputs['location_ids'])
+        self.prod_dict.restore(outputs['article_ids'])
+        if self.feature_engine is not None and outputs.get('feature_context') is not None:
+            self.feature_engine.restore_context(outputs['feature_context'])
+        if self.feature_engine is not None and outputs.get('feature_update') is not None:
+            self.feature_engine.restore_pending_update(outputs['feature_update'])
+    
+    def save_feature_state(self, success):
+        """
+        Persist the incremental feature state of a successful run; a failed run
+        discards it, so the next run builds on the last successful one
+        """
+        if self.feature_engine is None:
+            return
+        if not success:
+            self.feature_engine.discard()
+            return
+        try:
+            if self.feature_engine.save():
+                logger.info("Incremental feature state saved")
+        except Exception as e:
+            logger.warning(f"Could not save the incremental feature state, the next run rebuilds the features: {e}")
+    
+    def _stage_fetch(self):
+        """Fetch the sales history and the inventory snapshot"""
         df = self.fetch_data()
         if df is None or len(df) == 0:
-            logger.error("Data fetching failed. Exiting pipeline.")
-            return False
-        
-        # Prepare sales data
+            logger.error("Data fetching failed.")
+            return None
+        log_frame_memory('fetch', df)
+        return {'df': df}
+    
+    def _stage_sales(self, df):
+        """Aggregate the monthly sales"""
         df_sales = self.prepare_sales_data(df)
         if df_sales is None:
-            logger.error("Sales data preparation failed. Exiting pipeline.")
-            return False
-        
-        # Feature engineering
-        df_model = self.perform_feature_engineering(df_sales)
+            logger.error("Sales data preparation failed.")
+            return None
+        log_frame_memory('sales preparation', df_sales)
+        return {'df_sales': df_sales}
+    
+    def _stage_memo(self, df_sales=None, sales_hashes=None):
+        """Fingerprint the training data and reuse the last model and predictions if it is unchanged"""
+        self.fingerprint = self.training_fingerprint(df_sales, sales_hashes)
+        if self.checkpoint is not None:
+            self.checkpoint.bind_fingerprint(self.fingerprint, FINGERPRINTED_STAGES)
+        df_next = None
+        if not self.force and not self.retrain_partitions:
+            df_next = self.load_memoized_predictions(self.fingerprint)
+        return {'reused': df_next is not None}
+    
+    def _stage_features(self, df_sales):
+        """Feature engineering; the warm-start model is loaded by the model stage"""
+        df_model = self.perform_feature_engineering(df_sales, load_warm_start=False)
         if df_model is None:
-            logger.error("Feature engineering failed. Exiting pipeline.")
-            return False
-        
-        # Train model
+            logger.error("Feature engineering failed.")
+            return None
+        log_frame_memory('feature engineering', df_model)
+        return {'df_model': df_model, **self.feature_state()}
+    
+    def _stage_model(self, df_model):
+        """Train the global model (and the partition models)"""
+        if self.training_strategy == 'warm_start':
+            self.prepare_warm_start()
         if not self.train_model(df_model):
-            logger.error("Model training failed. Exiting pipeline.")
-            return False
-        
-        # Predict next period
+            logger.error("Model training failed.")
+            return None
+        return {}
+    
+    def _stage_evaluate(self, df_model):
+        """Evaluate the trained model; runs alongside the predictions"""
+        if not self.evaluate_model(df_model):
+            return None
+        return {}
+    
+    def _stage_predictions(self, df_model, reused):
+        """Forecast the next periods, or pass on the reused forecast"""
+        if reused:
+            return {'df_next': self.df_forecast}
         df_next = self.predict_next_period(df_model)
         if df_next is None:
-            logger.error("Prediction failed. Exiting pipeline.")
-            return False
-        
-        # Calculate new stock minimums
+            logger.error("Prediction failed.")
+            return None
+        log_frame_memory('prediction', df_next)
+        return {'df_next': df_next}
+    
+    def _stage_stock_minimums(self, df_next, df=None):
+        """Calculate the new stock minimums"""
         df_update = self.calculate_new_stock_minimums(df_next, df)
         if df_update is None:
-            logger.error("Stock minimum calculation failed. Exiting pipeline.")
-            return False
-        
-        # Update database
+            logger.error("Stock minimum calculation failed.")
+            return None
+        log_frame_memory('stock minimum calculation', df_update)
+        return {'df_update': df_update}
+    
+    def _stage_write_back(self, df_update):
+        """Write the new stock minimums back to the database"""
         update_count = self.update_database(df_update)
+        if update_count is None:
+            logger.error("Database update failed.")
+            return None
         if update_count == 0:
             logger.warning("No database updates performed.")
+        return {}
+    
+    def _stage_save(self, df_update):
+        """Save the model and results; runs alongside the write-back"""
+        if not self.save_model_and_results(df_update):
+            return None
+        return {}
+    
+    def _stage_spill(self, store):
+        """
+        Fetch the data as location groups and spill them (out-of-core). Collect mode
+        merges whole tables, so it fetches everything before splitting it.
+        """
+        if self.fetch_mode in ('pushdown', 'stream'):
+            groups = self.fetch_location_groups(store)
+            if groups is None:
+                logger.error("Data fetching failed.")
+                return None
+            return {'groups': groups}
+        logger.warning("Collect mode fetches the full tables; MEMORY_BUDGET_MB only bounds the stages after the fetch")
+        df = self.fetch_data()
+        if df is None or len(df) == 0:
+            logger.error("Data fetching failed.")
+            return None
+        log_frame_memory('fetch', df)
+        # Every group uses the last period of the whole run, not its own
+        self.data_last_period = int(period_key(df['ANIO'], df['MES']).max())
+        return {'groups': self.spill_location_groups(df, store)}
+    
+    def _stage_sales_out_of_core(self, store, groups):
+        """Aggregate the monthly sales group by group; returns the row hashes of every group"""
+        hashes = []
+        for group in range(len(groups)):
+            if not store.exists('fetched', group):
+                continue
+            df_sales = self.prepare_sales_data(store.read('fetched', group))
+            if df_sales is None:
+                logger.error("Sales data preparation failed.")
+                return None
+            if len(df_sales) == 0:
+                continue
+            # Register every ID up front, so each group's forecast can encode
+            # articles that were only sold at other groups' locations
+            self.loc_dict.update(df_sales['location_id'].unique())
+            self.prod_dict.update(df_sales['articulo_id'].unique())
+            hashes.append(self.sales_row_hashes(df_sales))
+            store.write('sales', group, df_sales)
+        return {'sales_hashes': np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)}
+    
+    def _stage_model_out_of_core(self, store, groups, reused):
+        """Featurize, train, evaluate and score the location groups, or pass on the reused forecast"""
+        if reused:
+            return {'df_next': self.df_forecast}
+        df_next = self.model_and_score_out_of_core(store, groups)
+        if df_next is None:
+            logger.error("Out-of-core training and scoring failed.")
+            return None
+        log_frame_memory('prediction', df_next)
+        return {'df_next': df_next}
+    
+    def pipeline_stages(self):
+        """
+        Stages of the in-memory pipeline. Evaluation runs alongside the predictions
+        and the model is saved while the stock minimums are written back.
+        """
+        not_reused = lambda values: not values['reused']
+        return [
+            Stage('fetch', self._stage_fetch, outputs=['df']),
+            Stage('sales', self._stage_sales, inputs=['df'], outputs=['df_sales']),
+            Stage('memo', self._stage_memo, inputs=['df_sales'], outputs=['reused'], checkpoint=False),
+            Stage('features', self._stage_features, inputs=['df_sales'],
+                  outputs=['df_model', 'location_ids', 'article_ids', 'feature_context', 'feature_update'],
+                  after=['memo'], when=not_reused),
+            Stage('model', self._stage_model, inputs=['df_model'], after=['memo'], when=not_reused),
+            Stage('evaluate', self._stage_evaluate, inputs=['df_model'], after=['model'],
+                  when=not_reused, optional=True),
+            Stage('predictions', self._stage_predictions, inputs=['df_model', 'reused'],
+                  outputs=['df_next'], after=['model']),
+            Stage('stock_minimums', self._stage_stock_minimums, inputs=['df_next', 'df'], outputs=['df_update']),
+            Stage('write_back', self._stage_write_back, inputs=['df_update'], optional=True),
+            # A reused model is already saved
+            Stage('save', self._stage_save, inputs=['df_update'], after=['evaluate'],
+                  when=not_reused, optional=True)
+        ]
+    
+    def pipeline_stages_out_of_core(self):
+        """Stages of the out-of-core pipeline (see run_pipeline_out_of_core)"""
+        not_reused = lambda values: not values['reused']
+        return [
+            Stage('fetch', self._stage_spill, inputs=['store'], outputs=['groups']),
+            Stage('sales', self._stage_sales_out_of_core, inputs=['store', 'groups'],
+                  outputs=['sales_hashes'], checkpoint=False),
+            Stage('memo', self._stage_memo, inputs=['sales_hashes'], outputs=['reused'], checkpoint=False),
+            Stage('out_of_core_model', self._stage_model_out_of_core, inputs=['store', 'groups', 'reused'],
+                  outputs=['df_next']),
+            Stage('stock_minimums', self._stage_stock_minimums, inputs=['df_next'], outputs=['df_update']),
+            Stage('write_back', self._stage_write_back, inputs=['df_update'], optional=True),
+            Stage('save', self._stage_save, inputs=['df_update'], when=not_reused, optional=True)
+        ]
+    
+    def run_stages(self, dag, values=None):
+        """Run a stage DAG, skipping the stages given with --skip-stages; returns True on success"""
+        skip = [name for name in self.skip_stages if name in dag.stages]
+        for name in self.skip_stages:
+            if name not in dag.stages:
+                logger.warning(f"Stage '{name}' is not part of the {self.execution_mode} pipeline")
+        started = datetime.datetime.now()
+        result = dag.run(values, skip=skip, restore=self.restore_stage, record=self.record_stage)
+        self.save_run_report(dag, result, started)
+        if not result.success:
+            logger.error(f"Weekly stock update pipeline failed. Stages not completed: {result.failed}")
+            return False
+        logger.info(f"Weekly stock update pipeline completed successfully in {result.seconds:.2f}s")
+        return True
+    
+    def save_run_report(self, dag, result, started):
+        """
+        Write the run report next to the predictions: the run settings and outcome,
+        and the state, timing, CPU time, peak memory growth and row counts of every
+        stage. Returns the report path, or None on failure.
+        """
+        try:
+            stages = []
+            for name in dag.stages:
+                entry = {'name': name, 'state': result.states.get(name)}
+                entry.update(result.metrics.get(name, {}))
+                stages.append(entry)
+            report = {
+                'run_id': None if self.checkpoint is None else self.checkpoint.run_id,
+                'started': started.isoformat(),
+                'finished': datetime.datetime.now().isoformat(),
+                'success': result.success,
+                'failed_stages': result.failed,
+                'wall_seconds': result.seconds,
+                'peak_rss_mb': peak_rss_mb(),
+                'settings': {
+                    'execution_mode': self.execution_mode,
+                    'fetch_mode': self.fetch_mode,
+                    'training_strategy': self.training_strategy,
+                    'training_partition': self.training_partition,
+                    'forecast_horizon': self.forecast_horizon,
+                    'stage_parallelism': config.STAGE_PARALLELISM,
+                    'skip_stages': self.skip_stages
+                },
+                'reused_model': result.values.get('reused'),
+                'fingerprint': self.fingerprint,
+                'metrics': self.train_metrics,
+                'write_back': self.write_back_summary,
+                'stages': stages
+            }
+            create_directory_if_not_exists(config.PATHS['RESULTS'])
+            report_path = os.path.join(config.PATHS['RESULTS'], f"run_report_{started.strftime('%Y%m%d_%H%M%S')}.json")
+            write_json_atomic(report_path, report)
+            logger.info(f"Run report saved to: {report_path}")
+            return report_path
         
-        # Save model and results
-        self.save_model_and_results(df_update)
+        except Exception as e:
+            logger.error(f"Error saving run report: {e}")
+            return None
+    
+    def run_pipeline_out_of_core(self):
+        """
+        Run the pipeline one group of locations at a time.
         
-        logger.info("Weekly stock update pipeline completed successfully")
-        return True
+        The sales are fetched as location groups sized by MEMORY_BUDGET_MB (collect mode
+        fetches the full tables and splits them) and spilled to Parquet under
+        PATHS['SPILL'] (inside the run checkpoint when it is enabled, so a resumed run
+        does not fetch again). Each group is prepared,
+        featurized and scored on its own, and the global model is trained from the
+        spilled features through xgboost's external-memory matrix. Only the small
+        per-group results (row hashes, forecasts and error sums) are combined.
+        Location partition models are fitted per group; category partitions span
+        groups and are not supported.
+        """
+        logger.info("Starting weekly stock update pipeline (out-of-core)")
+        if self.training_partition == 'category':
+            logger.warning("Category partition models need every location at once. Training the global model only")
+            self.training_partition = None
+        
+        if self.checkpoint is not None:
+            store = SpillStore(root=self.checkpoint.directory, run_id='spill')
+        else:
+            store = SpillStore()
+        try:
+            return self.run_stages(StageDAG(self.pipeline_stages_out_of_core()), {'store': store})
+        finally:
+            # A checkpointed spill is deleted with the run once it succeeds
+            if self.checkpoint is None:
+                store.cleanup()
+    
+    def run_pipeline_in_memory(self):
+        """Run the entire pipeline on the full frames"""
+        logger.info("Starting weekly stock update pipeline")
+        return self.run_stages(StageDAG(self.pipeline_stages()))
+    
+    def run_pipeline(self):
+        """
+        Run the entire pipeline as a DAG of stages (see pipeline_stages). With checkpoints
+        enabled every finished stage is saved, and a run started with --resume RUN_ID
+        restores the stages it finished instead of running them again.
+        """
+        self.checkpoint = self.open_checkpoint()
+        if self.resume_run is not None and self.checkpoint is None:
+            return False
+        
+        # Connect to database
+        if not self.connect_to_database():
+            logger.error("Database connection failed. Exiting pipeline.")
+            success = False
+        elif self.execution_mode == 'out_of_core':
+            success = self.run_pipeline_out_of_core()
+        else:
+            success = self.run_pipeline_in_memory()
+        self.save_feature_state(success)
+        self.close_checkpoint(success)
+        return success
+
+
+def parse_args(argv=None):
+    """Parse command line options for a manual or scheduled run"""
+    parser = argparse.ArgumentParser(description="Weekly stock minimum update pipeline")
+    parser.add_argument(
+        '--fetch-mode',
+        choices=['pushdown', 'stream', 'collect'],
+        default=None,
+        help=f"Data fetch strategy (default from config: {config.FETCH_MODE})"
+    )
+    parser.add_argument(
+        '--training-strategy',
+        choices=['full', 'warm_start'],
+        default=None,
+        help=f"Retrain from scratch or continue the latest model (default from config: {config.TRAINING_STRATEGY})"
+    )
+    parser.add_argument(
+        '--full-refresh',
+        action='store_true',
+        help="Rebuild the local sales cache from the full history"
+    )
+    parser.add_argument(
+        '--partition',
+        dest='training_partition',
+        choices=['location', 'category'],
+        default=None,
+        help=f"Also train one model per location or per category (default from config: {config.TRAINING_PARTITION})"
+    )
+    parser.add_argument(
+        '--retrain-partitions',
+        nargs='+',
+        metavar='KEY',
+        default=None,
+        help="Refit only these partitions (location IDs or categories) and keep the other saved partition models"
+    )
+    parser.add_argument(
+        '--horizon',
+        dest='forecast_horizon',
+        type=int,
+        default=None,
+        help=f"Number of months to forecast (default from config: {config.FORECAST_HORIZON})"
+    )
+    parser.add_argument(
+        '--execution-mode',
+        choices=['in_memory', 'out_of_core'],
+        default=None,
+        help=f"Process all locations at once or one memory-budgeted group at a time "
+             f"(default from config: {config.EXECUTION_MODE})"
+    )
+    parser.add_argument(
+        '--resume',
+        dest='resume_run',
+        metavar='RUN_ID',
+        default=None,
+        help="Continue a failed run from its checkpoint, skipping the stages it finished ('latest' for the newest run)"
+    )
+    parser.add_argument(
+        '--skip-stages',
+        nargs='+',
+        choices=['evaluate', 'write_back', 'save'],
+        metavar='STAGE',
+        default=None,
+        help="Optional stages not to run: evaluate, write_back, save (default from config: "
+             f"{config.SKIP_STAGES}). Skipping write_back gives a dry run"
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help="Retrain even if the training data and parameters match the last saved model"
+    )
+    return parser.parse_args(argv)
 
 
 # Main execution
 if __name__ == "__main__":
-    updater = WeeklyStockUpdate()
+    args = parse_args()
+    updater = WeeklyStockUpdate(
+        fetch_mode=args.fetch_mode,
+        full_refresh=args.full_refresh,
+        training_strategy=args.training_strategy,
+        training_partition=args.training_partition,
+        retrain_partitions=args.retrain_partitions,
+        force=args.force,
+        forecast_horizon=args.forecast_horizon,
+        execution_mode=args.execution_mode,
+        resume_run=args.resume_run,
+        skip_stages=args.skip_stages
+    )
     success = updater.run_pipeline()
     sys.exit(0 if success else 1)
@@ -0,0 +1,102 @@
+"""
+In-memory stand-in for a hana_ml ConnectionContext, backed by sqlite.
+
+The configured tables live in an attached database named after DB_SCHEMA, so the
+pipeline's '"SCHEMA"."TABLE"' queries run unchanged. Every statement sent through
+a cursor is logged, and HANA-only statements (such as the staging table MERGE)
+fail like any other SQL error.
+"""
+
+import sqlite3
+import pandas as pd
+
+from config import stock_update_config as config
+
+class FakeFrame:
+    """Result of ConnectionContext.sql"""
+
+    def __init__(self, connection, query):
+        self._connection = connection
+        self._query = query
+
+    def collect(self):
+        return pd.read_sql(self._query, self._connection)
+
+class FakeCursor:
+    """DB-API cursor that logs the statements it runs"""
+
+    def __init__(self, owner):
+        self._owner = owner
+        self._cursor = owner.raw.cursor()
+
+    def execute(self, statement, parameters=()):
+        self._owner.statements.append(statement)
+        return self._cursor.execute(statement, parameters)
+
+    def executemany(self, statement, rows):
+        self._owner.statements.append(statement)
+        return self._cursor.executemany(statement, rows)
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def close(self):
+        self._cursor.close()
+
+class FakeDBConnection:
+    """The DB-API connection exposed as ConnectionContext.connection"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.statements = []
+        self.commits = 0
+        self.autocommit = True
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def getautocommit(self):
+        return self.autocommit
+
+    def setautocommit(self, value):
+        self.autocommit = value
+
+    def commit(self):
+        self.commits += 1
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+class FakeHana:
+    """ConnectionContext with the configured tables loaded from DataFrames"""
+
+    def __init__(self, **tables):
+        """`tables` maps a TABLES key (e.g. INVENTORY) to its rows"""
+        self.raw = sqlite3.connect(':memory:', check_same_thread=False)
+        self.raw.execute(f"ATTACH DATABASE ':memory:' AS {config.DB_SCHEMA}")
+        self.connection = FakeDBConnection(self.raw)
+        self.queries = []
+        for key, df in tables.items():
+            self.load(key, df)
+
+    def load(self, key, df):
+        """Replace the contents of a configured table"""
+        name = config.TABLES[key]
+        # pandas ignores the schema with sqlite: load the rows into a scratch table and copy them
+        df.to_sql('_load', self.raw, index=False, if_exists='replace')
+        self.raw.execute(f'DROP TABLE IF EXISTS "{config.DB_SCHEMA}"."{name}"')
+        self.raw.execute(f'CREATE TABLE "{config.DB_SCHEMA}"."{name}" AS SELECT * FROM main._load')
+        self.raw.execute('DROP TABLE main._load')
+        self.raw.commit()
+
+    def table(self, key):
+        """Current contents of a configured table"""
+        return pd.read_sql(f'SELECT * FROM "{config.DB_SCHEMA}"."{config.TABLES[key]}"', self.raw)
+
+    def sql(self, query):
+        self.queries.append(query)
+        return FakeFrame(self.raw, query)
+
+    def close(self):
+        pass
@@ -0,0 +1,45 @@
+"""
+Unit tests for the persistent category dictionary.
+"""
+
+import numpy as np
+import pytest
+
+from pipelines.category_dictionary import CategoryDictionary, UNKNOWN_CODE
+
+def test_codes_are_stable_across_updates_and_reloads(tmp_path):
+    dictionary = CategoryDictionary('product', root=str(tmp_path))
+    assert dictionary.update([30, 10, 20, 10]) == 3
+    first = dictionary.encode([10, 20, 30])
+    dictionary.save()
+
+    reloaded = CategoryDictionary('product', root=str(tmp_path))
+    np.testing.assert_array_equal(reloaded.encode([10, 20, 30]), first)
+    # New IDs get the next free codes, including ones that sort before the old IDs
+    assert reloaded.update([5, 20, 40]) == 2
+    np.testing.assert_array_equal(reloaded.encode([10, 20, 30]), first)
+    np.testing.assert_array_equal(reloaded.encode([5, 40]), [3, 4])
+    assert reloaded.extends(dictionary.ids)
+
+def test_unknown_and_missing_ids_map_to_unknown_code(tmp_path):
+    dictionary = CategoryDictionary('location', root=str(tmp_path))
+    np.testing.assert_array_equal(dictionary.encode([1, 2]), [UNKNOWN_CODE, UNKNOWN_CODE])
+    dictionary.update(np.array([1.0, 2.0, np.nan]))
+    assert len(dictionary) == 2
+    np.testing.assert_array_equal(dictionary.encode(np.array([2.0, np.nan, 99.0, -3.0])), [1, UNKNOWN_CODE, UNKNOWN_CODE, UNKNOWN_CODE])
+
+def test_sparse_ids_encode_like_dense_ids(tmp_path):
+    dictionary = CategoryDictionary('product', root=str(tmp_path))
+    dictionary.update([10 ** 12, 7, 10 ** 9])
+    assert dictionary._table is None
+    np.testing.assert_array_equal(dictionary.encode([7, 10 ** 9, 10 ** 12, 8]), [0, 1, 2, UNKNOWN_CODE])
+
+def test_restore_only_accepts_extending_snapshots(tmp_path):
+    dictionary = CategoryDictionary('product', root=str(tmp_path))
+    dictionary.update([1, 2, 3])
+    dictionary.restore([1, 2, 3, 9])
+    assert dictionary.encode([9])[0] == 3
+    with pytest.raises(ValueError):
+        dictionary.restore([2, 1, 3, 9])
+    with pytest.raises(ValueError):
+        dictionary.restore([1, 2])
@@ -0,0 +1,67 @@
+"""
+Unit tests for the incremental demand feature engine.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from pipelines.feature_engine import FeatureEngine
+
+def monthly_sales(periods, n_locations=3, n_articles=4, seed=0):
+    """Monthly sales of every (location, article) pair, with some months missing"""
+    rng = np.random.default_rng(seed)
+    rows = [
+        (location, article, period // 100, period % 100, float(rng.poisson(5)))
+        for period in periods
+        for location in range(1, n_locations + 1)
+        for article in range(100, 100 + n_articles)
+        if rng.random() > 0.2
+    ]
+    return pd.DataFrame(rows, columns=['location_id', 'articulo_id', 'year', 'month', 'unidades_vendidas'])
+
+def months(first_year, count):
+    return [(first_year + (m // 12)) * 100 + m % 12 + 1 for m in range(count)]
+
+def engine(root, **kwargs):
+    return FeatureEngine(lags=[1, 2, 12], windows=[3, 6], root=str(root), **kwargs)
+
+def test_incremental_update_matches_full_rebuild(tmp_path):
+    history = monthly_sales(months(2022, 30))
+    periods = history['year'] * 100 + history['month']
+    first_run = history[periods < 202405]
+    # The second run revises the last month of the first run and appends two months
+    revised = history.copy()
+    revised.loc[(revised['year'] * 100 + revised['month']) == 202404, 'unidades_vendidas'] += 1
+
+    incremental = engine(tmp_path / 'incremental')
+    incremental.add_features(first_run)
+    assert incremental.save()
+    assert not incremental.needs_rebuild()
+    updated = engine(tmp_path / 'incremental').add_features(revised)
+    rebuilt = engine(tmp_path / 'full', incremental=False).add_features(revised)
+
+    names = incremental.feature_names
+    np.testing.assert_allclose(updated[names].to_numpy(), rebuilt[names].to_numpy(), rtol=1e-5, equal_nan=True)
+
+def test_state_is_only_persisted_by_save(tmp_path):
+    features = engine(tmp_path)
+    features.add_features(monthly_sales(months(2023, 18)))
+    assert features.pending_update() is not None
+    assert not os.path.exists(features.state_path)
+
+    features.discard()
+    assert not features.save()
+    assert engine(tmp_path).needs_rebuild()
+
+def test_restored_update_saves_the_same_state(tmp_path):
+    features = engine(tmp_path / 'first')
+    features.add_features(monthly_sales(months(2023, 18)))
+    resumed = engine(tmp_path / 'resumed')
+    resumed.restore_pending_update(features.pending_update())
+    assert features.save() and resumed.save()
+
+    with np.load(features.state_path) as saved, np.load(resumed.state_path) as restored:
+        for name in saved.files:
+            np.testing.assert_array_equal(saved[name], restored[name])
+    pd.testing.assert_frame_equal(pd.read_parquet(features.cache_path), pd.read_parquet(resumed.cache_path))
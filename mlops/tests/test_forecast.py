@@ -0,0 +1,80 @@
+"""
+Unit tests for the multi-horizon forecast and the horizon used for write-back.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from xgboost import XGBRegressor
+
+from pipelines.weekly_stock_update import WeeklyStockUpdate
+from pipelines.category_dictionary import CategoryDictionary
+from config import stock_update_config as config
+from fake_hana import FakeHana
+
+INVENTORY = pd.DataFrame({
+    'INVENTARIO_ID': [1, 2, 3],
+    # Article 999 never sold, so it cannot be encoded and is not forecast
+    'ARTICULO_ID': [100, 101, 999],
+    'LOCATION_ID': [1, 2, 1],
+    'STOCKACTUAL': 40,
+    'STOCKMINIMO': 5
+})
+
+@pytest.fixture
+def forecaster(tmp_path, monkeypatch):
+    """A pipeline whose model predicts 10 units per calendar month number, with data up to 2024-12"""
+    monkeypatch.setattr(config, 'FEATURE_LAGS', [])
+    monkeypatch.setattr(config, 'FEATURE_ROLLING_WINDOWS', [])
+    pipeline = WeeklyStockUpdate(forecast_horizon=3)
+    pipeline.loc_dict = CategoryDictionary('location', root=str(tmp_path))
+    pipeline.prod_dict = CategoryDictionary('article', root=str(tmp_path))
+    pipeline.loc_dict.update([1, 2])
+    pipeline.prod_dict.update([100, 101])
+    pipeline.df_inventory = INVENTORY
+
+    months = np.tile(np.arange(1, 13), 4)
+    X = np.column_stack([
+        np.repeat([0, 1], 24), np.repeat([0, 1], 24), np.full(48, 2024), months,
+        np.sin(2 * np.pi * (months - 1) / 12), np.cos(2 * np.pi * (months - 1) / 12)
+    ])
+    pipeline.model = XGBRegressor(n_estimators=100, max_depth=3).fit(X, months * 10.0)
+    return pipeline
+
+def model_frame():
+    return pd.DataFrame({
+        'location_id': [1, 2], 'articulo_id': [100, 101],
+        'date': pd.to_datetime(['2024-11-01', '2024-12-01'])
+    })
+
+def test_each_pair_gets_one_row_per_month_across_the_year_end(forecaster):
+    df_next = forecaster.predict_next_period(model_frame())
+    assert len(df_next) == 2 * 3
+    assert set(zip(df_next['location_id'], df_next['articulo_id'])) == {(1, 100), (2, 101)}
+    for _, rows in df_next.groupby(['location_id', 'articulo_id']):
+        rows = rows.sort_values('horizon')
+        assert list(rows['horizon']) == [1, 2, 3]
+        assert list(zip(rows['year'], rows['month'])) == [(2025, 1), (2025, 2), (2025, 3)]
+        assert list(rows['date']) == list(pd.to_datetime(['2025-01-01', '2025-02-01', '2025-03-01']))
+    # The months are scored separately: the predictions follow the calendar month
+    by_month = df_next.groupby('month')['unidades_pred'].mean()
+    assert by_month[1] < by_month[2] < by_month[3]
+
+@pytest.mark.parametrize('stock_min_horizon', [2, 'max'])
+def test_only_the_selected_month_is_written_back(forecaster, monkeypatch, stock_min_horizon):
+    monkeypatch.setattr(config, 'STOCK_MIN_HORIZON', stock_min_horizon)
+    monkeypatch.setattr(config, 'WRITE_BACK_TOLERANCE', 0)
+    df_next = forecaster.predict_next_period(model_frame())
+    df_update = forecaster.calculate_new_stock_minimums(df_next, None)
+    assert len(df_update) == 2
+    expected_month = 2 if stock_min_horizon == 2 else 3
+    assert set(df_update['horizon']) == {expected_month}
+
+    forecaster.conn = FakeHana(INVENTORY=INVENTORY)
+    assert forecaster.update_database(df_update) == 2
+    written = forecaster.conn.table('INVENTORY').set_index('INVENTARIO_ID')['STOCKMINIMO']
+    selected = df_next[df_next['horizon'] == expected_month].set_index('articulo_id')['unidades_pred']
+    expected = (selected * config.SAFETY_FACTOR).round().astype(int)
+    assert written[1] == expected[100] and written[2] == expected[101]
+    # The pair without a forecast keeps its minimum
+    assert written[3] == 5
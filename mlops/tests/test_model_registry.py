@@ -0,0 +1,57 @@
+"""
+Unit tests for the content-addressed model registry.
+"""
+
+import os
+import numpy as np
+from xgboost import XGBRegressor
+
+from pipelines.model_registry import ModelRegistry
+from config import stock_update_config as config
+
+def small_model(seed=0, n_estimators=5):
+    """A tiny fitted regressor"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(50, 3))
+    model = XGBRegressor(n_estimators=n_estimators, max_depth=2, random_state=seed)
+    model.fit(X, X[:, 0] * 2 + rng.normal(size=50))
+    return model
+
+def encoders(n=3):
+    return {'location': np.arange(1, n + 1), 'product': np.arange(10, 10 + n)}
+
+def test_round_trip_and_latest(tmp_path):
+    registry = ModelRegistry(root=str(tmp_path))
+    assert registry.latest() is None
+    model = small_model()
+    manifest = registry.register(model, encoders(), {'7': small_model(seed=1)}, fingerprint='abc', last_trained_period=202401)
+
+    latest = registry.latest()
+    assert latest['version'] == manifest['version']
+    assert latest['fingerprint'] == 'abc'
+    X = np.random.default_rng(2).normal(size=(5, 3))
+    np.testing.assert_allclose(registry.load_model(latest).predict(X), model.predict(X))
+    loaded = registry.load_encoders(latest)
+    np.testing.assert_array_equal(loaded['location'], encoders()['location'])
+    assert list(registry.load_partition_models(latest)) == ['7']
+
+def test_unchanged_artifacts_are_stored_once(tmp_path):
+    registry = ModelRegistry(root=str(tmp_path))
+    model = small_model()
+    first = registry.register(model, encoders())
+    second = registry.register(model, encoders())
+
+    assert first['version'] != second['version']
+    assert first['artifacts'] == second['artifacts']
+    assert len(os.listdir(registry.blobs_dir)) == 2
+
+def test_retention_prunes_versions_and_unreferenced_blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'REGISTRY_KEEP_VERSIONS', 2)
+    registry = ModelRegistry(root=str(tmp_path))
+    manifests = [registry.register(small_model(seed=i), encoders(3 + i)) for i in range(4)]
+
+    kept = sorted(name[:-len('.json')] for name in os.listdir(registry.manifests_dir))
+    assert kept == [manifest['version'] for manifest in manifests[-2:]]
+    referenced = {name for manifest in manifests[-2:] for name in (manifest['artifacts']['model'], manifest['artifacts']['encoders'])}
+    assert set(os.listdir(registry.blobs_dir)) == referenced
+    assert registry.latest()['version'] == manifests[-1]['version']
@@ -0,0 +1,27 @@
+"""
+Unit tests for the location group planning of out-of-core runs.
+"""
+
+import numpy as np
+import pandas as pd
+
+from pipelines.out_of_core import pack_location_counts, plan_location_groups
+
+def test_groups_from_counts_match_groups_from_rows():
+    rng = np.random.default_rng(0)
+    location_ids = rng.choice([3, 8, 11, 20, 21, 40], size=500, p=[0.3, 0.1, 0.2, 0.1, 0.2, 0.1])
+    counts = pd.Series(location_ids).value_counts()
+    for max_rows in (1, 60, 120, 1000):
+        from_rows = plan_location_groups(location_ids, max_rows, extra_locations=[5, 99])
+        from_counts = pack_location_counts(counts, max_rows, extra_locations=[5, 99])
+        assert [list(group) for group in from_rows] == [list(group) for group in from_counts]
+
+def test_groups_are_contiguous_id_ranges_within_budget():
+    counts = pd.Series({7: 40, 1: 30, 4: 30, 12: 90, 9: 10, 30: 200})
+    groups = pack_location_counts(counts, max_rows=80, extra_locations=[2, 50])
+    locations = np.concatenate(groups)
+    # Every location once, in ID order, so each group is its own (min, max) range
+    assert list(locations) == sorted(counts.index.tolist() + [2, 50])
+    for group in groups:
+        rows = counts.reindex(group, fill_value=0).sum()
+        assert rows <= 80 or len(group) == 1
@@ -0,0 +1,93 @@
+"""
+Unit tests for the stage checkpoints of a pipeline run.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from xgboost import XGBRegressor
+
+from pipelines.run_checkpoint import RunCheckpoint
+from config import stock_update_config as config
+
+def small_model():
+    X = np.arange(40, dtype=np.float64).reshape(20, 2)
+    model = XGBRegressor(n_estimators=3, max_depth=2)
+    model.fit(X, X[:, 0])
+    return model
+
+def test_outputs_round_trip_through_a_resumed_run(tmp_path):
+    checkpoint = RunCheckpoint('run1', root=str(tmp_path))
+    frame = pd.DataFrame({'location_id': [1, 2], 'units': [3.5, 4.0]})
+    series = pd.Series([1.0, 2.0])
+    model = small_model()
+    checkpoint.save(
+        'model',
+        frame=frame,
+        series=series,
+        model=model,
+        models={'7': small_model()},
+        array=np.arange(4),
+        arrays={'keys': np.arange(3), 'tail': np.ones((3, 2))},
+        array_list=[np.arange(2), np.arange(3)],
+        settings={'horizon': 2},
+        period=202401,
+        missing=None
+    )
+
+    resumed = RunCheckpoint('run1', root=str(tmp_path), resume=True)
+    assert resumed.completed('model') and not resumed.completed('save')
+    outputs = resumed.load('model')
+    pd.testing.assert_frame_equal(outputs['frame'], frame)
+    pd.testing.assert_series_equal(outputs['series'], series, check_names=False)
+    X = np.ones((2, 2))
+    np.testing.assert_allclose(outputs['model'].predict(X), model.predict(X))
+    assert list(outputs['models']) == ['7']
+    np.testing.assert_array_equal(outputs['array'], np.arange(4))
+    np.testing.assert_array_equal(outputs['arrays']['tail'], np.ones((3, 2)))
+    assert [len(array) for array in outputs['array_list']] == [2, 3]
+    assert outputs['settings'] == {'horizon': 2}
+    assert outputs['period'] == 202401 and outputs['missing'] is None
+    assert set(resumed.load('model', names=['period'])) == {'period'}
+
+def test_resume_requires_an_existing_run(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        RunCheckpoint('latest', root=str(tmp_path), resume=True)
+    with pytest.raises(FileNotFoundError):
+        RunCheckpoint('nope', root=str(tmp_path), resume=True)
+
+    RunCheckpoint('20240101T000000', root=str(tmp_path))
+    RunCheckpoint('20240102T000000', root=str(tmp_path))
+    assert RunCheckpoint('latest', root=str(tmp_path), resume=True).run_id == '20240102T000000'
+
+def test_changed_fingerprint_discards_downstream_stages(tmp_path):
+    checkpoint = RunCheckpoint('run1', root=str(tmp_path))
+    checkpoint.bind_fingerprint('abc', ['features', 'model'])
+    for stage in ('fetch', 'features', 'model'):
+        checkpoint.save(stage, value=1)
+
+    same = RunCheckpoint('run1', root=str(tmp_path), resume=True)
+    same.bind_fingerprint('abc', ['features', 'model'])
+    assert all(same.completed(stage) for stage in ('fetch', 'features', 'model'))
+
+    changed = RunCheckpoint('run1', root=str(tmp_path), resume=True)
+    changed.bind_fingerprint('def', ['features', 'model'])
+    assert changed.completed('fetch')
+    assert not changed.completed('features') and not changed.completed('model')
+    # The new fingerprint is recorded, so a later resume keeps the rerun stages
+    changed.save('features', value=2)
+    again = RunCheckpoint('run1', root=str(tmp_path), resume=True)
+    again.bind_fingerprint('def', ['features', 'model'])
+    assert again.load('features') == {'value': 2}
+
+def test_retention_keeps_the_newest_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'CHECKPOINT_KEEP_RUNS', 2)
+    for day in range(1, 5):
+        RunCheckpoint(f'2024010{day}T000000', root=str(tmp_path))
+    RunCheckpoint.apply_retention(str(tmp_path))
+    assert RunCheckpoint.list_runs(str(tmp_path)) == ['20240103T000000', '20240104T000000']
+
+    checkpoint = RunCheckpoint('20240104T000000', root=str(tmp_path), resume=True)
+    checkpoint.remove()
+    assert not os.path.exists(checkpoint.directory)
@@ -0,0 +1,91 @@
+"""
+Unit tests for the monthly sales aggregation of the weekly pipeline.
+"""
+
+import numpy as np
+import pandas as pd
+
+import pipelines.weekly_stock_update as wsu
+from pipelines.weekly_stock_update import WeeklyStockUpdate
+from config import stock_update_config as config
+
+class FakeCursor:
+    """Cursor returning fixed history rows through fetchmany"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.position = 0
+
+    def execute(self, query):
+        self.position = 0
+
+    def fetchmany(self, size):
+        chunk = self.rows[self.position:self.position + size]
+        self.position += size
+        return chunk
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    """Stand-in for a hana_ml ConnectionContext"""
+
+    def __init__(self, rows):
+        self.connection = self
+        self._cursor = FakeCursor(rows)
+
+    def cursor(self):
+        return self._cursor
+
+def history_rows(groups, repeats, seed=0):
+    """(ARTICULO_ID, LOCATION_ID, ANIO, MES, EXPORTACION) rows, each group repeated `repeats` times"""
+    rng = np.random.default_rng(seed)
+    keys = [(article, 1 + article % 3, 2024, 1 + article % 12) for article in range(1, groups + 1)]
+    rows = [key + (int(rng.integers(0, 10)),) for key in keys for _ in range(repeats)]
+    order = rng.permutation(len(rows))
+    return [rows[i] for i in order]
+
+def test_stream_aggregate_matches_groupby_and_folds_linearly(monkeypatch):
+    rows = history_rows(groups=200, repeats=5)
+    monkeypatch.setattr(config, 'STREAM_CHUNK_SIZE', 10)
+    merges = []
+    fold = wsu.fold_sales_batches
+
+    def counting_fold(parts, keys):
+        if len(parts) > 1:
+            merges.append(sum(part.num_rows for part in parts))
+        return fold(parts, keys)
+
+    monkeypatch.setattr(wsu, 'fold_sales_batches', counting_fold)
+    updater = WeeklyStockUpdate(incremental_features=False)
+    df = updater.stream_sales_aggregate(FakeConnection(rows))
+
+    keys = ['ARTICULO_ID', 'LOCATION_ID', 'ANIO', 'MES']
+    expected = pd.DataFrame(rows, columns=keys + ['EXPORTACION']).groupby(keys, as_index=False)['EXPORTACION'].sum()
+    pd.testing.assert_frame_equal(
+        df.sort_values(keys).reset_index(drop=True),
+        expected.sort_values(keys).reset_index(drop=True),
+        check_dtype=False
+    )
+    # 100 chunks, 200 groups: the aggregate is not re-grouped after every chunk
+    assert len(merges) < 20
+    assert sum(merges) < 3 * len(rows)
+
+def test_fast_prepare_drops_rows_without_sales():
+    rows = history_rows(groups=30, repeats=3)
+    columns = ['ARTICULO_ID', 'LOCATION_ID', 'ANIO', 'MES', 'EXPORTACION']
+    sales = pd.DataFrame(rows, columns=columns)
+    # Inventory rows without sales, as collect mode's left join returns them
+    inventory = pd.DataFrame({'ARTICULO_ID': [500, 501, 1], 'LOCATION_ID': [1, 2, 2]})
+    df = pd.concat([sales, inventory], ignore_index=True)
+    assert df['ANIO'].isna().sum() == 3
+
+    updater = WeeklyStockUpdate(incremental_features=False)
+    updater.fast_prepare = False
+    expected = updater.prepare_sales_data(sales)
+    updater.fast_prepare = True
+    prepared = updater.prepare_sales_data(df)
+    assert prepared is not None
+    assert prepared['year'].dtype.kind == 'i' and prepared['month'].dtype.kind == 'i'
+    assert not prepared['unidades_vendidas'].isna().any()
+    pd.testing.assert_frame_equal(prepared[expected.columns], expected, check_dtype=False)
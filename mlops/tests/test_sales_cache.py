@@ -0,0 +1,137 @@
+"""
+Unit tests for the incremental monthly sales cache of the pushdown fetch.
+"""
+
+import os
+import json
+import pandas as pd
+import pytest
+
+from pipelines.weekly_stock_update import WeeklyStockUpdate, shift_period
+from config import stock_update_config as config
+from fake_hana import FakeHana
+
+def history(first, months, pairs=3):
+    """HANA inventory and history tables with `months` months of sales from `first` (YYYYMM)"""
+    inventory = pd.DataFrame({
+        'INVENTARIO_ID': range(1, pairs + 1),
+        'ARTICULO_ID': range(100, 100 + pairs),
+        'LOCATION_ID': [1 + i % 2 for i in range(pairs)],
+        'STOCKACTUAL': 50,
+        'STOCKMINIMO': 10
+    })
+    periods = [shift_period(first, m) for m in range(months)]
+    rows = pd.DataFrame([
+        {'INVENTARIO_ID': item, 'ANIO': period // 100, 'MES': period % 100, 'EXPORTACION': item + m}
+        for m, period in enumerate(periods)
+        for item in inventory['INVENTARIO_ID']
+    ])
+    return {'INVENTORY': inventory, 'HISTORY': rows}
+
+@pytest.fixture
+def sales_cache(tmp_path, monkeypatch):
+    """Cache directory of the test, with one fetch connection and the features off"""
+    monkeypatch.setitem(config.PATHS, 'CACHE', str(tmp_path / 'cache'))
+    monkeypatch.setattr(config, 'FETCH_PARALLELISM', 1)
+    monkeypatch.setattr(config, 'SALES_CACHE_ENABLED', True)
+    monkeypatch.setattr(config, 'TRAINING_WINDOW_MODE', 'window')
+    return tmp_path / 'cache'
+
+def fetch(hana, full_refresh=False):
+    """Run the pushdown fetch on `hana`; returns the sales and the sales queries sent"""
+    updater = WeeklyStockUpdate(fetch_mode='pushdown', full_refresh=full_refresh)
+    updater.feature_lookback_months = 0
+    updater.conn = hana
+    sent = len(hana.queries)
+    df = updater.fetch_data_pushdown()
+    queries = [query for query in hana.queries[sent:] if 'SUM(H.EXPORTACION)' in query]
+    return df, queries
+
+def test_switch_to_full_history_rebuilds_a_windowed_cache(sales_cache, monkeypatch):
+    hana = FakeHana(**history(202201, 24))
+    monkeypatch.setattr(config, 'TRAINING_MONTHS', 6)
+    windowed, _ = fetch(hana)
+    assert len(windowed) == 7 * 3
+
+    monkeypatch.setattr(config, 'TRAINING_MONTHS', None)
+    full, queries = fetch(hana)
+    assert len(full) == 24 * 3
+    assert 'WHERE' not in queries[0]
+    with open(sales_cache / 'sales_watermark.json', encoding='utf-8') as f:
+        assert json.load(f)['start'] is None
+
+    # A full-history cache serves any window without a rebuild
+    monkeypatch.setattr(config, 'TRAINING_MONTHS', 6)
+    windowed, queries = fetch(hana)
+    assert len(windowed) == 7 * 3
+    assert 'H.ANIO * 100 + H.MES >= 202312' in queries[0]
+
+def test_window_before_the_first_sale_keeps_the_cache(sales_cache, monkeypatch):
+    # 12 months of history and a 24-month window: the window starts before the first cached file
+    hana = FakeHana(**history(202301, 12))
+    monkeypatch.setattr(config, 'TRAINING_MONTHS', 24)
+    first, _ = fetch(hana)
+    assert len(first) == 12 * 3
+    with open(sales_cache / 'sales_watermark.json', encoding='utf-8') as f:
+        assert json.load(f)['start'] == 202112
+
+    second, queries = fetch(hana)
+    assert len(second) == 12 * 3
+    assert 'H.ANIO * 100 + H.MES >= 202312' in queries[0]
+    # A longer window than the cache was built for rebuilds it
+    monkeypatch.setattr(config, 'TRAINING_MONTHS', 30)
+    _, queries = fetch(hana)
+    assert 'H.ANIO * 100 + H.MES >= 202106' in queries[0]
+
+def cached_periods(cache_dir):
+    return sorted(int(name[len('monthly_sales_'):-len('.parquet')])
+                  for name in os.listdir(cache_dir) if name.startswith('monthly_sales_'))
+
+def test_incremental_fetch_starts_at_the_watermark(sales_cache, monkeypatch):
+    monkeypatch.setattr(config, 'TRAINING_MONTHS', 6)
+    tables = history(202301, 12)
+    hana = FakeHana(**tables)
+    fetch(hana)
+    assert cached_periods(sales_cache) == list(range(202306, 202313))
+
+    # A new month arrives and the watermark month is revised
+    new_month = tables['HISTORY'][tables['HISTORY']['MES'] == 12].assign(ANIO=2024, MES=1)
+    revised = tables['HISTORY'].copy()
+    revised.loc[(revised['ANIO'] == 2023) & (revised['MES'] == 12), 'EXPORTACION'] = 1000
+    hana.load('HISTORY', pd.concat([revised, new_month], ignore_index=True))
+
+    df, queries = fetch(hana)
+    assert 'H.ANIO * 100 + H.MES >= 202312' in queries[0]
+    periods = df['ANIO'] * 100 + df['MES']
+    # The window moved by one month: 202307..202401, each period once
+    assert sorted(periods.unique()) == [202307, 202308, 202309, 202310, 202311, 202312, 202401]
+    assert len(df) == 7 * 3
+    assert (df.loc[periods == 202312, 'EXPORTACION'] == 1000).all()
+    cached = pd.read_parquet(sales_cache / 'monthly_sales_202312.parquet')
+    assert (cached['EXPORTACION'] == 1000).all()
+    with open(sales_cache / 'sales_watermark.json', encoding='utf-8') as f:
+        mark = json.load(f)
+    assert (mark['ANIO'], mark['MES'], mark['start']) == (2024, 1, 202306)
+
+def test_reset_clears_the_cached_periods(sales_cache):
+    updater = WeeklyStockUpdate(fetch_mode='pushdown')
+    rows = lambda period: pd.DataFrame({
+        'ARTICULO_ID': [1], 'LOCATION_ID': [1], 'ANIO': [period // 100], 'MES': [period % 100], 'EXPORTACION': [5]
+    })
+    updater.save_sales_cache(pd.concat([rows(202301), rows(202302)]), reset=True, start=202301)
+    updater.save_sales_cache(rows(202303))
+    assert cached_periods(sales_cache) == [202301, 202302, 202303]
+    assert updater.load_sales_cache_state() == {'watermark': 202303, 'first': 202301, 'start': 202301}
+    assert len(updater.load_sales_cache(since=202302, until=202303)) == 1
+
+    updater.save_sales_cache(rows(202305), reset=True, start=202305)
+    assert cached_periods(sales_cache) == [202305]
+    assert updater.load_sales_cache_state() == {'watermark': 202305, 'first': 202305, 'start': 202305}
+
+def test_full_refresh_ignores_the_cache(sales_cache, monkeypatch):
+    monkeypatch.setattr(config, 'TRAINING_MONTHS', 6)
+    hana = FakeHana(**history(202301, 12))
+    fetch(hana)
+    df, queries = fetch(hana, full_refresh=True)
+    assert len(df) == 7 * 3
+    assert 'H.ANIO * 100 + H.MES >= 202306' in queries[0]
@@ -0,0 +1,128 @@
+"""
+Unit tests for the pipeline stage DAG.
+"""
+
+import threading
+import pytest
+
+from pipelines.stage_dag import Stage, StageDAG
+
+def recorder(calls, name, result=None):
+    """Stage function that records its call and returns `result` (default: no outputs)"""
+    def run(**inputs):
+        calls.append((name, inputs))
+        return {} if result is None else result
+    return run
+
+def test_stages_run_in_dependency_order():
+    order = []
+
+    def step(name, compute):
+        def run(**inputs):
+            order.append(name)
+            return compute(**inputs)
+        return run
+
+    dag = StageDAG([
+        Stage('sum', step('sum', lambda a, b: {'total': a + b}), inputs=['a', 'b'], outputs=['total']),
+        Stage('b', step('b', lambda x: {'b': x * 10}), inputs=['x'], outputs=['b']),
+        Stage('a', step('a', lambda x: {'a': x + 1}), inputs=['x'], outputs=['a']),
+        Stage('report', step('report', lambda: {}), after=['sum'])
+    ])
+    assert dag.dependencies(dag.stages['sum']) == ['a', 'b']
+
+    result = dag.run({'x': 2}, max_workers=2)
+    assert result.success
+    assert result.values['total'] == 23
+    assert order.index('sum') > max(order.index('a'), order.index('b'))
+    assert order[-1] == 'report'
+    assert set(result.metrics) == {'a', 'b', 'sum', 'report'}
+    assert {'start_seconds', 'wall_seconds', 'cpu_seconds', 'process_cpu_seconds',
+            'peak_rss_mb', 'peak_rss_delta_mb', 'input_rows', 'output_rows'} <= set(result.metrics['sum'])
+
+def test_independent_stages_run_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def meet(name):
+        def run():
+            barrier.wait()
+            return {name: True}
+        return run
+
+    dag = StageDAG([Stage('left', meet('left'), outputs=['left']), Stage('right', meet('right'), outputs=['right'])])
+    assert dag.run(max_workers=2).success
+
+def test_failure_blocks_dependents_only():
+    calls = []
+    dag = StageDAG([
+        Stage('train', lambda: None, outputs=['model']),
+        Stage('predict', recorder(calls, 'predict', {'forecast': 1}), inputs=['model'], outputs=['forecast']),
+        Stage('write', recorder(calls, 'write'), inputs=['forecast']),
+        Stage('crash', lambda: 1 / 0),
+        Stage('report', recorder(calls, 'report'))
+    ])
+    result = dag.run(max_workers=1)
+    assert not result.success
+    assert result.states == {
+        'train': 'failed', 'predict': 'blocked', 'write': 'blocked', 'crash': 'failed', 'report': 'completed'
+    }
+    assert sorted(result.failed) == ['crash', 'predict', 'train', 'write']
+    assert [name for name, _ in calls] == ['report']
+
+def test_missing_outputs_fail_the_stage():
+    dag = StageDAG([Stage('partial', lambda: {'a': 1}, outputs=['a', 'b'])])
+    assert dag.run().states['partial'] == 'failed'
+
+def test_skipped_stages_publish_none():
+    calls = []
+    dag = StageDAG([
+        Stage('memo', lambda: {'reused': True}, outputs=['reused']),
+        Stage('train', recorder(calls, 'train', {'model': 'm'}), outputs=['model'],
+              after=['memo'], when=lambda values: not values['reused']),
+        Stage('evaluate', recorder(calls, 'evaluate', {'mae': 1.0}), outputs=['mae'], optional=True),
+        Stage('save', recorder(calls, 'save'), inputs=['model', 'mae'])
+    ])
+    result = dag.run(skip=['evaluate'])
+    assert result.success
+    assert result.states['train'] == 'skipped' and result.states['evaluate'] == 'skipped'
+    assert result.values['model'] is None and result.values['mae'] is None
+    assert calls == [('save', {'model': None, 'mae': None})]
+
+    with pytest.raises(ValueError):
+        dag.run(skip=['train'])
+    with pytest.raises(ValueError):
+        dag.run(skip=['unknown'])
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError):
+        StageDAG([Stage('a', lambda: {}, outputs=['x']), Stage('b', lambda: {}, outputs=['x'])])
+    with pytest.raises(ValueError):
+        StageDAG([Stage('a', lambda: {}), Stage('a', lambda: {})])
+    with pytest.raises(ValueError):
+        StageDAG([Stage('a', lambda y: {}, inputs=['y'])]).validate()
+    with pytest.raises(ValueError):
+        StageDAG([Stage('a', lambda: {}, after=['ghost'])]).validate()
+    with pytest.raises(ValueError):
+        StageDAG([Stage('a', lambda: {}, outputs=['x'])]).validate(provided=['x'])
+    cycle = StageDAG([
+        Stage('a', lambda y: {'x': 1}, inputs=['y'], outputs=['x']),
+        Stage('b', lambda x: {'y': 1}, inputs=['x'], outputs=['y'])
+    ])
+    with pytest.raises(ValueError, match='cycle'):
+        cycle.run()
+
+def test_restore_and_record_hooks():
+    calls = []
+    recorded = {}
+    dag = StageDAG([
+        Stage('fetch', recorder(calls, 'fetch', {'df': 'fresh'}), outputs=['df']),
+        Stage('features', recorder(calls, 'features', {'features': 'f'}), inputs=['df'], outputs=['features']),
+        Stage('write', recorder(calls, 'write'), inputs=['features'], checkpoint=False)
+    ])
+    restore = lambda name: {'df': 'restored'} if name == 'fetch' else None
+    result = dag.run(restore=restore, record=lambda name, outputs: recorded.update({name: outputs}))
+
+    assert result.states == {'fetch': 'restored', 'features': 'completed', 'write': 'completed'}
+    assert calls[0] == ('features', {'df': 'restored'})
+    # Restored stages are not recorded again, and non-checkpointed stages are never recorded
+    assert recorded == {'features': {'features': 'f'}}
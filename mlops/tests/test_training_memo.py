@@ -0,0 +1,114 @@
+"""
+Unit tests for the training fingerprint and the reuse of memoized predictions.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from xgboost import XGBRegressor
+
+from pipelines.weekly_stock_update import WeeklyStockUpdate
+from pipelines.model_registry import ModelRegistry
+from config import stock_update_config as config
+
+def monthly_sales():
+    return pd.DataFrame({
+        'articulo_id': [100, 100, 101, 101],
+        'location_id': [1, 1, 2, 2],
+        'year': [2024, 2024, 2024, 2024],
+        'month': [1, 2, 1, 2],
+        'unidades_vendidas': [5, 7, 3, 4]
+    })
+
+def inventory():
+    return pd.DataFrame({
+        'INVENTARIO_ID': [1, 2], 'ARTICULO_ID': [100, 101], 'LOCATION_ID': [1, 2],
+        'STOCKACTUAL': [20, 30], 'STOCKMINIMO': [5, 6]
+    })
+
+def updater(**kwargs):
+    pipeline = WeeklyStockUpdate(incremental_features=False, **kwargs)
+    pipeline.feature_lookback_months = 0
+    pipeline.df_inventory = inventory()
+    return pipeline
+
+def fingerprint(**kwargs):
+    return updater(**kwargs).training_fingerprint(monthly_sales())
+
+def test_fingerprint_ignores_row_order_and_dtypes():
+    shuffled = monthly_sales().iloc[::-1].astype({'unidades_vendidas': np.int16, 'month': np.int8})
+    assert updater().training_fingerprint(shuffled) == fingerprint()
+
+def test_fingerprint_changes_with_every_input(monkeypatch):
+    base = fingerprint()
+
+    sales = monthly_sales()
+    sales.loc[3, 'unidades_vendidas'] += 1
+    assert updater().training_fingerprint(sales) != base
+
+    pipeline = updater()
+    pipeline.df_inventory = pd.concat([inventory(), inventory().assign(INVENTARIO_ID=3, LOCATION_ID=3)])
+    assert pipeline.training_fingerprint(monthly_sales()) != base
+
+    pipeline = updater()
+    pipeline.features = pipeline.features + ['lag_24']
+    assert pipeline.training_fingerprint(monthly_sales()) != base
+
+    assert fingerprint(forecast_horizon=3) != base
+    assert fingerprint(training_partition='location') != base
+
+    monkeypatch.setitem(config.MODEL_PARAMS, 'max_depth', config.MODEL_PARAMS.get('max_depth', 6) + 1)
+    assert fingerprint() != base
+    monkeypatch.undo()
+    monkeypatch.setattr(config, 'TRAINING_MONTHS', (config.TRAINING_MONTHS or 0) + 1)
+    assert fingerprint() != base
+
+@pytest.fixture
+def registered(tmp_path):
+    """A registry holding a model trained on the base inputs, with its saved forecast"""
+    X = np.arange(20, dtype=np.float64).reshape(10, 2)
+    model = XGBRegressor(n_estimators=2, max_depth=2).fit(X, X[:, 0])
+    forecast = pd.DataFrame({
+        'location_id': [1, 2], 'articulo_id': [100, 101], 'horizon': [1, 1],
+        'date': pd.to_datetime(['2024-03-01', '2024-03-01']), 'unidades_pred': [6.5, 3.2]
+    })
+    forecast_path = str(tmp_path / 'forecast.csv')
+    forecast.to_csv(forecast_path, index=False)
+    registry = ModelRegistry(root=str(tmp_path / 'registry'))
+    registry.register(
+        model, {'location': np.array([1, 2]), 'product': np.array([100, 101])},
+        fingerprint=fingerprint(), forecast_path=forecast_path,
+        last_trained_period=202401, warm_starts_since_rebuild=0
+    )
+    return registry, forecast
+
+def test_matching_fingerprint_reuses_the_saved_forecast(registered):
+    registry, forecast = registered
+    pipeline = updater()
+    pipeline.registry = registry
+    assert pipeline._stage_memo(monthly_sales()) == {'reused': True}
+    pd.testing.assert_frame_equal(pipeline.df_forecast, forecast)
+    assert pipeline.last_trained_period == 202401
+    assert pipeline.model is not None
+
+def test_changed_inputs_or_force_retrain(registered):
+    registry, _ = registered
+    sales = monthly_sales()
+    sales.loc[0, 'unidades_vendidas'] = 50
+    for pipeline, df in [
+        (updater(), sales),
+        (updater(forecast_horizon=2), monthly_sales()),
+        (updater(force=True), monthly_sales())
+    ]:
+        pipeline.registry = registry
+        assert pipeline._stage_memo(df) == {'reused': False}
+        assert pipeline.df_forecast is None
+
+def test_missing_forecast_file_retrains(registered):
+    registry, _ = registered
+    pipeline = updater()
+    pipeline.registry = registry
+    fingerprint_now = pipeline.training_fingerprint(monthly_sales())
+    os.remove(registry.latest()['forecast_path'])
+    assert pipeline.load_memoized_predictions(fingerprint_now) is None
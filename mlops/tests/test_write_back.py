@@ -0,0 +1,128 @@
+"""
+Unit tests for the stock minimum write-back.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipelines.weekly_stock_update import WeeklyStockUpdate
+from config import stock_update_config as config
+from fake_hana import FakeHana
+
+def inventory():
+    return pd.DataFrame({
+        'INVENTARIO_ID': [1, 2, 3, 4, 5],
+        'ARTICULO_ID': [100, 101, 102, 103, 104],
+        'LOCATION_ID': 1,
+        'STOCKACTUAL': 50,
+        'STOCKMINIMO': [10, 10, 10, 10, 3]
+    })
+
+def stock_update():
+    """New minimums: unchanged, +1, +2, +8, and 0 (raised to MIN_STOCK_VALUE), plus a pair without inventory"""
+    return pd.DataFrame({
+        'INVENTARIO_ID': [1, 2, 3, 4, 5, np.nan],
+        'stock_min_actual': [10, 10, 10, 10, 3, np.nan],
+        'stock_min_nuevo': [10, 11, 12, 18, 0, 7]
+    })
+
+@pytest.fixture
+def write_back(monkeypatch):
+    monkeypatch.setattr(config, 'WRITE_BACK_MODE', 'merge')
+    monkeypatch.setattr(config, 'WRITE_BACK_BATCH_SIZE', 2)
+    monkeypatch.setattr(config, 'MIN_STOCK_VALUE', 1)
+    pipeline = WeeklyStockUpdate(incremental_features=False)
+    pipeline.conn = FakeHana(INVENTORY=inventory())
+    return pipeline
+
+def minimums(pipeline):
+    return pipeline.conn.table('INVENTORY').set_index('INVENTARIO_ID')['STOCKMINIMO'].to_dict()
+
+def test_only_changed_rows_are_written(write_back, monkeypatch):
+    monkeypatch.setattr(config, 'WRITE_BACK_TOLERANCE', 0)
+    # sqlite rejects the HANA staging table, so this also goes through the fallback
+    assert write_back.update_database(stock_update()) == 4
+    assert write_back.write_back_summary == {'changed': 4, 'unchanged': 1, 'suppressed': 0}
+    assert minimums(write_back) == {1: 10, 2: 11, 3: 12, 4: 18, 5: 1}
+
+def test_changes_within_the_tolerance_are_suppressed(write_back, monkeypatch):
+    monkeypatch.setattr(config, 'WRITE_BACK_TOLERANCE', 2)
+    assert write_back.update_database(stock_update()) == 1
+    assert write_back.write_back_summary == {'changed': 1, 'unchanged': 1, 'suppressed': 3}
+    assert minimums(write_back) == {1: 10, 2: 10, 3: 10, 4: 18, 5: 3}
+
+def test_nothing_to_write(write_back):
+    unchanged = stock_update().iloc[:1]
+    assert write_back.update_database(unchanged) == 0
+    assert write_back.conn.connection.statements == []
+
+def test_failed_merge_falls_back_to_executemany(write_back, monkeypatch):
+    monkeypatch.setattr(config, 'WRITE_BACK_TOLERANCE', 0)
+    assert write_back.update_database(stock_update()) == 4
+    statements = write_back.conn.connection.statements
+    assert statements[0].startswith('CREATE LOCAL TEMPORARY COLUMN TABLE')
+    updates = [statement for statement in statements if statement.startswith('UPDATE')]
+    # Four changed rows in batches of two, committed once
+    assert len(updates) == 2
+    assert write_back.conn.connection.commits == 1
+    assert write_back.conn.connection.autocommit is True
+
+def test_executemany_mode_skips_the_staging_table(write_back, monkeypatch):
+    monkeypatch.setattr(config, 'WRITE_BACK_MODE', 'executemany')
+    assert write_back.update_database(stock_update()) == 4
+    assert not any('TEMPORARY' in statement for statement in write_back.conn.connection.statements)
+
+class RecordingCursor:
+    """Cursor that accepts every statement (a HANA server as far as the pipeline can tell)"""
+
+    def __init__(self, log):
+        self.log = log
+
+    def execute(self, statement):
+        self.log.append((statement, None))
+
+    def executemany(self, statement, rows):
+        self.log.append((statement, list(rows)))
+
+    def close(self):
+        pass
+
+class RecordingConnection:
+    def __init__(self):
+        self.connection = self
+        self.log = []
+        self.commits = 0
+        self.autocommit = True
+
+    def cursor(self):
+        return RecordingCursor(self.log)
+
+    def getautocommit(self):
+        return self.autocommit
+
+    def setautocommit(self, value):
+        self.autocommit = value
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        raise AssertionError("unexpected rollback")
+
+def test_merge_stages_the_changed_rows(write_back):
+    write_back.conn = RecordingConnection()
+    assert write_back.update_database(stock_update()) == 4
+    inserted = [row for statement, rows in write_back.conn.log if statement.startswith('INSERT') for row in rows]
+    assert inserted == [(2, 11), (3, 12), (4, 18), (5, 1)]
+    statements = [statement.strip() for statement, _ in write_back.conn.log]
+    assert any(statement.startswith('MERGE INTO') for statement in statements)
+    assert not any(statement.startswith('UPDATE') for statement in statements)
+    assert statements[-1].startswith('DROP TABLE')
+    assert write_back.conn.commits == 1 and write_back.conn.autocommit is True
+
+def test_failed_write_back_rolls_back(write_back, monkeypatch):
+    monkeypatch.setattr(config, 'WRITE_BACK_MODE', 'executemany')
+    write_back.conn.load('INVENTORY', inventory().drop(columns=['STOCKMINIMO']))
+    assert write_back.update_database(stock_update()) is None
+    assert write_back.conn.connection.commits == 0
@@ -0,0 +1,87 @@
+"""
+Sales Preparation Micro-Benchmark
+
+This script compares the original pandas sales preparation (groupby, string date
+parsing, copy and cyclic month features in feature engineering) with the fused
+columnar path (FAST_PREPARE) on synthetic history rows, and checks that both
+produce the same monthly sales.
+
+Usage:
+    python benchmark_prepare_sales.py [--rows N] [--repeat N] [--seed N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+
+# Import configuration and the weekly pipeline
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import stock_update_config as config
+from pipelines.weekly_stock_update import WeeklyStockUpdate
+
+def synthetic_history(rows, seed=0, locations=20, articles=2000, years=(2019, 2025)):
+    """Raw sales history rows shaped like the HISTORY/INVENTORY fetch (several rows per month)"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'ARTICULO_ID': rng.integers(1, articles + 1, rows).astype(np.int32),
+        'LOCATION_ID': rng.integers(1, locations + 1, rows).astype(np.int16),
+        'ANIO': rng.integers(years[0], years[1] + 1, rows).astype(np.int16),
+        'MES': rng.integers(1, 13, rows).astype(np.int8),
+        'EXPORTACION': rng.poisson(4, rows).astype(np.int32)
+    })
+
+def legacy_prepare(updater, df):
+    """Original path: pandas preparation plus the copy and cyclic features of feature engineering"""
+    updater.fast_prepare = False
+    df_model = updater.prepare_sales_data(df).copy()
+    df_model['month_sin'] = np.sin(2 * np.pi * (df_model['month'] - 1) / 12)
+    df_model['month_cos'] = np.cos(2 * np.pi * (df_model['month'] - 1) / 12)
+    return df_model
+
+def fast_prepare(updater, df):
+    """Fused columnar path"""
+    updater.fast_prepare = True
+    return updater.prepare_sales_data(df)
+
+def best_time(function, repeat):
+    """Best wall time of `repeat` calls and the last result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def parse_args(argv=None):
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Benchmark the sales preparation paths")
+    parser.add_argument('--rows', type=int, default=2_000_000, help="Synthetic history rows (default: 2000000)")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per path, the best is reported (default: 3)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0)")
+    return parser.parse_args(argv)
+
+# Main execution
+if __name__ == "__main__":
+    args = parse_args()
+    # Keep the pipeline's INFO logging out of the timings
+    logging.disable(logging.INFO)
+    # Benchmark the whole synthetic history, not only the training window
+    config.TRAINING_MONTHS = None
+
+    df = synthetic_history(args.rows, seed=args.seed)
+    updater = WeeklyStockUpdate(incremental_features=False)
+
+    legacy_seconds, legacy = best_time(lambda: legacy_prepare(updater, df), args.repeat)
+    fast_seconds, fast = best_time(lambda: fast_prepare(updater, df), args.repeat)
+
+    pd.testing.assert_frame_equal(legacy, fast[legacy.columns], check_dtype=False)
+    print(f"History rows:   {len(df):,}")
+    print(f"Monthly rows:   {len(fast):,}")
+    print(f"Legacy path:    {legacy_seconds:.3f}s")
+    print(f"Fused path:     {fast_seconds:.3f}s")
+    print(f"Speedup:        {legacy_seconds / fast_seconds:.1f}x (results identical)")